@@ -1,16 +1,35 @@
 import logging
 import os.path
 import re
-from pathlib import Path
+import time
 
 import numpy as np
 import pandas as pd
 from utility import utility_function
+from utility import column_store
+from utility import hash_index
+from utility import time_index
+from utility import partition
+from utility import columnar
+from utility import manifest
+from utility import spend_graph
+from utility import address_graph
+from utility import checkpoint
+from utility import parallel_search
+from utility import shard
+from utility import taint_cache
+from utility import hub_summary
+from utility import interval_taint
+from utility import parallel_policy
+from utility import taint_record
 
 logging.getLogger().setLevel(logging.INFO)
 pd.options.mode.chained_assignment = None  # default='warn'
 
 read_option = utility_function.read_option
+find_file = utility_function.find_file
+read_many = utility_function.read_many
+read_job = utility_function.read_job
 get_inout = utility_function.get_inout
 remove_txchain = utility_function.remove_txchain
 remove_service = utility_function.remove_service
@@ -41,43 +60,154 @@ tx_range_filename = 'tx_range.csv'
 
 
 class TaintedTX(object):
-    def __init__(self, path=''):
+    def __init__(self, path='', storage='pandas', workers=1, pool_type='thread', schema='default'):
         """
         Starting main class for cryptocurrency tracking.
 
-        :param path: string of folder path for specifying directory of blockchain databases folder e.g., 'fulldatabases/'
+        :param path: string of folder path for specifying directory of blockchain databases folder e.g., 'fulldatabases/', data files are either in year folders (2009/) or month folders (2009/01/, see utility.partition.split_month)
+        :param storage: 'pandas' to read tx_input and tx_output into dataframes or 'mmap' to keep them as memory-mapped column views (input_store and output_store, built with utility.column_store.build_column_store). In 'mmap' storage tx_input and tx_output dataframes are only created when they are used.
+        :param workers: Number of partitions read at the same time, 1 to read them one after another.
+        :param pool_type: 'thread' or 'process' pool for reading partitions when workers is more than 1, process pool is faster for csv files.
+        :param schema: 'default' to keep the dtypes of the csv files or 'compact' to read every data file with the compact dtypes of utility.columnar.compact_schema (narrow integers, nullable spent_index and adr_type column), see memory_report.
         """
 
+        if storage not in ('pandas', 'mmap'):
+            raise Exception('Unknown storage: use "pandas" or "mmap"')
+        if schema not in columnar.schema_dict:
+            raise Exception('Unknown schema: use "default" or "compact"')
+        self.schema = schema
+        self.storage = storage
+        self.workers = workers
+        self.pool_type = pool_type
+        self.input_store = None
+        self.output_store = None
+        self.hash_lookup = {}  # opened hash index of each kind
+        self.time_lookup = None
+        self.manifest = None
         self.path = path
         if len(self.path) > 0:
             if self.path[-1] != '/':
                 self.path += '/'
 
-            year_folder = Path(self.path)
-            subdirectories = [x for x in year_folder.iterdir() if x.is_dir()]
-
-            self.year_list = [int(str(item).split('/')[-1]) for item in subdirectories if
-                              str(item).split('/')[-1].isdigit()]  # get list of year folder
-            self.year_list.sort()
+            self.manifest = manifest.load_manifest(self.path)  # dataset description from utility.manifest.build_manifest
+            if self.manifest is not None:
+                changed = manifest.check_manifest(self.path, self.manifest)
+                if len(changed) > 0:
+                    logging.warning('Manifest does not match ' + ', '.join(changed[:5]) + ', rebuild it with utility.manifest.build_manifest')
+                    self.manifest = None
+            if self.manifest is not None:
+                self.partition_list = [this_partition['folder'] for this_partition in self.manifest['partition']]
+                self.partition_range_list = [[this_partition['first_tx'], this_partition['last_tx']] for this_partition in self.manifest['partition']]
+            else:
+                self.partition_list = partition.find_partition(self.path)  # year ('2009/') or month ('2009/01/') data folders
+                self.partition_range_list = partition.partition_range(self.path, self.partition_list)  # tx index range of each partition
+            self.year_list = sorted(set([partition.partition_year(this_partition) for this_partition in self.partition_list]))  # get list of year
             self.tx_range_list = []  # list of tx index in each year for faster data reading
-            tx_range = read_option(tx_range_filename, self.path)
-            first_tx = tx_range['first_tx'].tolist()
-            last_tx = tx_range['last_tx'].tolist()
-            for item in first_tx:
-                self.tx_range_list.append([int(item)])
-            for index, item in enumerate(last_tx):
-                self.tx_range_list[index].append(int(item))
+            for year in self.year_list:
+                this_range = [this_range for this_partition, this_range in zip(self.partition_list, self.partition_range_list)
+                              if partition.partition_year(this_partition) == year]
+                self.tx_range_list.append([this_range[0][0], this_range[-1][1]])
 
         self.tx_input = pd.DataFrame()
         self.tx_output = pd.DataFrame()
         self.tx_height = pd.DataFrame()
         self.result = pd.DataFrame(index=[0])
         self.case_name = None
+        self.option = None
+        self.shard_engine = None  # shard processes of start_shard
+        self.taint_cache = None  # cache of tx_taint_search, see set_taint_cache
+        self.record_dict = {}  # record of portions of each policy of multi_policy_tx_taint
+        self.taint_record = taint_record.TaintRecord()  # record of portions of the last policy in column arrays with provenance queries
         self.evaluate = pd.DataFrame(
             columns=['case_name', 'frequency', 'total_address', 'reuse_adr', 'fresh_reuse_adr', 'fresh_adr', 'service_adr', 'service_tx',
                      'total_tx', 'pets', 'coinjoin_tx', 'mixer_adr', 'mixer_adr_tx', 'mixer_tx',
                      'known_user', 'adr_per_tx', 'fee_dif', 'lightning_tx'])
 
+    def read_data(self, file_name, folder='', columns=None, tx_range=None):
+        """
+        Read blockchain data file from the database folder, converted columnar files (see utility.columnar) are read instead of csv when found.
+
+        :param file_name: Data file name e.g., output_filename.
+        :param folder: Sub folder of the database folder e.g., '2009/'.
+        :param columns: Optional list of columns to read, the index column is always included.
+        :param tx_range: Optional list [first tx index, last tx index] to read only the rows within.
+
+        :return: Dataframe read from the file.
+        """
+
+        return read_job({'file_name': find_file(file_name, self.path + folder), 'path': self.path + folder, 'columns': columns, 'tx_range': tx_range,
+                         'schema': self.table_schema(file_name)})
+
+    def table_schema(self, file_name):
+        """(table name, schema) of a data file for utility_function.read_job, None when the file keeps its read dtypes"""
+        table_name = os.path.splitext(file_name)[0]
+        if self.schema == 'default' or table_name not in columnar.compact_schema:
+            return None
+        return table_name, self.schema
+
+    def read_partitions(self, file_name, partition_list, columns=None, tx_range=None, isin=None):
+        """
+        Read a data file from several partitions with the worker pool of the object and concatenate them in partition order.
+
+        :param file_name: Data file name e.g., output_filename.
+        :param partition_list: List of partition folders e.g., ['2009/', '2010/'].
+        :param columns: Optional list of columns to read, the index column is always included.
+        :param tx_range: Optional list [first tx index, last tx index] to read only the rows within.
+        :param isin: Optional tuple (column name, list of values) to keep only the matching rows of each partition.
+
+        :return: Dataframe of every partition.
+        """
+
+        job_list = [{'file_name': find_file(file_name, self.path + this_partition), 'path': self.path + this_partition,
+                     'columns': columns, 'tx_range': tx_range, 'isin': isin, 'schema': self.table_schema(file_name)}
+                    for this_partition in partition_list]
+        return read_many(job_list, self.workers, self.pool_type)
+
+    @property
+    def tx_input(self):
+        """tx_input dataframe, created from input_store on first use in 'mmap' storage"""
+        if self._tx_input is None:
+            self._tx_input = self.input_store.to_frame(schema=self.schema)
+        return self._tx_input
+
+    @tx_input.setter
+    def tx_input(self, df):
+        self._tx_input = df
+        self.reverse_graph = None  # built again for the new data
+        self.address_graph = None
+        self.tx_input_lookup = None
+
+    @property
+    def tx_output(self):
+        """tx_output dataframe, created from output_store on first use in 'mmap' storage"""
+        if self._tx_output is None:
+            self._tx_output = self.output_store.to_frame(schema=self.schema)
+        return self._tx_output
+
+    @tx_output.setter
+    def tx_output(self, df):
+        self._tx_output = df
+        self.spend_graph = None  # built again for the new data
+        self.address_graph = None
+        self.tx_output_lookup = None
+
+    def open_store(self, partition_list):
+        """
+        Open the memory-mapped column views of tx_input and tx_output for the partitions, the dataframes are created later only if used.
+
+        :param partition_list: List of partition folders in tx index order e.g., ['2009/', '2010/'].
+        """
+
+        path_list = [self.path + this_partition for this_partition in partition_list]
+        for table_name in (input_filename, output_filename):
+            missing = [path for path in path_list if not column_store.has_column_store(table_name[:-4], path)]
+            if len(missing) > 0:
+                raise Exception('Column store not found in ' + ', '.join(missing) + ', build it with utility.column_store.build_column_store')
+        self.input_store = column_store.ColumnStore.open(input_filename[:-4], path_list)
+        self.output_store = column_store.ColumnStore.open(output_filename[:-4], path_list)
+        self.tx_input = None
+        self.tx_output = None
+
     def prepare_data(self, adr='', tx='', limit_option=None, save_tx_height=True, case_name=None):
         """
         Search for transactions or addresses, and prepare blockchain dataframe. Then fill data into class variables: tx_output, tx_input and tx_height
@@ -107,9 +237,9 @@ class TaintedTX(object):
                 if len(result_df) != len(self.adr):
                     logging.warning('adr found not equal to adr input')
 
-            for this_year in self.year_list:
-                this_output = read_option(output_filename, self.path + str(this_year) + '/')
-                self.result = self.result.append(this_output[this_output['adr_index'].isin(result_df.index)])
+            this_output = self.read_partitions(output_filename, self.partition_list, columns=['tx_index', 'adr_index'],
+                                               isin=('adr_index', result_df.index.tolist()))
+            self.result = self.result.append(this_output)
             self.result = self.result.reset_index().set_index("tx_index")
 
         elif tx != '':
@@ -118,12 +248,7 @@ class TaintedTX(object):
             if type(tx) != list:
                 self.tx = [tx]
             if type(tx[0]) == str and any([re.search('[a-zA-Z]', stuff) is not None for stuff in self.tx]):  # tx hash search
-                for year in self.year_list:
-                    tx_hash = read_option(tx_hash_filename, self.path + str(year) + '/')
-                    result_df = tx_hash[tx_hash['tx_hash'].isin(self.tx)]
-                    self.result = self.result.append(result_df)
-                    if len(self.result) == len(self.tx):
-                        break
+                self.result = self.tx_check('tx_hash', self.tx)
             else:  # tx index search
                 result_df = result_df.reindex(self.tx)
                 self.result = self.result.append(result_df)
@@ -131,7 +256,10 @@ class TaintedTX(object):
         logging.info('Preparing database')
 
         self.limit_search_range(limit_option)
-        self.result = self.tx_output[self.tx_output['tx_index'].isin(self.result.index)]
+        if self._tx_output is None:  # avoid creating the whole tx_output dataframe in 'mmap' storage
+            self.result = self.output_store.select('tx_index', self.result.index).to_frame(schema=self.schema)
+        else:
+            self.result = self.tx_output[self.tx_output['tx_index'].isin(self.result.index)]
         logging.info('Finish preparing')
         if save_tx_height is False:
             self.tx_height = pd.DataFrame()
@@ -139,6 +267,199 @@ class TaintedTX(object):
 
         # except:logging.warning('Invalid Parameter, make sure the parameter is (address hash, year). If there are multiple adr put them in list type ([]), year should be either 'all', 'limit', or number of year (2017), or period of year (2015-2016)')
 
+    def memory_report(self):
+        """
+        Memory used by tx_input, tx_output and tx_height in the default and the compact schema.
+
+        :return: DataFrame from utility.columnar.memory_report.
+        """
+
+        return columnar.memory_report({'tx_input': self.tx_input, 'tx_output': self.tx_output, 'tx_height': self.tx_height})
+
+    def get_hash_index(self, kind):
+        """
+        Open the hash index of the database folder (built with utility.hash_index.build_hash_index) once and keep it for later lookups.
+
+        :param kind: Either 'tx' or 'adr'.
+
+        :return: HashIndex object.
+        """
+
+        if kind not in self.hash_lookup:
+            self.hash_lookup[kind] = hash_index.HashIndex(self.path, kind)
+        return self.hash_lookup[kind]
+
+    def get_time_index(self):
+        """
+        Open the block time index of the database folder, the index is built and saved in the database folder the first time
+        and built again when the block file or a tx_height file changed since (utility.time_index.check_time_index).
+        A database folder that can not be written keeps the built index in memory.
+
+        :return: TimeIndex object.
+        """
+
+        if self.time_lookup is None:
+            if time_index.check_time_index(self.path):
+                self.time_lookup = time_index.load_time_index(self.path)
+            else:
+                logging.info('Building block time index')
+                self.time_lookup = time_index.build_time_index(self.path)
+        return self.time_lookup
+
+    def get_spend_graph(self, backward=False):
+        """
+        Get the spend graph (utility.spend_graph) of the loaded tx_output, or the reverse spend graph of the loaded tx_input for backward search,
+        built once and kept until the data changes.
+        A graph saved in the database folder (save_spend_graph) is used instead of building when it covers the loaded transactions.
+
+        :param backward: Get the reverse graph (transaction to the transactions its inputs spend) instead of the forward graph.
+
+        :return: SpendGraph object.
+        """
+
+        attribute, table_name = ('reverse_graph', 'tx_input') if backward else ('spend_graph', 'tx_output')
+        if getattr(self, attribute) is None:
+            graph_name = spend_graph.reverse_graph_name if backward else spend_graph.spend_graph_name
+            if getattr(self, '_' + table_name) is None:  # 'mmap' storage, build from the column store
+                source = self.input_store if backward else self.output_store
+            else:
+                source = getattr(self, table_name)
+            if isinstance(source, column_store.ColumnStore):
+                rows, window = len(source), source.tx_range()
+            else:
+                tx_index = source['tx_index'] if 'tx_index' in source.columns else source.index.to_series()
+                rows, window = len(source), [int(tx_index.min()), int(tx_index.max())] if len(source) > 0 else None
+            if window is not None and spend_graph.has_spend_graph(self.path, graph_name):
+                graph = spend_graph.load_spend_graph(self.path, graph_name)
+                graph_range = graph.tx_range()
+                if graph_range is not None and graph_range[0] <= window[0] and window[1] <= graph_range[1]:
+                    graph = graph.window(window[0], window[1])
+                    if len(graph.edge_adr) == rows:  # same rows as the loaded data
+                        setattr(self, attribute, graph)
+            if getattr(self, attribute) is None:
+                logging.info('Building ' + ('reverse ' if backward else '') + 'spend graph')
+                setattr(self, attribute, spend_graph.build_spend_graph(source))
+        return getattr(self, attribute)
+
+    def get_address_graph(self):
+        """
+        Get the address-transaction graph (utility.address_graph) of the loaded tx_input and tx_output, built once and kept until they change.
+        A graph saved in the database folder (save_address_graph) is used instead of building when it has the same transactions and rows as the loaded data.
+
+        :return: AddressGraph object.
+        """
+
+        if self.address_graph is None:
+            source_list = []
+            for store, name in ((self.input_store, '_tx_input'), (self.output_store, '_tx_output')):
+                source_list.append(store if getattr(self, name) is None else getattr(self, name[1:]))
+            if address_graph.has_address_graph(self.path):
+                graph = address_graph.load_address_graph(self.path)
+                tx_index = np.concatenate([spend_graph.table_array(source)[0] for source in source_list])
+                if len(tx_index) > 0 and graph.tx_range() == [int(tx_index.min()), int(tx_index.max())] and \
+                        graph.edge_count() == tuple(len(source) for source in source_list):  # same rows as the loaded data
+                    self.address_graph = graph
+            if self.address_graph is None:
+                logging.info('Building address graph')
+                self.address_graph = address_graph.build_address_graph(source_list[0], source_list[1])
+        return self.address_graph
+
+    def save_address_graph(self):
+        """Save the address graph of the loaded tx_input and tx_output into the index folder of the database folder"""
+        self.get_address_graph().save(self.path)
+
+    def save_spend_graph(self, backward=False):
+        """Save the spend graph of the loaded tx_output (reverse graph of tx_input for backward) into the index folder of the database folder, load the whole dataset first to use it for any search"""
+        self.get_spend_graph(backward).save(self.path, spend_graph.reverse_graph_name if backward else spend_graph.spend_graph_name)
+
+    def start_shard(self, shard_count=None, address_list=None, authkey=None):
+        """
+        Start the sharded mode (utility.shard): each shard process owns the partitions of a contiguous tx index range and keeps only their data,
+        tx_taint_search and adr_taint_search then search the whole dataset through the shards instead of the loaded data.
+
+        :param shard_count: Number of local shard processes, default one per year (tx_range_list).
+        :param address_list: Optional list of (host, port) of shard servers started with utility.shard.serve (e.g., on other machines
+        with the dataset at the same path) instead of local processes.
+        :param authkey: Bytes given to utility.shard.serve, needed with address_list.
+
+        :return: List of (partition list, [first tx index, last tx index]) of each shard.
+        """
+
+        self.stop_shard()
+        if address_list is not None:
+            if authkey is None:
+                raise Exception('authkey of the shard servers is needed with address_list')
+            self.shard_engine = shard.ShardEngine.connect(address_list, authkey)
+            shard_count = len(address_list)
+        elif shard_count is None:
+            shard_count = len(self.tx_range_list)
+        group_list = shard.group_partition(self.partition_list, self.partition_range_list, shard_count)
+        if address_list is not None and len(group_list) != shard_count:
+            self.stop_shard()
+            raise Exception('Not enough partitions for ' + str(shard_count) + ' shards')
+        if self.shard_engine is None:
+            self.shard_engine = shard.ShardEngine.start_local(len(group_list))
+        self.shard_engine.load(self.path, group_list, self.storage, self.schema)
+        return group_list
+
+    def stop_shard(self):
+        """Stop the shard processes of start_shard, searches use the loaded data again"""
+        if self.shard_engine is not None:
+            self.shard_engine.close()
+            self.shard_engine = None
+
+    def set_taint_cache(self, path=taint_cache.cache_folder, max_size=taint_cache.default_max_size):
+        """
+        Keep the tx_taint_search runs in a persistent cache (utility.taint_cache) keyed by the dataset version, targets, limit_option,
+        direction and 'taint' taint_limit frames. The same search is then not run again, a deeper one continues from the cached depth
+        and a shallower one is cut from a deeper cached search. Checkpoint continue_mode runs do not use the cache.
+
+        :param path: Folder of the cache, None to stop using the cache.
+        :param max_size: Bytes of saved searches kept, the least recently used are removed first.
+        """
+
+        self.taint_cache = None if path is None else taint_cache.TaintCache(path, max_size)
+
+    def build_hub_summary(self, hub_dict, save=True):
+        """
+        Offline job of utility.hub_summary: summarize the cone of each hub (exchange, service...) on the forward spend graph of the loaded data,
+        load the whole dataset first so the summaries cover any later search window.
+
+        :param hub_dict: Dictionary of hub name to list of adr index (or DataFrame with adr_index as index).
+        :param save: Save the summaries into the index folder of the database folder, searches can then use the hub names.
+
+        :return: Dictionary of hub name to HubSummary.
+        """
+
+        graph = self.get_spend_graph()
+        summary_dict = {}
+        for name, adr_list in hub_dict.items():
+            if isinstance(adr_list, pd.DataFrame):
+                adr_list = adr_list.index
+            summary_dict[name] = hub_summary.build_hub_summary(graph, adr_list, name)
+            if save:
+                summary_dict[name].save(self.path)
+        return summary_dict
+
+    def get_hub_summary(self, hub):
+        """
+        List of HubSummary of the hub option of the searches.
+
+        :param hub: List of hub names saved with build_hub_summary or HubSummary objects.
+
+        :return: List of HubSummary.
+        """
+
+        summary_list = []
+        for this_hub in hub:
+            if isinstance(this_hub, hub_summary.HubSummary):
+                summary_list.append(this_hub)
+            elif hub_summary.has_hub_summary(self.path, this_hub):
+                summary_list.append(hub_summary.load_hub_summary(self.path, this_hub))
+            else:
+                raise Exception('No hub summary ' + str(this_hub) + ' in ' + self.path + ', run build_hub_summary first')
+        return summary_list
+
     def adr_check(self, input_type, adr):
         """
         Retrieving address data from adr_hash file
@@ -149,10 +470,16 @@ class TaintedTX(object):
         :return: DataFrame with address hash and index or adr.
         """
 
+        if hash_index.has_hash_index(self.path, 'adr'):  # prebuilt lookup instead of reading every year
+            if input_type == 'adr_index':
+                return self.get_hash_index('adr').index_to_hash(adr)
+            elif input_type == 'adr_hash':
+                return self.get_hash_index('adr').hash_to_index(adr)
+
         result_df = pd.DataFrame()
         check = pd.DataFrame()
-        for year in self.year_list:
-            address_df = read_option(address_filename, self.path + str(year) + '/')
+        for this_partition in self.partition_list:
+            address_df = self.read_data(address_filename, this_partition)
             if input_type == 'adr_index':
                 check = address_df[address_df.index.isin(adr)]
             elif input_type == 'adr_hash':
@@ -175,10 +502,18 @@ class TaintedTX(object):
         :return: DataFrame with transaction hash and index or adr.
         """
 
+        if hash_index.has_hash_index(self.path, 'tx'):  # prebuilt lookup instead of reading every year
+            if input_type == 'tx_index':
+                return self.get_hash_index('tx').index_to_hash(tx)
+            elif input_type == 'tx_hash':
+                return self.get_hash_index('tx').hash_to_index(tx)
+
         result_df = pd.DataFrame()
         check = pd.DataFrame()
-        for year in self.year_list:
-            df = read_option(tx_hash_filename, self.path + str(year) + '/')
+        for this_partition, this_range in zip(self.partition_list, self.partition_range_list):
+            if input_type == 'tx_index' and not any([this_range[0] <= this_tx <= this_range[1] for this_tx in tx]):
+                continue
+            df = self.read_data(tx_hash_filename, this_partition)
             if input_type == 'tx_index':
                 check = df[df.index.isin(tx)]
             elif input_type == 'tx_hash':
@@ -194,175 +529,129 @@ class TaintedTX(object):
     def limit_search_range(self, option=None):
         """
         Limit the blockchain data frame to transactions within the assigned time range.
+        Date and timedelta options are converted into a tx index range first, then only the partitions (year or month folders) overlapping the range are read
+        (parquet files also skip the row groups outside the range).
 
         :param option: Same as limit_option in prepare_data
+
+        In 'mmap' storage, tx_input and tx_output are opened as column store views of the range instead of being read.
         """
 
         self.option = option
-        block = read_option(block_filename, self.path)
-        # limit tx_input and tx_output according to year parameter
-        if option is not None:
-            if type(option) == str:
-                if ':' not in option and '-' not in option:
-                    if 'to' in option:  # convert input year range to list
-                        time = [int(i) for i in option.split('to')]
-                        time_range1, time_range2 = int(time[0]), int(time[1]) + 1
-                        year_list = list(range(time_range1, time_range2))
-                    else:  # single year search
-                        year_list = [int(option)]
-
-                else:
-                    if 'to' in option:  # convert input year range to list
-                        time = [i for i in option.split('to')]
-                        time = [this_time.split('-')[0] for this_time in time]
-                        time_range1, time_range2 = int(time[0]), int(time[1]) + 1
-                        year_list = list(range(time_range1, time_range2))
-                    else:  # single year search
-                        year_list = [int(option)]
-                for this_time in year_list:
-                    tx_input = read_option(input_filename, self.path + str(this_time) + '/')
-                    self.tx_input = self.tx_input.append(tx_input)
-                    tx_output = read_option(output_filename, self.path + str(this_time) + '/')
-                    self.tx_output = self.tx_output.append(tx_output)
-                    tx_height = read_option(tx_height_filename, self.path + str(this_time) + '/')
-                    self.tx_height = self.tx_height.append(tx_height)
-                if ':' in option or '-' in option:  # date time search
-                    if 'to' in option:  # convert input year range to list
-                        time_search = option.split('to')
-                        time_search = block[(block['time'] >= time_search[0]) & (block['time'] <= time_search[1])]
-                    else:
-                        if ':' not in option:  # no hour
-                            time_search = block[(block['time'] >= option) &
-                                                (block['time'] <= pd.Timestamp(option) + pd.DateOffset(1))]
-                        else:
-                            time_search = block[(block['time'] >= option) &
-                                                (block['time'] <= pd.Timestamp(option) + pd.Timedelta(minutes=1))]
-                    self.tx_height = self.tx_height[self.tx_height['block_index'].isin(time_search.index)]
-                    self.tx_input = self.tx_input[self.tx_input['tx_index'].isin(self.tx_height.index)]
-                    self.tx_output = self.tx_output[self.tx_output['tx_index'].isin(self.tx_height.index)]
-
-            elif type(option) != str:
-                option1 = option
-                option2 = None
-                if type(option) == list:
-                    option1 = option[0]
-                    option2 = option[1]
-                start_tx = self.result.index[0]
-                for index, tx_range in enumerate(self.tx_range_list):
-                    if tx_range[0] <= start_tx <= tx_range[1]:
-                        tx_height = read_option(tx_height_filename, self.path + str(self.year_list[index]) + '/')
-                        start_block = tx_height[tx_height.index == start_tx]['block_index'].values
-                        start_time = block[block.index == start_block[0]]['time'].values
-                        break
+        partition_list, tx_range = self.search_range(option)
+        if self.storage == 'mmap':
+            self.open_store(partition_list)
+            if tx_range is not None:
+                self.input_store = self.input_store.window(tx_range[0], tx_range[1])
+                self.output_store = self.output_store.window(tx_range[0], tx_range[1])
+
+        if self.storage != 'mmap':
+            self.tx_input = self.tx_input.append(self.read_partitions(input_filename, partition_list, tx_range=tx_range))
+            self.tx_output = self.tx_output.append(self.read_partitions(output_filename, partition_list, tx_range=tx_range))
+        self.tx_height = self.tx_height.append(self.read_partitions(tx_height_filename, partition_list, tx_range=tx_range))
+
+        if self.storage == 'mmap':
+            tx_range = self.output_store.tx_range()
+            if tx_range is not None:
+                self.tx_height = self.tx_height[(self.tx_height.index >= tx_range[0]) & (self.tx_height.index <= tx_range[1])]
+        elif len(self.tx_output) > 0:
+            self.tx_height = self.tx_height[self.tx_height.index.isin(self.tx_output['tx_index'])]
+
+    def search_range(self, option=None):
+        """
+        Convert limit_option into the partitions and the tx index range to read.
+        A timedelta window starts at the first transaction of the result, or for a [after, before] list at the last transaction of the first block
+        on the date of (first transaction time - before), and ends with the last block on the date of (first transaction time + after).
 
-                before_tx = None
-                end_time = start_time + option1
-                if option2 is not None:
-                    before_time = start_time - option2
-                for yearindex, year in enumerate(self.year_list):
-                    if (option2 is None or pd.to_datetime(before_time).year[0] <= year) and year <= pd.to_datetime(end_time).year[0]:
-                        tx_height = read_option(tx_height_filename, self.path + str(year) + '/')
-                        if option2 is not None and before_tx is None:
-                            before_tx = tx_height[
-                                tx_height['block_index'] == block[block['time'].dt.date == np.datetime64(before_time[0], 'D')].index[0]]
-                            if len(before_tx) > 0:
-                                before_tx = before_tx.index[-1]
-
-                        if end_time[0] > block['time'].values[-1]:  # end time exceed current data
-                            end_tx = self.tx_range_list[-1][-1]
-                        else:
-                            end_tx = tx_height[tx_height['block_index'] == block[block['time'].dt.date == np.datetime64(end_time[0], 'D')].index[-1]]
-                            if len(end_tx) > 0:
-                                end_tx = end_tx.index[-1]
-                        self.tx_height = self.tx_height.append(tx_height)
-
-                endloop = False
-                found_start = False
-                use_tx = start_tx
-                if option2 is not None:
-                    use_tx = before_tx
-                for this_index, this_range in enumerate(self.tx_range_list):
-                    this_year = self.year_list[this_index]
-                    if (this_range[0] <= start_tx <= this_range[1]) or (this_range[0] <= use_tx <= this_range[1]) or (
-                            this_range[0] <= end_tx <= this_range[1]):
-                        this_output = read_option(output_filename, self.path + str(this_year) + '/')
-                        if len(this_output[this_output['tx_index'].isin([use_tx])]) > 0:
-                            found_start = True
-                            this_output = this_output[(this_output['tx_index'] >= use_tx) & (this_output['tx_index'] <= end_tx)]
-                            this_input = read_option(input_filename, self.path + str(this_year) + '/')
-                            this_input = this_input[(this_input['tx_index'] >= use_tx) & (this_input['tx_index'] <= end_tx)]
-                            if len(this_output[this_output['tx_index'].isin([end_tx])]) > 0:
-                                endloop = True
-                            self.tx_input = self.tx_input.append(this_input)
-                            self.tx_output = self.tx_output.append(this_output)
-                            if endloop:
-                                break
-                        else:
-                            if found_start:
-                                if len(this_output[this_output['tx_index'] >= end_tx]) > 0:
-                                    this_output = this_output[this_output['tx_index'] <= end_tx]
-                                    this_input = this_input[this_input['tx_index'] <= end_tx]
-                                    endloop = True
-                                self.tx_input = self.tx_input.append(this_input)
-                                self.tx_output = self.tx_output.append(this_output)
-                                if endloop:
-                                    break
-
-        elif option is None:  # read all data
-            for year in self.year_list:
-                tx_input = read_option(input_filename, self.path + str(year) + '/')
-                self.tx_input = self.tx_input.append(tx_input)
-                tx_output = read_option(output_filename, self.path + str(year) + '/')
-                self.tx_output = self.tx_output.append(tx_output)
-                tx_height = read_option(tx_height_filename, self.path + str(year) + '/')
-                self.tx_height = self.tx_height.append(tx_height)
+        :param option: Same as limit_option in prepare_data
+
+        :return: Tuple of partition list and list [first tx index, last tx index] (None to read the whole partitions).
+        """
+
+        if option is None:  # read all data
+            return self.partition_list, None
+
+        if type(option) == str:
+            if ':' not in option and '-' not in option:  # year search
+                year_range = [int(i) for i in option.split('to')]
+                return [this_partition for this_partition in self.partition_list
+                        if year_range[0] <= partition.partition_year(this_partition) <= year_range[-1]], None
+            tx_range = self.time_range_tx(option)  # date time search
+
+        else:
+            option1 = option
+            option2 = None
+            if type(option) == list:
+                option1 = option[0]
+                option2 = option[1]
+            start_tx = self.result.index[0]
+            this_time_index = self.get_time_index()
+            start_time = this_time_index.tx_time([start_tx])[0]
+            end_time = start_time + option1
+            use_tx = start_tx
+            if option2 is not None:
+                before_time = start_time - option2
+                first_tx = this_time_index.time_range_tx(before_time, start_time, whole_day=True)[0]  # first block of the day
+                use_tx = int(this_time_index.block_last_tx([first_tx])[0])  # from the last transaction of that block
+            if end_time > this_time_index.last_time():  # end time exceed current data
+                end_tx = self.partition_range_list[-1][-1]
+            else:
+                end_tx = this_time_index.time_range_tx(start_time, end_time, whole_day=True)[1]  # until the end of the day
+            tx_range = [use_tx, end_tx]
+
+        partition_list = [this_partition for this_partition, this_range in zip(self.partition_list, self.partition_range_list)
+                          if this_range[0] <= tx_range[1] and tx_range[0] <= this_range[1]]
+        return partition_list, tx_range
+
+    def time_range_tx(self, option):
+        """
+        Convert a date time limit_option string into the transaction range of its blocks.
+
+        :param option: Date time string of limit_option e.g., '2014-01-01to2014-01-31', '2014-01-01' (one day) or '2014-01-01 10:00' (one minute).
 
-        self.tx_height = self.tx_height[self.tx_height.index.isin(self.tx_output['tx_index'])]
+        :return: List [first tx index, last tx index], [0, -1] if no block is found.
+        """
+
+        if 'to' in option:
+            time_search = option.split('to')
+        elif ':' not in option:  # no hour
+            time_search = [option, pd.Timestamp(option) + pd.DateOffset(1)]
+        else:
+            time_search = [option, pd.Timestamp(option) + pd.Timedelta(minutes=1)]
+        tx_range = self.get_time_index().time_range_tx(time_search[0], time_search[1])
+        if tx_range is None:
+            tx_range = [0, -1]
+        return tx_range
 
     def tx_taint_search(self, target_tx=None, depth_limit=-1, continue_mode=False,
-                        taint_limit=None, case_name=None):
+                        taint_limit=None, case_name=None, backward=False, checkpoint_interval=checkpoint.default_interval, workers=1,
+                        hub=None, hub_mode='stop'):
         """
         Search for connected transaction to the original and taint any directly connected transaction.
+        The search runs on the spend graph of the loaded data (get_spend_graph), tainted outputs are only put into a dataframe at the end.
+        Backward search follows the inputs of the targets to the transactions they spend from (provenance of the funds) and returns tainted inputs.
 
         :param target_tx: list of transaction index to starting tainting from.
         :param depth_limit: Limit how many transaction depth to search.
-        :param continue_mode: Continue from previous run. Will load from file with the same case_name.
+        :param continue_mode: Continue from previous run. Will load the checkpoint with the same case_name, target_tx is then taken from the checkpoint.
         :param taint_limit: list of three items [string to indicate for exclude during ('taint') of after tainting ('after'), dataframe of addresses for checking, dataframe of transactions]
         :param case_name: Name of the case used for saving into file.
-
-        :return: DataFrame with tainted transaction outputs.
+        :param backward: Search the earlier transactions the targets spend from instead of the later ones, using the reverse spend graph of tx_input.
+        :param checkpoint_interval: Seconds between binary checkpoint saves (utility.checkpoint) when case_name is given, None for no checkpoint.
+        :param workers: Number of processes searching each depth (utility.parallel_search), 1 to search in this process. The result is the same.
+        :param hub: Optional list of hub names (build_hub_summary) or HubSummary objects, the search does not walk through their addresses.
+        :param hub_mode: 'stop' to taint the outputs paid to a hub without following them, 'merge' (forward only) to add the precomputed
+        cone of the hub from the entry tx on without walking it (utility.hub_summary.search). Hub searches run in this process without the cache.
+        After start_shard the search covers the whole dataset on the shard processes instead of the loaded data, without checkpoint.
+        After set_taint_cache the search is taken from (or continued from) the cache when the same search was run before.
+
+        :return: DataFrame with tainted transaction outputs (inputs with input_value for backward search).
         """
 
-        tx_output = self.tx_output
-        if 'tx_index' in tx_output.columns:
-            tx_output = tx_output.reset_index().set_index('tx_index')
-        else:
-            tx_output.index.names = ['tx_index']
-
         self.case_name = case_name
         self.target_tx = target_tx
-
-        depth = 0  # depth of search
-        if continue_mode:
-            searching_tx = pd.read_csv('taintresults/' + self.case_name + 'searching_tx' + str(self.option).replace(' ', '') + '.csv',
-                                       index_col='tx_index')
-            tx_tainted = pd.read_csv('taintresults/' + self.case_name + 'tx_tainted' + str(self.option).replace(' ', '') + '.csv',
-                                     index_col='tx_index')
-            depth = list(sorted(set(tx_tainted['depth'].tolist())))[-1] + 1
-        else:
-            searching_tx = pd.DataFrame()  # list of output to search
-            tx_tainted = pd.DataFrame()  # list of tainted outputs
-
-            if target_tx is not None:
-                tx_tainted = tx_output[tx_output.index.isin(target_tx)]
-
-                tx_tainted.is_copy = False
-                searching_tx = tx_tainted
-
-                tx_tainted['depth'] = depth
-                tx_tainted['taint_value'] = tx_tainted['output_value']
-                tx_tainted['clean_value'] = tx_tainted['output_value'] - tx_tainted['taint_value']
-                depth += 1
+        table_name, value_name = ('tx_input', 'input_value') if backward else ('tx_output', 'output_value')
+        tainted_name = 'tx_tainted_backward' if backward else 'tx_tainted'
 
         if os.path.isdir('taintresults') is False:
             os.makedirs('taintresults')
@@ -371,52 +660,353 @@ class TaintedTX(object):
             raise Exception(
                 'Unknown service limit input: use "after" for remove service transaction after finish tainting or "taint" for remove service transaction during tainting')
 
-        logging.info('Start Search')
-        if continue_mode is False:
-            searching_tx = tx_output[tx_output.index.isin(searching_tx['spent_index'])]
-            searching_tx['depth'] = depth
-        while depth != depth_limit and len(searching_tx) > 0:
+        if hub is not None:
+            if hub_mode not in ['stop', 'merge']:
+                raise Exception('Unknown hub mode: use "stop" or "merge"')
+            if hub_mode == 'merge' and backward:
+                raise Exception('Hub summaries are forward, use hub_mode "stop" for backward search')
+            if self.shard_engine is not None or workers > 1:
+                raise Exception('hub is not available for a sharded or multi-process search')
+            hub = self.get_hub_summary(hub)
+
+        if self.shard_engine is not None:  # search the whole dataset on the shard processes (start_shard)
+            if continue_mode:
+                raise Exception('continue_mode is not available for a sharded search')
+            limit_adr, limit_tx = None, None
             if taint_limit is not None and taint_limit[0] == 'taint':
-                if taint_limit[1] is not None:
-                    searching_tx = searching_tx[
-                        ~searching_tx['adr_index'].isin(taint_limit[1].index)]
-                if taint_limit[2] is not None:
-                    searching_tx = searching_tx[
-                        ~searching_tx['tx_index'].isin(taint_limit[2].index)]
-
-            tx_tainted = tx_tainted.append(searching_tx[~searching_tx.index.isin(tx_tainted.index)])
-            tx_output = tx_output[~tx_output.index.isin(searching_tx.index)]
-            searching_tx = tx_output[tx_output.index.isin(searching_tx['spent_index'])]
-            searching_tx['depth'] = depth
-            if len(searching_tx) > 0:  # remove tx before  the first tx found in searching_tx
-                tx_output = tx_output[tx_output.index > searching_tx.index[0]]
-            depth += 1
-
-            if depth % 5000 == 0 and self.case_name is not None:  # temporary save
-                tx_tainted.to_csv('taintresults/' + self.case_name + 'tx_tainted' + str(self.option).replace(' ', '') + '.csv')
-                searching_tx.to_csv('taintresults/' + self.case_name + 'searching_tx' + str(self.option).replace(' ', '') + '.csv')
-
-        # Final touch
-        tx_tainted = tx_tainted.reset_index().drop_duplicates(subset=['tx_index', 'adr_index', 'output_value', 'spent_index']).set_index(
-            'tx_index')  # remove duplicate
+                limit_adr = None if taint_limit[1] is None else taint_limit[1].index
+                limit_tx = None if taint_limit[2] is None else taint_limit[2].index
+            rows = self.shard_engine.tx_search(target_tx, depth_limit, limit_adr, limit_tx, backward)
+            tx_tainted = rows[rows['depth'] == 0]
+            tx_tainted['taint_value'] = tx_tainted[value_name]
+            tx_tainted['clean_value'] = tx_tainted[value_name] - tx_tainted['taint_value']
+            if (rows['depth'] > 0).any():
+                tx_tainted = tx_tainted.append(rows[rows['depth'] > 0])
+            tx_tainted = self.tainted_result(tx_tainted, taint_limit)
+            if self.case_name is not None:
+                tx_tainted.to_pickle('taintresults/' + self.case_name + tainted_name + str(self.option).replace(' ', '') + '.pkl')
+            return tx_tainted
+
+        graph = self.get_spend_graph(backward)
+        blocked = None  # outputs (inputs for backward) not tainted during tainting
+        if taint_limit is not None and taint_limit[0] == 'taint':
+            blocked = graph.blocked_edge(None if taint_limit[1] is None else taint_limit[1].index,
+                                         None if taint_limit[2] is None else taint_limit[2].index)
+
+        this_checkpoint = checkpoint.Checkpoint('taintresults/' + str(self.case_name) + tainted_name + str(self.option).replace(' ', '') +
+                                                checkpoint.checkpoint_suffix + '/', checkpoint_interval)
+        state = None
+        if continue_mode:
+            if not this_checkpoint.exists():
+                raise Exception('No checkpoint found in ' + this_checkpoint.path)
+            saved, chunk = this_checkpoint.load()
+            if int(saved['node_count']) != len(graph):
+                raise Exception('Checkpoint was saved with different data, prepare the data with the same limit_option')
+            depth_of = np.full(len(graph), -1, dtype='int64')
+            depth_of[chunk['node']] = chunk['depth']
+            this_checkpoint.new_item('node', depth_of >= 0)
+            target_tx = np.asarray(graph.node_tx)[saved['target']].tolist()
+            self.target_tx = target_tx
+            state = {'depth_of': depth_of, 'searched': saved['searched'], 'frontier': saved['frontier'],
+                     'label': int(saved['label']), 'depth': int(saved['depth'])}
+
+        cache_key, cache_kind = None, None
+        if self.taint_cache is not None and not continue_mode and target_tx is not None and hub is None:
+            cache_key = self.taint_cache.key(taint_cache.dataset_version(self.manifest, graph), graph, target_tx, self.option, backward, taint_limit)
+            state, cache_kind = self.taint_cache.get(cache_key, depth_limit, len(graph))
+
+        tx_tainted = pd.DataFrame()  # list of tainted outputs
+        if target_tx is not None:
+            tx_tainted = self.tx_rows(target_tx, table_name)
+            tx_tainted['depth'] = 0
+            tx_tainted['taint_value'] = tx_tainted[value_name]
+            tx_tainted['clean_value'] = tx_tainted[value_name] - tx_tainted['taint_value']
+        known_tx = tx_tainted.index.unique()  # transactions already in tx_tainted
+        target_node = graph.node([] if target_tx is None else target_tx)
+
+        def save_checkpoint(this_state):
+            if self.case_name is not None and this_checkpoint.due():
+                new = this_checkpoint.new_item('node', this_state['depth_of'] >= 0)
+                this_checkpoint.save({'node_count': len(graph), 'target': target_node[target_node >= 0], 'searched': this_state['searched'],
+                                      'frontier': this_state['frontier'], 'label': this_state['label'], 'depth': this_state['depth']},
+                                     {'node': new, 'depth': this_state['depth_of'][new]}, force=True)
+
+        logging.info('Start Search')
+        if state is not None or target_tx is not None:
+            if hub is not None:
+                state = hub_summary.search(graph, [] if target_tx is None else target_tx, hub, hub_mode, depth_limit, blocked, state, save_checkpoint)
+            elif workers > 1:
+                state = parallel_search.search(graph, [] if target_tx is None else target_tx, depth_limit, blocked, state, save_checkpoint, workers)
+            else:
+                state = graph.search([] if target_tx is None else target_tx, depth_limit, blocked, state, save_checkpoint)
+            if cache_key is not None and cache_kind in (None, 'resume'):
+                self.taint_cache.put(cache_key, depth_limit, state)
+            new_tainted = self.tainted_rows(graph, state['depth_of'], known_tx, taint_limit, table_name)
+            if len(new_tainted) > 0:
+                tx_tainted = tx_tainted.append(new_tainted)
+
         logging.info('End, now adding extra information')
+        tx_tainted = self.tainted_result(tx_tainted, taint_limit)
+
+        if self.case_name is not None:
+            tx_tainted.to_pickle('taintresults/' + self.case_name + tainted_name + str(self.option).replace(' ', '') + '.pkl')
+
+            this_checkpoint.remove()  # remove saved for continue checkpoint
+        return tx_tainted
+
+    def tx_taint_search_iter(self, target_tx, depth_limit=-1, taint_limit=None, backward=False, time_budget=None, output_budget=None, workers=1):
+        """
+        Generator version of tx_taint_search: yields the outputs (inputs for backward search) newly tainted at each depth as soon as the depth is searched,
+        only the rows of one depth are put into a dataframe at a time. Stop iterating to stop the search (e.g., once the taint reaches a known service).
+        The yielded batches together are the result of tx_taint_search with the same arguments, ordered by depth instead of tx_index.
+
+        :param target_tx: list of transaction index to starting tainting from, the first batch is the targets with depth 0.
+        :param depth_limit: Limit how many transaction depth to search.
+        :param taint_limit: list of three items [string to indicate for exclude during tainting ('taint') or stop the search at the depth reaching them ('stop'), dataframe of addresses for checking, dataframe of transactions]
+        :param backward: Search the earlier transactions the targets spend from instead of the later ones.
+        :param time_budget: Optional seconds after which the search stops, checked after each depth.
+        :param output_budget: Optional number of rows after which the search stops, the depth reaching it is yielded whole.
+        :param workers: Number of processes searching each depth (utility.parallel_search), 1 to search in this process.
+
+        :return: Yields DataFrame of the tainted rows of each depth with output_index as index, in the format of tx_taint_search.
+        """
+
+        if target_tx is None:
+            raise Exception('target_tx is needed for a streamed search')
+        if taint_limit is not None and taint_limit[0] not in ['taint', 'stop']:
+            raise Exception(
+                'Unknown service limit input: use "taint" for remove service transaction during tainting or "stop" for stop the search at the depth reaching them')
+        graph = self.get_spend_graph(backward)
+        table_name, value_name = ('tx_input', 'input_value') if backward else ('tx_output', 'output_value')
+        limit_adr = None if taint_limit is None or taint_limit[1] is None else taint_limit[1].index
+        limit_tx = None if taint_limit is None or taint_limit[2] is None else taint_limit[2].index
+        blocked = None
+        if taint_limit is not None and taint_limit[0] == 'taint':
+            blocked = graph.blocked_edge(limit_adr, limit_tx)
+
+        start_time = time.time()
+        output_count = 0
+        state = graph.start(target_tx)
+        rows = self.tx_rows(target_tx, table_name)
+        rows['depth'] = 0
+        rows['taint_value'] = rows[value_name]
+        rows['clean_value'] = rows[value_name] - rows['taint_value']
+        if workers > 1:
+            level_iter = parallel_search.search_level(graph, state, depth_limit, blocked, workers)
+        else:
+            level_iter = graph.search_level(state, depth_limit, blocked)
+        try:  # the level generator is closed when the caller stops, releasing the worker processes of a parallel search
+            while True:
+                if len(rows) > 0:
+                    batch = self.tainted_result(rows)
+                    output_count += len(batch)
+                    yield batch
+                    if taint_limit is not None and taint_limit[0] == 'stop' and (
+                            (limit_adr is not None and batch['adr_index'].isin(limit_adr).any()) or
+                            (limit_tx is not None and batch['tx_index'].isin(limit_tx).any())):
+                        logging.info('Stop at depth ' + str(int(batch['depth'].iloc[0])) + ', taint reached taint_limit')
+                        return
+                if output_budget is not None and output_count >= output_budget:
+                    logging.info('Stop, output budget used')
+                    return
+                if time_budget is not None and time.time() - start_time >= time_budget:
+                    logging.info('Stop, time budget used')
+                    return
+                new, depth = next(level_iter, (None, None))
+                if new is None:
+                    return
+                rows = self.tx_rows(np.asarray(graph.node_tx)[new], table_name)
+                if taint_limit is not None and taint_limit[0] == 'taint':
+                    if limit_adr is not None:
+                        rows = rows[~rows['adr_index'].isin(limit_adr)]
+                    if limit_tx is not None:
+                        rows = rows[~rows.index.isin(limit_tx)]
+                rows['depth'] = depth
+        finally:
+            level_iter.close()
+
+    def tainted_result(self, tx_tainted, taint_limit=None):
+        """
+        Final touch of a tx taint search: remove duplicate outputs, apply the 'after' taint_limit and index by output_index.
+
+        :param tx_tainted: DataFrame of tainted outputs (or inputs of backward search) with tx_index as index.
+        :param taint_limit: taint_limit of tx_taint_search.
+
+        :return: DataFrame with tainted transaction outputs.
+        """
+
+        value_name = 'input_value' if 'input_value' in tx_tainted.columns else 'output_value'  # tainted inputs of backward search
+        tx_tainted = tx_tainted.reset_index().drop_duplicates(subset=['tx_index', 'adr_index', value_name, 'spent_index']).set_index(
+            'tx_index')  # remove duplicate
         if taint_limit is not None and taint_limit[0] == 'after':  # remove transaction reaching identified addresses and transactions
             if taint_limit[1] is not None:
                 tx_tainted = remove_service(tx_tainted, taint_limit[1])
             if taint_limit[2] is not None:
                 tx_tainted = remove_txchain(tx_tainted, taint_limit[2])
 
-        tx_tainted = tx_tainted.sort_index().reset_index().set_index('output_index')
+        return tx_tainted.sort_index().reset_index().set_index('output_index')
 
-        if self.case_name is not None:
-            tx_tainted.to_pickle('taintresults/' + self.case_name + 'tx_tainted' + str(self.option).replace(' ', '') + '.pkl')
+    def tx_taint_search_batch(self, target_list, depth_limit=-1, taint_limit=None, combined=False):
+        """
+        Run tx_taint_search for many separate cases (e.g., one theft or ransom payment each) in a single traversal of the spend graph.
+        Every case is one bit of uint64 label words propagated together (utility.spend_graph.SpendGraph.batch_search),
+        transactions shared by the cases are searched once per level instead of once per case.
 
-            try:  # remove saved for continue csv file
-                os.remove('taintresults/' + self.case_name + 'tx_tainted' + str(self.option).replace(' ', '') + '.csv')
-                os.remove('taintresults/' + self.case_name + 'searching_tx' + str(self.option).replace(' ', '') + '.csv')
-            except:
-                pass
-        return tx_tainted
+        :param target_list: List of target_tx lists, or dictionary of case name to target_tx list.
+        :param depth_limit: Limit how many transaction depth to search.
+        :param taint_limit: taint_limit of tx_taint_search, 'after' is only available for separate results.
+        :param combined: Return one DataFrame of every tainted output with the minimum depth over the cases and a uint64 source_bitmap column
+        (bit i is case i in target_list order, more than 64 cases add source_bitmap_1, source_bitmap_2... columns for cases 64-127, 128-191...).
+
+        :return: List (or dictionary for dictionary target_list) of DataFrames equal to tx_taint_search of each case, or the combined DataFrame.
+        """
+
+        case_list = list(target_list.keys()) if isinstance(target_list, dict) else None
+        target_list = list(target_list.values()) if case_list is not None else list(target_list)
+        if len(target_list) == 0:
+            raise Exception('No case to search')
+        if taint_limit is not None and taint_limit[0] not in ['after', 'taint']:
+            raise Exception(
+                'Unknown service limit input: use "after" for remove service transaction after finish tainting or "taint" for remove service transaction during tainting')
+        if combined and taint_limit is not None and taint_limit[0] == 'after':
+            raise Exception('taint_limit "after" removes transaction chains of each case, it can not be used with combined=True')
+        graph = self.get_spend_graph()
+        blocked = None
+        if taint_limit is not None and taint_limit[0] == 'taint':
+            blocked = graph.blocked_edge(None if taint_limit[1] is None else taint_limit[1].index,
+                                         None if taint_limit[2] is None else taint_limit[2].index)
+
+        logging.info('Start batch search of ' + str(len(target_list)) + ' cases')
+        node, source, depth = graph.batch_search(target_list, depth_limit, blocked)
+        tainted_node = np.unique(node)
+        rows = self.tx_rows(np.asarray(graph.node_tx)[tainted_node])
+        row_blocked = np.zeros(len(rows), dtype=bool)  # outputs excluded after the targets
+        if taint_limit is not None and taint_limit[0] == 'taint':
+            if taint_limit[1] is not None:
+                row_blocked |= rows['adr_index'].isin(taint_limit[1].index).values
+            if taint_limit[2] is not None:
+                row_blocked |= rows.index.isin(taint_limit[2].index)
+        row_local = np.searchsorted(tainted_node, graph.node(rows.index.values))
+        row_ptr, row_position = spend_graph.csr_array(row_local, np.arange(len(rows)), len(tainted_node))
+        local = np.searchsorted(tainted_node, node)
+
+        if combined:
+            word_count = (len(target_list) + spend_graph.bit_word - 1) // spend_graph.bit_word
+            node_bit = np.zeros((len(tainted_node), word_count), dtype='uint64')
+            target_bit = np.zeros((len(tainted_node), word_count), dtype='uint64')
+            source_bit = np.left_shift(np.uint64(1), (source % spend_graph.bit_word).astype('uint64'))
+            np.bitwise_or.at(node_bit, (local, source // spend_graph.bit_word), source_bit)
+            np.bitwise_or.at(target_bit, (local[depth == 0], source[depth == 0] // spend_graph.bit_word), source_bit[depth == 0])
+            min_depth = np.full(len(tainted_node), np.iinfo('int64').max, dtype='int64')
+            np.minimum.at(min_depth, local, depth)
+            row_bit = np.where(row_blocked[:, None], target_bit[row_local], node_bit[row_local])
+            tx_tainted = rows
+            tx_tainted['depth'] = np.where(row_blocked, 0, min_depth[row_local])
+            for word in range(word_count):
+                tx_tainted['source_bitmap' if word == 0 else 'source_bitmap_' + str(word)] = row_bit[:, word]
+            logging.info('End, now adding extra information')
+            return self.tainted_result(tx_tainted[row_bit.any(axis=1)])
+
+        result_list = []
+        order = np.argsort(source, kind='stable')
+        first = np.searchsorted(source[order], np.arange(len(target_list) + 1))
+        for case in range(len(target_list)):
+            item = order[first[case]:first[case + 1]]
+            item = item[np.lexsort((local[item], depth[item]))]
+            edge = spend_graph.csr_edge(row_ptr, local[item])
+            position = row_position[edge]
+            case_depth = np.repeat(depth[item], np.diff(row_ptr)[local[item]])
+            tx_tainted = rows.iloc[position]
+            tx_tainted['depth'] = case_depth
+            new_tainted = tx_tainted[(case_depth > 0) & ~row_blocked[position]]
+            tx_tainted = tx_tainted[case_depth == 0]
+            tx_tainted['taint_value'] = tx_tainted['output_value']
+            tx_tainted['clean_value'] = tx_tainted['output_value'] - tx_tainted['taint_value']
+            if len(new_tainted) > 0:
+                tx_tainted = tx_tainted.append(new_tainted)
+            result_list.append(self.tainted_result(tx_tainted, taint_limit))
+        logging.info('End batch search')
+        if case_list is not None:
+            return dict(zip(case_list, result_list))
+        return result_list
+
+    def row_position(self, tx_list, table_name='tx_output'):
+        """
+        Row positions of the outputs or inputs of transactions in the loaded data, found by binary search in the tx_index of the rows
+        (sorted once and kept until the data changes) so the cost follows the number of transactions asked instead of the number of rows.
+
+        :param tx_list: List of tx index.
+        :param table_name: Either 'tx_output' or 'tx_input'.
+
+        :return: Sorted array of row positions.
+        """
+
+        if getattr(self, table_name + '_lookup') is None:
+            if getattr(self, '_' + table_name) is None:
+                store = self.output_store if table_name == 'tx_output' else self.input_store
+                tx_index = np.asarray(store.column('tx_index'))
+            else:
+                rows = getattr(self, table_name)
+                tx_index = (rows['tx_index'].values if 'tx_index' in rows.columns else rows.index.values).astype('int64')
+            order = None
+            if len(tx_index) > 1 and (np.diff(tx_index) < 0).any():
+                order = np.argsort(tx_index, kind='stable')
+                tx_index = tx_index[order]
+            setattr(self, table_name + '_lookup', (tx_index, order))
+        tx_index, order = getattr(self, table_name + '_lookup')
+        tx_list = np.unique(np.asarray(tx_list, dtype='int64'))
+        start = np.searchsorted(tx_index, tx_list, side='left')
+        count = np.searchsorted(tx_index, tx_list, side='right') - start
+        position = np.repeat(start - np.cumsum(count) + count, count) + np.arange(int(count.sum()), dtype='int64')
+        if order is not None:
+            position = np.sort(order[position])
+        return position
+
+    def tx_rows(self, tx_list, table_name='tx_output'):
+        """
+        Outputs or inputs of transactions from the loaded data, without creating the whole tx_output or tx_input dataframe in 'mmap' storage.
+
+        :param tx_list: List of tx index.
+        :param table_name: Either 'tx_output' or 'tx_input'.
+
+        :return: DataFrame of the outputs or inputs with tx_index as index.
+        """
+
+        position = self.row_position(tx_list, table_name)
+        if getattr(self, '_' + table_name) is None:
+            store = self.output_store if table_name == 'tx_output' else self.input_store
+            rows = store.take(position).to_frame(schema=self.schema)
+        else:
+            rows = getattr(self, table_name).iloc[position]
+        if 'tx_index' in rows.columns:
+            return rows.reset_index().set_index('tx_index')
+        rows.index.names = ['tx_index']
+        return rows
+
+    def tainted_rows(self, graph, depth_of, known_tx, taint_limit=None, table_name='tx_output'):
+        """
+        Materialize the outputs of the transactions tainted by a spend graph search.
+
+        :param graph: SpendGraph searched.
+        :param depth_of: Depth of each graph node, -1 for untainted nodes.
+        :param known_tx: Index of transactions to leave out (already in tx_tainted).
+        :param taint_limit: taint_limit of tx_taint_search, outputs excluded during tainting are left out.
+        :param table_name: 'tx_output', or 'tx_input' for the inputs of a backward search.
+
+        :return: DataFrame of tainted outputs with tx_index as index and depth column, ordered by depth.
+        """
+
+        found = np.flatnonzero(depth_of >= 0)
+        depth = pd.Series(depth_of[found], index=graph.node_tx[found])
+        depth = depth[~depth.index.isin(known_tx)]
+        rows = self.tx_rows(depth.index.values, table_name)
+        if taint_limit is not None and taint_limit[0] == 'taint':
+            if taint_limit[1] is not None:
+                rows = rows[~rows['adr_index'].isin(taint_limit[1].index)]
+            if taint_limit[2] is not None:
+                rows = rows[~rows.index.isin(taint_limit[2].index)]
+        rows['depth'] = depth.reindex(rows.index).values
+        return rows.iloc[np.argsort(rows['depth'].values, kind='stable')]
 
     def haircut_distribute(self, tx_tainted, tx_input, search_df):
         """
@@ -429,6 +1019,7 @@ class TaintedTX(object):
         :return: DataFrame with tainted coins from inputs distributed to outputs proportionally
 
         Note that it is possible for tainted coin to be so proportionally small (less than 1) that not all output can receive tainted coins
+        policy_tx_taint distributes every transaction at once with utility.haircut.haircut_taint, which gives the same values.
         """
 
         temp_search_df = tx_tainted[tx_tainted['spent_index'].isin(search_df['tx_index'])]  # get taint of previous tx
@@ -440,7 +1031,7 @@ class TaintedTX(object):
                                                   left_on=['spent_index', 'adr_index'], right_on=['spent_index', 'adr_index'])
         haircut_input_taint = haircut_input_taint.groupby('spent_index').sum()
         haircut_input_taint['fee_value'] = haircut_input_taint['output_value'] - haircut_input_taint['input_value']
-        temp_search_df = temp_search_df.drop(columns=['clean_value', 'output_value', 'adr_index']).groupby('tx_index').sum()['taint_value'].values[0]
+        temp_search_df = temp_search_df['taint_value'].sum()  # taint of every tainted input, not only the ones from the first previous tx
         fee_value = haircut_input_taint['fee_value'].values[0]
         if fee_value > 0:
             temp_search_df = round(temp_search_df - (temp_search_df * (fee_value / haircut_input_taint['input_value'].values[0])))
@@ -528,7 +1119,8 @@ class TaintedTX(object):
 
         return input_taint
 
-    def policy_tx_taint(self, tx_tainted, policy, test=0, keep_full_clean=True, input_fee_file=None, show_progress=False, continue_mode=False):
+    def policy_tx_taint(self, tx_tainted, policy, test=0, keep_full_clean=True, input_fee_file=None, show_progress=False, continue_mode=False,
+                        workers=1):
         """
         Distribute tainted coins according to the policy/strategy.
 
@@ -539,16 +1131,89 @@ class TaintedTX(object):
         :param input_fee_file: Use transaction fee file instead of haircut fee distribution.
         :param show_progress: Show progress in console.
         :param continue_mode: Continue from the previous run. Will load from file with the same case_name.
+        :param workers: Number of processes distributing the independent parts of the tainted transactions (utility.parallel_policy) for haircut and In-Out policies, 1 to distribute in this process. The result is the same.
 
         :return: DataFrame with distributed tainted coins
         """
 
         self.policy = policy.lower()
+        tx_input, tx_output = self.policy_input(tx_tainted, input_fee_file)
+        logging.info('start ' + str(self.case_name) + self.policy)
+        tx_tainted = self.distribute_policy(tx_tainted, tx_input, tx_output, test, show_progress, continue_mode, workers)
+        if tx_tainted is None:  # policy name not match any
+            return
+
+        if keep_full_clean is False:
+            original = tx_tainted.groupby('tx_index').sum()
+            original = original[original['taint_value'] > 0]
+            tx_tainted = tx_tainted[tx_tainted['tx_index'].isin(original['tx_index'])]
+
+        if self.case_name is not None:
+            tx_tainted.to_pickle('taintresults/' + self.case_name + self.policy + 'dftainted' + str(self.option).replace(' ', '') + '.pkl')
+            self.record.to_pickle('taintresults/' + self.case_name + self.policy + 'record' + str(self.option).replace(' ', '') + '.pkl')
+
+        return tx_tainted
+
+    def multi_policy_tx_taint(self, tx_tainted, policy_list, test=0, keep_full_clean=True, input_fee_file=None, show_progress=False, workers=1):
+        """
+        Distribute tainted coins with several policies side by side (e.g., poison, haircut, FIFO, LIFO, TIHO and dirtyfirst).
+        The inputs, outputs and fee of the tainted transactions are prepared once (policy_input) and the In-Out and dirtyfirst policies share
+        the transaction levels and the grouped inputs and outputs (utility.interval_taint.taint_plan), each policy gives the same taint_value as policy_tx_taint.
+        The record of portions of each policy is kept in self.record_dict.
+
+        :param tx_tainted: DataFrame to perform taint analysis.
+        :param policy_list: List of policy names accepted by policy_tx_taint.
+        :param test: Number to limit how many transactions to run, 0 means running until the end.
+        :param keep_full_clean: Keep transaction outputs with completely clean coins in every policy.
+        :param input_fee_file: Use transaction fee file instead of haircut fee distribution.
+        :param show_progress: Show progress in console.
+        :param workers: Number of processes distributing the independent parts of the tainted transactions.
+
+        :return: DataFrame of tx_tainted with a taint_value_<policy> column for each policy instead of taint_value and clean_value,
+        NaN for outputs a policy removes (puredirtyfirst).
+        """
+
+        policy_list = [policy.lower() for policy in policy_list]
+        tx_input, tx_output = self.policy_input(tx_tainted, input_fee_file)
+        multi_tainted = tx_tainted.drop(columns=['taint_value', 'clean_value'], errors='ignore')
+        plan = None
+        self.record_dict = {}
+        for policy in policy_list:
+            self.policy = policy
+            logging.info('start ' + str(self.case_name) + self.policy)
+            if plan is None and ((policy in interval_taint.dirtyfirst_policy) or (len(policy) == 4 and policy[1] == 'i' and policy[3] == 'o')):
+                plan = interval_taint.taint_plan(tx_tainted, tx_input, tx_output)
+            policy_tainted = self.distribute_policy(tx_tainted.copy(), tx_input, tx_output, test, show_progress, False, workers, plan)
+            if policy_tainted is None:  # policy name not match any
+                continue
+            multi_tainted['taint_value_' + policy] = policy_tainted['taint_value'].reindex(multi_tainted.index)
+            self.record_dict[policy] = self.record
+
+        if keep_full_clean is False:  # remove transactions without taint in any policy
+            tx_taint = multi_tainted[['taint_value_' + policy for policy in self.record_dict]].fillna(0).sum(axis=1).groupby(multi_tainted['tx_index']).sum()
+            multi_tainted = multi_tainted[multi_tainted['tx_index'].isin(tx_taint[tx_taint > 0].index)]
+
+        if self.case_name is not None:
+            multi_tainted.to_pickle('taintresults/' + self.case_name + 'multi' + 'dftainted' + str(self.option).replace(' ', '') + '.pkl')
+            for policy, record in self.record_dict.items():
+                record.to_pickle('taintresults/' + self.case_name + policy + 'record' + str(self.option).replace(' ', '') + '.pkl')
+
+        return multi_tainted
+
+    def policy_input(self, tx_tainted, input_fee_file=None):
+        """
+        tx_input and tx_output of the tainted transactions for the policy distribution, with the fee taken off the input_value of tx_input.
+
+        :param tx_tainted: DataFrame to perform taint analysis.
+        :param input_fee_file: Use transaction fee file instead of haircut fee distribution.
+
+        :return: Tuple (tx_input DataFrame, tx_output DataFrame).
+        """
+
         tx_input = self.tx_input[self.tx_input['tx_index'].isin(tx_tainted['tx_index'])]
         tx_input.is_copy = False
         tx_output = self.tx_output[self.tx_output['tx_index'].isin(tx_tainted['tx_index'])]
         tx_output.is_copy = False
-        new_tainted_tx = pd.DataFrame()
 
         if input_fee_file is None:  # haircut fee distribution
             tx_fee_df = pd.DataFrame(index=tx_input.drop(columns=['adr_index', 'spent_index']).groupby('tx_index').sum().index)
@@ -570,7 +1235,25 @@ class TaintedTX(object):
             tx_input_fee = tx_input_fee[tx_input_fee.index.isin(tx_input.index)]
             tx_input['input_value'] = tx_input_fee
 
-        logging.info('start ' + str(self.case_name) + self.policy)
+        return tx_input, tx_output
+
+    def distribute_policy(self, tx_tainted, tx_input, tx_output, test=0, show_progress=False, continue_mode=False, workers=1, plan=None):
+        """
+        Distribute tainted coins with self.policy and keep the record of portions in self.taint_record (utility.taint_record.TaintRecord)
+        and as a DataFrame in self.record, the distribution step of policy_tx_taint.
+
+        :param tx_tainted: DataFrame to perform taint analysis.
+        :param tx_input: tx_input from policy_input.
+        :param tx_output: tx_output from policy_input.
+        :param test: Number to limit how many transactions to run, 0 means running until the end.
+        :param show_progress: Show progress in console.
+        :param continue_mode: Continue from the record of the previous run in self.record.
+        :param workers: Number of processes distributing the independent parts of the tainted transactions.
+        :param plan: Optional dictionary from utility.interval_taint.taint_plan of the same data, for In-Out policies.
+
+        :return: DataFrame with distributed tainted coins, None when the policy does not exist.
+        """
+
         if (self.policy in ('dirtyfirst', 'puredirtyfirst', 'df', 'pdf')) or (
                 len(self.policy) == 4 and self.policy[1] == 'i' and self.policy[3] == 'o'):  # dirtyfirst or In-Out taint
             if continue_mode is False:  # create record file
@@ -580,150 +1263,11 @@ class TaintedTX(object):
                 self.record.is_copy = False
                 self.record['total_amount'] = self.record['input_value']
                 self.record['taint'] = 't'
+            self.taint_record = taint_record.from_frame(self.record)
 
-            searching_tx = tx_tainted[tx_tainted['taint_value'] > 0]
-            searching_tx = searching_tx[~searching_tx['spent_index'].isnull()]
-            searching_tx = searching_tx[~searching_tx['tx_index'].isin(searching_tx['spent_index'])].sort_values(
-                'spent_index')  # remove already distributed outputs
-            already_search = pd.Series()
-
-            while len(searching_tx) > 0:
-                try:
-                    searching_tx = searching_tx.sort_values('spent_index')
-                    this_search = [searching_tx['spent_index'].values[0]]
-                    tainted_input = self.order_tainting(tx_input, tx_tainted[tx_tainted['tx_index'].isin(this_search)], this_search, self.record)
-
-                    if len(tainted_input) > 0:  # reorder ditribute order base on the policy
-                        if self.policy in ('dirtyfirst', 'puredirtyfirst', 'df', 'pdf'):  # use FIFO
-                            temp_tainted_tx = tx_output[tx_output['tx_index'].isin(this_search)]
-                        else:
-                            if self.policy[0] == 'l':  # Last In
-                                tainted_input = tainted_input.iloc[::-1]
-                            elif self.policy[0] == 't':  # Taint In
-                                tainted_input = tainted_input.sort_values('taint', ascending=False)
-                            elif self.policy[0] == 'c':  # Clean In
-                                tainted_input = tainted_input.sort_values('taint', ascending=True)
-                            elif self.policy[0] == 'f':  # First In
-                                pass  # do nothing since it go according to natural order in blockchain
-                            elif self.policy[0] in ('b', 'h'):  # Biggest/Highest
-                                tainted_input = tainted_input.sort_values('input_value', ascending=False)
-                            elif self.policy[0] == 's':  # Smallest/Lowest (commonly called LO)
-                                tainted_input = tainted_input.sort_values('input_value', ascending=True)
-                            else:
-                                logging.warning(self.policy[0] + ' of ' + self.policy + 'not found')
-
-                            if self.policy[2] == 'f':  # First Out
-                                temp_tainted_tx = tx_output[tx_output['tx_index'].isin(this_search)]
-                            elif self.policy[2] == 'l':  # Last Out
-                                temp_tainted_tx = tx_output[tx_output['tx_index'].isin(this_search)].iloc[::-1]
-                            elif self.policy[2] in ('b', 'h'):  # Biggest/Highest
-                                temp_tainted_tx = tx_output[tx_output['tx_index'].isin(this_search)].sort_values('output_value', ascending=False)
-                            elif self.policy[2] == 's':  # Smallest/Lowest
-                                temp_tainted_tx = tx_output[tx_output['tx_index'].isin(this_search)].sort_values('output_value', ascending=True)
-                            else:
-                                logging.warning(self.policy[2] + ' of ' + self.policy + 'not found')
-
-                        temp_tainted_tx.is_copy = False
-                        temp_tainted_tx['taint_value'] = np.nan
-                        policy_df = tainted_input.reset_index(drop=True)
-                        value_list = policy_df['input_value'].tolist()
-
-                        tainted_list = temp_tainted_tx['output_value'].tolist()
-                        check_list = pd.DataFrame(columns=['policy_index', 'tainted_index', 'amount'])
-                        check_list.is_copy = False
-                        run_index, tainted_index, run = 0, 0, 0
-
-                        for m in tainted_list:  # distribute taint and clean portion to output
-                            try:
-                                k = m
-                                m -= value_list[run_index]
-                                if m > 0:
-                                    while m > 0:
-                                        check_list.loc[run] = [run_index, tainted_index, value_list[run_index]]
-                                        run_index += 1
-                                        run += 1
-                                        k = m
-                                        m -= value_list[run_index]
-                                if m < 0:
-                                    check_list.loc[run] = [run_index, tainted_index, value_list[run_index] - (value_list[run_index] - k)]
-                                    run += 1
-                                    value_list[run_index] -= k
-                                elif m == 0:
-                                    check_list.loc[run] = [run_index, tainted_index, value_list[run_index]]
-                                    run_index += 1
-                                    run += 1
-                                tainted_index += 1
-                            except:
-                                break
-
-                        check_list2 = policy_df[policy_df['taint'].isin(['t'])].index
-                        check_list2 = check_list[check_list['policy_index'].isin(check_list2)]
-                        check_list2 = check_list2.drop(columns=['policy_index']).rename(columns={'amount': 'taint_value'})
-                        check_list2['tainted_index'] = check_list2['tainted_index'].astype(int)
-                        check_list2 = check_list2.set_index('tainted_index')
-
-                        for p in check_list2.index:
-                            temp_tainted_tx.iloc[p, temp_tainted_tx.columns.get_loc('taint_value')] = check_list2[check_list2.index.isin([p])][
-                                'taint_value'].sum()
-                        temp_tainted_tx['taint_value'] = temp_tainted_tx['taint_value'].fillna(0)
-                        temp_tainted_tx['clean_value'] = temp_tainted_tx['output_value'] - temp_tainted_tx['taint_value']
-                        tx_tainted = tx_tainted[~tx_tainted['tx_index'].isin(temp_tainted_tx['tx_index'])]
-                        new_tainted_tx = new_tainted_tx.append(temp_tainted_tx)
-
-                        check_list['tainted_index'] = check_list['tainted_index'].astype(int)
-                        check_list['policy_index'] = check_list['policy_index'].astype(int)
-                        check_list['check_index'] = check_list['tainted_index']
-                        for z in list(set(check_list['tainted_index'].values.tolist())):
-                            check_list['tainted_index'] = check_list['tainted_index'].replace(z, temp_tainted_tx.iloc[z]['spent_index'])
-
-                        # get total tx value
-                        merge_out_value = temp_tainted_tx.drop(columns=['spent_index', 'taint_value', 'clean_value']).reset_index()
-                        check_list = check_list.set_index('check_index', drop=False).merge(merge_out_value, left_index=True, right_index=True,
-                                                                                           how='left').rename(
-                            columns={'output_value': 'total_amount'}).reset_index(drop=True)
-
-                        # setup tx to add in record
-                        policy_df = policy_df.drop(columns=['adr_index', 'tx_index'])
-                        check_list = check_list.set_index('policy_index').merge(policy_df, left_index=True, right_index=True).drop(
-                            columns=['spent_index', 'input_value'])
-                        check_list = check_list.rename(
-                            columns={'amount': 'input_value', 'tainted_index': 'spent_index'}).drop(columns=['check_index']).reset_index(drop=True)
-
-                        self.record = self.record.append(check_list).reset_index(drop=True)
-
-                        searching_tx = searching_tx.append(temp_tainted_tx)
-                        if self.policy in ('dirtyfirst', 'puredirtyfirst', 'df', 'pdf'):  # remove tx with clean coins
-                            found_clean = searching_tx[searching_tx['clean_value'] > 0]
-                            searching_tx = searching_tx[~searching_tx['tx_index'].isin(found_clean['tx_index'])]
-                        searching_tx = searching_tx[searching_tx['spent_index'].isin(tx_tainted['tx_index'])]
-                        searching_tx = searching_tx[~searching_tx['spent_index'].isnull()]
-                        searching_tx = searching_tx[searching_tx['taint_value'] > 0]
-                    else:  # no tainted coints
-                        temp_tainted_tx = tx_tainted[tx_tainted['tx_index'].isin(this_search)]
-                        temp_tainted_tx['taint_value'] = 0
-                        temp_tainted_tx['clean_value'] = temp_tainted_tx['output_value'] - temp_tainted_tx['taint_value']
-                        tx_tainted = tx_tainted[~tx_tainted['tx_index'].isin(temp_tainted_tx['tx_index'])]
-                        new_tainted_tx = new_tainted_tx.append(temp_tainted_tx)
-
-                    already_search = already_search.append(pd.Series(this_search), ignore_index=True)
-                    searching_tx = searching_tx[~searching_tx['spent_index'].isin(already_search)]
-                    searching_tx = searching_tx.drop_duplicates(subset='spent_index')
-                    if show_progress:
-                        logging.info("progress " + str(self.case_name) + self.policy + " " + str(len(tx_tainted)) + " at index " + str(
-                            this_search) + " have " + str(len(searching_tx)))
-                    tx_input = tx_input[~tx_input['tx_index'].isin(already_search)]
-                    tx_output = tx_output[~tx_output['spent_index'].isin(already_search)]
-                    
-                    test -= 1
-                    if test == 0:
-                        break
-                        
-                except KeyboardInterrupt:  # user interupt, save progress
-                    if self.case_name is not None:
-                        tx_tainted.to_pickle(
-                            'taintresults/' + self.case_name + self.policy + 'dftainted' + str(self.option).replace(' ', '') + '.pkl')
-                        self.record.to_pickle('taintresults/' + self.case_name + self.policy + 'record' + str(self.option).replace(' ', '') + '.pkl')
-                    break
+            # distribute whole topological levels of transactions at once, same record and taint_value as one transaction at a time
+            tx_tainted, new_tainted_tx, self.taint_record = parallel_policy.in_out_taint(tx_tainted, tx_input, tx_output, self.taint_record, self.policy,
+                                                                                         test, show_progress, workers, plan)
             tx_tainted = tx_tainted.append(new_tainted_tx)
             tx_tainted = tx_tainted.fillna(value=0)
             tx_tainted = tx_tainted.sort_index()
@@ -732,46 +1276,23 @@ class TaintedTX(object):
             if self.policy == 'puredirtyfirst' or self.policy == 'pdf':  # remove all outputs with clean value
                 found_clean = tx_tainted[tx_tainted['clean_value'] > 0]
                 tx_tainted = tx_tainted[~tx_tainted['tx_index'].isin(found_clean['tx_index'])]
-            self.record['input_value'] = self.record['input_value'].astype(int)
-            self.record['taint'] = self.record['taint'].astype(str)
+            self.record = self.taint_record.frame()
 
         elif self.policy == 'poison':  # poison simply taint fully
+            self.record = pd.DataFrame()  # no record of portions for poison
+            self.taint_record = taint_record.TaintRecord()
             tx_tainted['taint_value'] = tx_tainted['output_value']
 
-        elif self.policy == 'haircut':
-            this_list = sorted(list(set(tx_tainted[tx_tainted['taint_value'].isnull()]['tx_index'].tolist())))
-            for i in this_list:
-                tainted_input = self.haircut_distribute(tx_tainted, self.tx_input, tx_tainted[tx_tainted['tx_index'] == i])
-                tainted_input = tainted_input.sort_index()
-
-                tainted_input['clean_value'] = tainted_input['output_value'] - tainted_input['taint_value']
-                new_tainted_tx = new_tainted_tx.append(tainted_input)
-                if show_progress:
-                    logging.info(
-                        "progress " + str(self.case_name) + self.policy + " " + str(len(new_tainted_tx)) + " out of " + str(len(tx_tainted)))
-                test -= 1
-                if test == 0:
-                    break
-
-            tx_tainted = tx_tainted[~tx_tainted['tx_index'].isin(new_tainted_tx['tx_index'])].append(new_tainted_tx)
-            tx_tainted = tx_tainted.fillna(value={'taint_value': 0})
-            tx_tainted = tx_tainted.sort_index()
+        elif self.policy == 'haircut':  # all transactions by topological level, same values as haircut_distribute in tx index order
+            self.record = pd.DataFrame()  # no record of portions for haircut
+            self.taint_record = taint_record.TaintRecord()
+            tx_tainted = parallel_policy.haircut_taint(tx_tainted, self.tx_input, test, workers)
 
         else:  # policy name not match any
             logging.warning('Policy not exist')
             return
 
         self.record.rename(columns={'input_value': 'portion_value'}, inplace=True)
-
-        if keep_full_clean is False:
-            original = tx_tainted.groupby('tx_index').sum()
-            original = original[original['taint_value'] > 0]
-            tx_tainted = tx_tainted[tx_tainted['tx_index'].isin(original['tx_index'])]
-
-        if self.case_name is not None:
-            tx_tainted.to_pickle('taintresults/' + self.case_name + self.policy + 'dftainted' + str(self.option).replace(' ', '') + '.pkl')
-            self.record.to_pickle('taintresults/' + self.case_name + self.policy + 'record' + str(self.option).replace(' ', '') + '.pkl')
-
         return tx_tainted
 
     def dirtyfirst(self, policy, tx_tainted):
@@ -804,94 +1325,108 @@ class TaintedTX(object):
 
         return tx_tainted
 
-    def adr_taint_search(self, target_adr, depth_limit=-1, continue_mode=False, taint_limit=None, backward=False, case_name=None):
+    def adr_taint_search(self, target_adr, depth_limit=-1, continue_mode=False, taint_limit=None, backward=False, case_name=None,
+                         checkpoint_interval=checkpoint.default_interval, hub=None):
         """
         Search for connected adr to the original and taint any direct address either forward or backward.
         specify depth_limit option to limit how many transaction depth to search but shouldn't be used unless for testing
+        The search runs on the address graph of the loaded data (get_address_graph).
 
         :param target_adr: List of target address index.
         :param depth_limit: DataFrame for public checking.
-        :param continue_mode: Continue from previous run. Will load from file with the same case_name.
+        :param continue_mode: Continue from previous run. Will load the checkpoint with the same case_name.
         :param taint_limit: list of two items [string to indicate for exclude during ('taint') of after tainting ('after'), DataFrame of addresses for checking]
         :param backward: Run the tainting backward instead of forward.
         :param case_name: Name of the case used for saving into file.
+        :param checkpoint_interval: Seconds between binary checkpoint saves (utility.checkpoint) when case_name is given, None for no checkpoint.
+        :param hub: Optional list of hub names (build_hub_summary) or HubSummary objects, their addresses are tainted but the search does not continue from them.
 
-        :return: DataFrame with tainted transactions and DataFrame with tainted addresses.
+        :return: DataFrame with tainted transactions and DataFrame with tainted addresses (see adr_tainted_result).
         """
 
         self.case_name = case_name
-        depth = 0  # depth of search
-        done = []
-
-        tx_output = self.tx_output
-        if 'tx_index' in tx_output.columns:
-            tx_output = tx_output.reset_index().set_index('tx_index')
-        else:
-            tx_output.index.names = ['tx_index']
-
-        tx_input = self.tx_input
-        if 'tx_index' in tx_input.columns:
-            tx_input = tx_input.reset_index().set_index('tx_index')
-        else:
-            tx_input.index.names = ['tx_index']
-
-        if continue_mode:
-            searching_tx = pd.read_csv('taintresults/' + self.case_name + 'searching_tx' + str(self.option).replace(' ', '') + '.csv',
-                                       index_col='tx_index')
-            tx_tainted = pd.read_csv('taintresults/' + self.case_name + 'tx_tainted' + str(self.option).replace(' ', '') + '.csv',
-                                     index_col='tx_index')
-            adr_tainted = pd.read_csv('taintresults/' + self.case_name + 'adr_tainted' + str(self.option).replace(' ', '') + '.csv',
-                                      index_col='addressindex')
-        else:
+        if hub is not None and self.shard_engine is not None:
+            raise Exception('hub is not available for a sharded search')
+        if self.shard_engine is not None:  # search the whole dataset on the shard processes (start_shard)
+            if continue_mode:
+                raise Exception('continue_mode is not available for a sharded search')
+            limit_adr = taint_limit[1].index if taint_limit is not None and taint_limit[0] == 'taint' else None
+            rows, start_adr = self.shard_engine.adr_search(target_adr, depth_limit, limit_adr, backward)
             tx_tainted = pd.DataFrame()  # list of tainted outputs
-            adr_tainted = pd.DataFrame()
-            adr_found = tx_output[tx_output['adr_index'].isin(target_adr)]
-            adr_tainted = adr_tainted.append(tx_output[tx_output.index.isin(adr_found.index)])
-
-            for i in tx_input[tx_input.index.isin(tx_tainted.index)]['adr_index'].values:
-                adr_tainted.loc[i] = np.nan
-            #         adr_tainted['role'] = adr_tainted['role'].fillna(value=1)
-            adr_tainted.index = adr_tainted.index.rename('adr_index')
-
-            if backward:
-                searching_tx = tx_output[tx_output['adr_index'].isin(adr_tainted['adr_index'])]
-                searching_tx = tx_input[tx_input.index.isin(searching_tx.index)]
-            else:
-                searching_tx = tx_input[tx_input['adr_index'].isin(adr_tainted['adr_index'])]
-                searching_tx = tx_output[tx_output.index.isin(searching_tx.index)]
+            if len(rows) > 0:
+                tx_tainted = rows.drop(columns=['depth']).reset_index().drop_duplicates().set_index('tx_index')
+            return self.adr_tainted_result(tx_tainted, start_adr, taint_limit, self.shard_engine)
+
+        graph = self.get_address_graph()
+
+        blocked = None  # addresses discontinued during tainting
+        if taint_limit is not None and taint_limit[0] == 'taint':
+            blocked = np.zeros(len(graph.node_adr), dtype=bool)
+            limit_node = graph.adr_node(taint_limit[1].index)
+            blocked[limit_node[limit_node >= 0]] = True
+        stop = None  # hub addresses tainted but not followed
+        if hub is not None:
+            stop = np.zeros(len(graph.node_adr), dtype=bool)
+            hub_node = graph.adr_node(np.concatenate([summary.adr for summary in self.get_hub_summary(hub)]))
+            stop[hub_node[hub_node >= 0]] = True
+
+        this_checkpoint = checkpoint.Checkpoint('taintresults/' + str(self.case_name) + ('adr_tainted_backward' if backward else 'adr_tainted') +
+                                                str(self.option).replace(' ', '') + checkpoint.checkpoint_suffix + '/', checkpoint_interval)
+        state = None
+        if continue_mode:
+            if not this_checkpoint.exists():
+                raise Exception('No checkpoint found in ' + this_checkpoint.path)
+            saved, chunk = this_checkpoint.load()
+            if int(saved['node_count']) != len(graph.node_tx) or int(saved['adr_count']) != len(graph.node_adr):
+                raise Exception('Checkpoint was saved with different data, prepare the data with the same limit_option')
+            tx_depth = np.full(len(graph.node_tx), -1, dtype='int64')
+            tx_depth[chunk['tx']] = chunk['tx_depth']
+            edge_tainted = np.zeros(len(graph.direction(backward)[3]), dtype=bool)
+            edge_tainted[chunk['edge']] = True
+            this_checkpoint.new_item('tx', tx_depth >= 0)
+            this_checkpoint.new_item('edge', edge_tainted)
+            state = {'tx_depth': tx_depth, 'edge_tainted': edge_tainted, 'done': saved['done'], 'start_adr': saved['start_adr'],
+                     'edge': saved['edge'], 'depth': int(saved['depth'])}
+        tx_tainted = pd.DataFrame()  # list of tainted outputs
+
+        def save_checkpoint(this_state):
+            if self.case_name is not None and this_checkpoint.due():
+                new_tx = this_checkpoint.new_item('tx', this_state['tx_depth'] >= 0)
+                new_edge = this_checkpoint.new_item('edge', this_state['edge_tainted'])
+                this_checkpoint.save({'node_count': len(graph.node_tx), 'adr_count': len(graph.node_adr), 'done': this_state['done'],
+                                      'start_adr': this_state['start_adr'], 'edge': this_state['edge'], 'depth': this_state['depth']},
+                                     {'tx': new_tx, 'tx_depth': this_state['tx_depth'][new_tx], 'edge': new_edge}, force=True)
 
         logging.info('Start Search')
-
-        while depth != depth_limit and len(searching_tx) > 0:
-            tx_tainted = tx_tainted.append(searching_tx[~searching_tx.index.isin(tx_tainted.index)])
+        state = graph.search(target_adr, depth_limit, backward, blocked, state, save_checkpoint, stop)
+        new_tainted = self.adr_tainted_rows(graph, state, backward)
+        if len(new_tainted) > 0:
+            tx_tainted = tx_tainted.append(new_tainted)
             tx_tainted = tx_tainted.reset_index().drop_duplicates().set_index('tx_index')
+        tx_tainted, adr_tainted = self.adr_tainted_result(tx_tainted, np.asarray(graph.node_adr)[state['start_adr']], taint_limit, graph)
+        if self.case_name is not None:
+            this_checkpoint.remove()  # remove saved for continue checkpoint
+        return tx_tainted, adr_tainted
+
+    def adr_tainted_result(self, tx_tainted, start_adr, taint_limit, graph):
+        """
+        Final touch of an address taint search: the tainted addresses with their tx_count, the 'after' taint_limit and saving of the case.
+        The tainted addresses are indexed by adr_index (sorted int64, the starting addresses and every address of the tainted rows, one row each).
+        Their only column tx_count is the number of outputs received plus inputs spent by the address in the searched data (its degree in the
+        address graph, summed over every shard for a sharded search), so an address paid twice in one transaction counts 2. It is not a count of
+        distinct transactions, and inputs are no longer dropped when their row position matches an output row, as they were before the address graph.
+
+        :param tx_tainted: DataFrame of tainted rows with tx_index as index.
+        :param start_adr: Array of the starting adr index of the search.
+        :param taint_limit: taint_limit of adr_taint_search.
+        :param graph: AddressGraph (or utility.shard.ShardEngine) giving the tx_count of addresses.
+
+        :return: DataFrame with tainted transactions (tx_index as index) and DataFrame of tainted addresses (adr_index as index, tx_count).
+        """
 
-            done = done + searching_tx['adr_index'].tolist()
-            done = list(set(done))
-            if backward:
-                searching_tx = tx_output[tx_output['adr_index'].isin(searching_tx['adr_index'])]
-                searching_tx = tx_input[tx_input.index.isin(searching_tx.index)]
-            else:  # don't taint any previous tx before the tainted one
-                searching_tx = tx_input[tx_input['adr_index'].isin(searching_tx['adr_index'])]
-                searching_tx = tx_output[tx_output.index.isin(searching_tx.index)]
-
-            searching_tx = searching_tx[~searching_tx['adr_index'].isin(done)]
-
-            # add adr from searching_tx into adr_tainted
-            ii = pd.DataFrame(index=tx_tainted[~tx_tainted['adr_index'].isin(adr_tainted.index)]['adr_index'].values.tolist())
-            ii = ii.groupby(ii.index).first()
-            adr_tainted = adr_tainted.append(ii)
-            adr_tainted = adr_tainted[~adr_tainted.index.duplicated()]
-            # adr_tainted['first_block'] = adr_tainted['first_block'].fillna(value=self.blocksearch)
-
-            if taint_limit is not None and taint_limit[0] == "taint":  # discontinue tx of limit adr from further searching if true
-                searching_tx = searching_tx[
-                    ~searching_tx['adr_index'].isin(taint_limit[1].index)]  # remove tx with adr input belong to service
-            depth += 1
-            if depth % 5000 == 0:
-                tx_tainted.to_csv('taintresults/' + self.case_name + 'tx_tainted' + str(self.option).replace(' ', '') + '.csv')
-                adr_tainted.to_csv('taintresults/' + self.case_name + 'adr_tainted' + str(self.option).replace(' ', '') + '.csv')
-                searching_tx.to_csv('taintresults/' + self.case_name + 'searching_tx' + str(self.option).replace(' ', '') + '.csv')
+        start_adr = set(np.asarray(start_adr).tolist())
+        adr_tainted = pd.DataFrame(index=pd.Index(sorted(start_adr | set(tx_tainted.get('adr_index', pd.Series(dtype='int64')).tolist())),
+                                                  name='adr_index', dtype='int64'))
         logging.info('End, now adding extra information')  # Final touch to add tainted address stat
 
         if taint_limit is not None and taint_limit[0] == 'after':  # remove transaction reaching identified addresses and transactions
@@ -899,21 +1434,8 @@ class TaintedTX(object):
                 tx_tainted = remove_service(tx_tainted, taint_limit[1])
                 adr_tainted = adr_tainted[adr_tainted.index.isin(tx_tainted['adr_index'])]
 
-        #         first_tx_insert = pd.DataFrame(index=tx_tainted.set_index('adr_index').index)
-        #         first_tx_insert['first_taint_tx'] = tx_tainted.set_index('adr_index')['spent_index']
-        #         first_tx_insert = first_tx_insert.reset_index().sort_values('first_taint_tx').drop_duplicates(subset='adr_index', keep='first').set_index(
-        #             'adr_index').sort_index()
-        #         adr_tainted['first_taint_tx'] = first_tx_insert['first_taint_tx']
         tx_tainted = tx_tainted.sort_index()
-
-        input_count = tx_input[tx_input['adr_index'].isin(adr_tainted.index)].reset_index()
-        output_count = tx_output[tx_output['adr_index'].isin(adr_tainted.index)].reset_index()
-        count = output_count.append(input_count)
-        count = count[~count.index.duplicated()].groupby('adr_index').count()
-        count = count.sort_index()
-        adr_tainted = adr_tainted[~adr_tainted.index.duplicated()].sort_index()
-        adr_tainted['tx_count'] = count['tx_index']
-        adr_tainted = adr_tainted[['tx_count']]
+        adr_tainted['tx_count'] = graph.tx_count(adr_tainted.index)  # number of inputs and outputs of the address
         #         adr_tainted['remain'] = adr_tainted['output_value'] - adr_tainted[
         #             'input_value']  # find how much coin left in adr
 
@@ -924,13 +1446,88 @@ class TaintedTX(object):
         if self.case_name is not None:
             tx_tainted.to_pickle('taintresults/' + self.case_name + 'tx_tainted' + str(self.option).replace(' ', '') + '.pkl')
             adr_tainted.to_pickle('taintresults/' + self.case_name + 'adr_tainted' + str(self.option).replace(' ', '') + '.pkl')
-            try:
-                os.remove('taintresults/' + self.case_name + 'tx_tainted' + str(self.option).replace(' ', '') + '.csv')
-                os.remove('taintresults/' + self.case_name + 'adr_tainted' + str(self.option).replace(' ', '') + '.csv')
-            except:
-                pass
         return tx_tainted, adr_tainted
 
+    def adr_taint_search_iter(self, target_adr, depth_limit=-1, taint_limit=None, backward=False, time_budget=None, output_budget=None):
+        """
+        Generator version of adr_taint_search: yields the transactions and addresses newly tainted at each depth as soon as the depth is searched,
+        only the rows of one depth are put into a dataframe at a time. Stop iterating to stop the search.
+
+        :param target_adr: List of target address index.
+        :param depth_limit: Limit how many depth to search.
+        :param taint_limit: list of two items [string to indicate for exclude during tainting ('taint') or stop the search at the depth reaching them ('stop'), DataFrame of addresses for checking]
+        :param backward: Run the tainting backward instead of forward.
+        :param time_budget: Optional seconds after which the search stops, checked after each depth.
+        :param output_budget: Optional number of tainted rows after which the search stops, the depth reaching it is yielded whole.
+
+        :return: Yields tuple (DataFrame of tainted transaction rows, DataFrame of tainted addresses with tx_count) of each depth,
+        the first tuple also has the starting addresses.
+        """
+
+        if taint_limit is not None and taint_limit[0] not in ['taint', 'stop']:
+            raise Exception(
+                'Unknown service limit input: use "taint" for remove service transaction during tainting or "stop" for stop the search at the depth reaching them')
+        graph = self.get_address_graph()
+        blocked = None
+        if taint_limit is not None and taint_limit[0] == 'taint':
+            blocked = np.zeros(len(graph.node_adr), dtype=bool)
+            limit_node = graph.adr_node(taint_limit[1].index)
+            blocked[limit_node[limit_node >= 0]] = True
+
+        start_time = time.time()
+        output_count = 0
+        state = graph.start(target_adr, backward)
+        adr_found = np.zeros(len(graph.node_adr), dtype=bool)  # addresses already yielded
+        adr_found[state['start_adr']] = True
+        new_adr = np.asarray(graph.node_adr)[state['start_adr']]
+        for edge, depth in graph.search_level(state, depth_limit, backward, blocked):
+            tx_tainted = self.adr_tainted_rows(graph, state, backward, edge)
+            tx_tainted = tx_tainted.reset_index().drop_duplicates().set_index('tx_index')
+            adr_node = graph.adr_node(tx_tainted['adr_index'].unique())
+            adr_node = adr_node[~adr_found[adr_node]]
+            adr_found[adr_node] = True
+            new_adr = np.sort(np.concatenate([new_adr, np.asarray(graph.node_adr)[adr_node]]))
+            if len(tx_tainted) == 0 and len(new_adr) == 0:
+                continue
+            output_count += len(tx_tainted)
+            yield tx_tainted.sort_index(), self.adr_batch(graph, new_adr)
+            new_adr = new_adr[:0]
+            if taint_limit is not None and taint_limit[0] == 'stop' and tx_tainted['adr_index'].isin(taint_limit[1].index).any():
+                logging.info('Stop at depth ' + str(depth) + ', taint reached taint_limit')
+                return
+            if output_budget is not None and output_count >= output_budget:
+                logging.info('Stop, output budget used')
+                return
+            if time_budget is not None and time.time() - start_time >= time_budget:
+                logging.info('Stop, time budget used')
+                return
+        if len(new_adr) > 0:  # starting addresses of a search without tainted transactions
+            yield pd.DataFrame(), self.adr_batch(graph, new_adr)
+
+    def adr_batch(self, graph, adr_list):
+        """DataFrame of tainted addresses with their tx_count for adr_taint_search_iter"""
+        adr_tainted = pd.DataFrame(index=pd.Index(adr_list, name='adr_index', dtype='int64'))
+        adr_tainted['tx_count'] = graph.tx_count(adr_tainted.index)
+        return adr_tainted
+
+    def adr_tainted_rows(self, graph, state, backward, edge=None):
+        """
+        Materialize the outputs (forward) or inputs (backward) tainted by an address graph search.
+
+        :param graph: AddressGraph searched.
+        :param state: State dictionary from AddressGraph.search.
+        :param backward: Direction of the search.
+        :param edge: Optional array of tainted edges to materialize (one level of AddressGraph.search_level), default is every tainted edge.
+
+        :return: DataFrame of tainted rows with tx_index as index, ordered by search level.
+        """
+
+        pair = graph.tainted_pair(state, backward, edge)
+        rows = self.tx_rows(pair['tx_index'].unique(), 'tx_input' if backward else 'tx_output')
+        rows = rows[pd.MultiIndex.from_arrays([rows.index, rows['adr_index']]).isin(pd.MultiIndex.from_arrays([pair['tx_index'], pair['adr_index']]))]
+        level = pair.drop_duplicates('tx_index').set_index('tx_index')['depth']
+        return rows.iloc[np.argsort(level.reindex(rows.index).values, kind='stable')]
+
     def filtering(self, tx_tainted, mix_time=None, filter_input=None, filter_output=None, filter_chain=None, filter_reuse=None,
                   filter_mix_fee=None, filter_tx_fee=None, target=None):
         """
@@ -952,15 +1549,10 @@ class TaintedTX(object):
         new_tx_tainted = self.tx_output[self.tx_output.index.isin(tx_tainted.index)]
 
         if mix_time is not None:
-            block = read_option(block_filename, self.path)
             first = self.tx_output[self.tx_output.index.isin(target.index)]
             start_tx = first.index[0]
-            start_block = self.tx_height[self.tx_height.index == start_tx]['block_index'].values
-            start_time = block[block.index == start_block[0]]['time'].values
-            end_time = start_time + mix_time
-            end_tx = self.tx_height[
-                self.tx_height['block_index'] == block['time'].loc[block['time'].dt.date == np.datetime64(end_time[0], 'D')].index[-1]].index[
-                -1]
+            start_time = self.get_time_index().tx_time([start_tx])[0]
+            end_tx = self.get_time_index().time_range_tx(start_time, start_time + mix_time, whole_day=True)[1]  # until the end of the day
 
             new_tx_tainted = new_tx_tainted[new_tx_tainted.index >= start_tx]
             new_tx_tainted = new_tx_tainted[new_tx_tainted.index <= end_tx]
@@ -0,0 +1,224 @@
+import logging
+import os.path
+
+import numpy as np
+import pandas as pd
+
+from utility import utility_function
+from utility import spend_graph
+
+logging.getLogger().setLevel(logging.INFO)
+pd.options.mode.chained_assignment = None  # default='warn'
+
+index_folder = utility_function.index_folder
+csr_edge = spend_graph.csr_edge
+csr_array = spend_graph.csr_array
+lookup_node = spend_graph.lookup_node
+
+address_graph_name = 'address_graph'  # saved as index/address_graph_<column>.npy
+address_graph_column = ['node_tx', 'node_adr', 'tx_output_ptr', 'tx_output_adr', 'tx_input_ptr', 'tx_input_adr',
+                        'adr_output_ptr', 'adr_output_tx', 'adr_input_ptr', 'adr_input_tx']
+
+
+def build_address_graph(tx_input, tx_output):
+    """
+    Build the address-transaction graph in compressed sparse row (CSR) form, in both directions for inputs and outputs:
+    tx to the addresses of its outputs (tx_output) and inputs (tx_input), address to the transactions paying it (adr_output)
+    and spending from it (adr_input). There is one edge per input or output row.
+
+    :param tx_input: tx_input dataframe (tx_index as column or index) or utility.column_store.ColumnStore of tx_input.
+    :param tx_output: tx_output dataframe (tx_index as column or index) or utility.column_store.ColumnStore of tx_output.
+
+    :return: AddressGraph object.
+    """
+
+    input_tx, input_adr, _ = spend_graph.table_array(tx_input)
+    output_tx, output_adr, _ = spend_graph.table_array(tx_output)
+    node_tx = np.unique(np.concatenate([input_tx, output_tx]))
+    node_adr = np.unique(np.concatenate([input_adr, output_adr]))
+    input_tx, input_adr = np.searchsorted(node_tx, input_tx), np.searchsorted(node_adr, input_adr)
+    output_tx, output_adr = np.searchsorted(node_tx, output_tx), np.searchsorted(node_adr, output_adr)
+
+    array_dict = {'node_tx': node_tx, 'node_adr': node_adr}
+    array_dict['tx_output_ptr'], array_dict['tx_output_adr'] = csr_array(output_tx, output_adr, len(node_tx))
+    array_dict['tx_input_ptr'], array_dict['tx_input_adr'] = csr_array(input_tx, input_adr, len(node_tx))
+    array_dict['adr_output_ptr'], array_dict['adr_output_tx'] = csr_array(output_adr, output_tx, len(node_adr))
+    array_dict['adr_input_ptr'], array_dict['adr_input_tx'] = csr_array(input_adr, input_tx, len(node_adr))
+    return AddressGraph(array_dict)
+
+
+def has_address_graph(path):
+    """Check if the dataset in path has a saved address graph"""
+    return os.path.isfile(os.path.join(path, index_folder, address_graph_name + '_' + address_graph_column[-1] + '.npy'))
+
+
+def load_address_graph(path):
+    """
+    Open the address graph saved in the dataset folder.
+
+    :param path: String of folder path of the dataset e.g., 'sampledata/'.
+
+    :return: AddressGraph object.
+    """
+
+    return AddressGraph({column: np.load(os.path.join(path, index_folder, address_graph_name + '_' + column + '.npy'), mmap_mode='r')
+                         for column in address_graph_column})
+
+
+class AddressGraph(object):
+    def __init__(self, array_dict):
+        """
+        Bipartite address-transaction graph for address taint search with array frontiers and bitmap visited sets.
+
+        :param array_dict: Dictionary of address_graph_column name to array, see build_address_graph.
+        """
+
+        for column in address_graph_column:
+            setattr(self, column, array_dict[column])
+
+    def tx_range(self):
+        """[first tx index, last tx index] of the graph, None for an empty graph"""
+        if len(self.node_tx) == 0:
+            return None
+        return [int(self.node_tx[0]), int(self.node_tx[-1])]
+
+    def edge_count(self):
+        """Number of (input rows, output rows) in the graph"""
+        return len(self.tx_input_adr), len(self.tx_output_adr)
+
+    def save(self, path):
+        """
+        Save the graph into the index folder of the dataset.
+
+        :param path: String of folder path of the dataset e.g., 'sampledata/'.
+        """
+
+        save_path = os.path.join(path, index_folder)
+        if not os.path.isdir(save_path):
+            os.makedirs(save_path)
+        for column in address_graph_column:
+            np.save(os.path.join(save_path, address_graph_name + '_' + column + '.npy'), np.asarray(getattr(self, column)))
+
+    def adr_node(self, adr_list):
+        """Graph node of each adr index in adr_list, -1 for addresses not in the graph"""
+        return lookup_node(self.node_adr, adr_list)
+
+    def tx_count(self, adr_list):
+        """
+        Number of inputs and outputs of addresses, from the degree of the address nodes.
+
+        :param adr_list: List of adr index.
+
+        :return: Array of counts (0 for addresses not in the graph).
+        """
+
+        node = self.adr_node(adr_list)
+        found = node >= 0
+        count = np.zeros(len(node), dtype='int64')
+        count[found] = (np.diff(self.adr_output_ptr)[node[found]] + np.diff(self.adr_input_ptr)[node[found]])
+        return count
+
+    def direction(self, backward=False):
+        """(address to tx pointer, address to tx, tx to address pointer, tx to address) arrays followed by the search"""
+        if backward:  # address <- tx paying it, tx <- addresses of its inputs
+            return self.adr_output_ptr, self.adr_output_tx, self.tx_input_ptr, self.tx_input_adr
+        return self.adr_input_ptr, self.adr_input_tx, self.tx_output_ptr, self.tx_output_adr
+
+    def start(self, target_adr, backward=False):
+        """
+        Search state of a new search from the target addresses, see search.
+
+        :param target_adr: List of adr index to start from.
+        :param backward: Direction of the search.
+
+        :return: State dictionary ('tx_depth', 'edge_tainted', 'done', 'start_adr', 'edge', 'depth').
+        """
+
+        adr_tx_ptr, adr_tx, tx_adr_ptr, tx_adr = self.direction(backward)
+        target = self.adr_node(target_adr)
+        target = np.unique(target[target >= 0])
+        paying = np.unique(self.adr_output_tx[csr_edge(self.adr_output_ptr, target)])
+        start_adr = np.unique(self.tx_output_adr[csr_edge(self.tx_output_ptr, paying)])
+        tx = np.unique(adr_tx[csr_edge(adr_tx_ptr, start_adr)])
+        return {'tx_depth': np.full(len(self.node_tx), -1, dtype='int64'), 'edge_tainted': np.zeros(len(tx_adr), dtype=bool),
+                'done': np.zeros(len(self.node_adr), dtype=bool), 'start_adr': start_adr, 'edge': csr_edge(tx_adr_ptr, tx), 'depth': 0}
+
+    def search_level(self, state, depth_limit=-1, backward=False, blocked=None, stop=None):
+        """
+        Generator of the levels of search, the state is updated in place before each level is yielded.
+        The caller may stop at any level and continue later from the state.
+
+        :param state: State dictionary from start or an earlier search.
+        :param depth_limit: Limit how many depth to search, -1 for no limit.
+        :param backward: Direction of the search.
+        :param blocked: Optional boolean array over the address nodes.
+        :param stop: Optional boolean array over the address nodes, addresses tainted but not followed.
+
+        :return: Yields tuple (array of tx to address edges tainted in the level, their depth).
+        """
+
+        adr_tx_ptr, adr_tx, tx_adr_ptr, tx_adr = self.direction(backward)
+        tx_depth, edge_tainted, done = state['tx_depth'], state['edge_tainted'], state['done']
+        edge, depth = state['edge'], state['depth']
+        while depth != depth_limit and len(edge) > 0:
+            edge_tx = np.searchsorted(tx_adr_ptr, edge, side='right') - 1
+            new = tx_depth[edge_tx] < 0  # rows of transactions not tainted yet
+            new_edge = edge[new]
+            edge_tainted[new_edge] = True
+            tx_depth[edge_tx[new]] = depth
+            adr = np.unique(tx_adr[edge])
+            done[adr] = True
+            if stop is not None:
+                adr = adr[~stop[adr]]
+            tx = np.unique(adr_tx[csr_edge(adr_tx_ptr, adr)])
+            edge = csr_edge(tx_adr_ptr, tx)
+            edge = edge[~done[tx_adr[edge]]]
+            if blocked is not None:
+                edge = edge[~blocked[tx_adr[edge]]]
+            depth += 1
+            state.update({'edge': edge, 'depth': depth})
+            yield new_edge, depth - 1
+
+    def search(self, target_adr, depth_limit=-1, backward=False, blocked=None, state=None, checkpoint=None, stop=None):
+        """
+        Address taint search level by level as in TaintedTX.adr_taint_search.
+        The search starts from the addresses of the outputs of transactions paying the targets. Forward, each level takes the transactions
+        spending from the addresses found and their outputs to addresses not searched yet; backward, the transactions paying the addresses
+        and their inputs.
+
+        :param target_adr: List of adr index to start from.
+        :param depth_limit: Limit how many depth to search, -1 for no limit.
+        :param backward: Run the search backward instead of forward.
+        :param blocked: Optional boolean array over the address nodes, blocked addresses are not tainted and do not spread taint.
+        :param state: Optional dictionary from an earlier search to continue.
+        :param checkpoint: Optional function called with the state dictionary after every level.
+        :param stop: Optional boolean array over the address nodes, addresses tainted but not followed (e.g., a hub of utility.hub_summary).
+
+        :return: State dictionary, 'tx_depth' is the level of each tx node (-1 for untainted), 'edge_tainted' marks the tainted
+        tx to address edges of the search direction and 'start_adr' holds the starting address nodes.
+        """
+
+        if state is None:
+            state = self.start(target_adr, backward)
+        for _ in self.search_level(state, depth_limit, backward, blocked, stop):
+            if checkpoint is not None:
+                checkpoint(state)
+        return state
+
+    def tainted_pair(self, state, backward=False, edge=None):
+        """
+        Tainted (tx index, adr index, level) of a search state, one item per tainted edge.
+
+        :param state: State dictionary from search.
+        :param backward: Direction of the search.
+        :param edge: Optional array of tainted edges to describe (e.g., the edges of one level from search_level), default is every tainted edge.
+
+        :return: DataFrame with tx_index, adr_index and depth columns.
+        """
+
+        _, _, tx_adr_ptr, tx_adr = self.direction(backward)
+        if edge is None:
+            edge = np.flatnonzero(state['edge_tainted'])
+        edge_tx = np.searchsorted(tx_adr_ptr, edge, side='right') - 1
+        return pd.DataFrame({'tx_index': np.asarray(self.node_tx)[edge_tx], 'adr_index': np.asarray(self.node_adr)[np.asarray(tx_adr)[edge]],
+                             'depth': state['tx_depth'][edge_tx]})
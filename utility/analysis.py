@@ -37,26 +37,17 @@ def tx_analysis(taintedtx, case_name, poison_df=None, tx_tainted=None, service_a
 
     tx_input = taintedtx.tx_input
     if len(tx_input) == 0:
-        tx_input = pd.DataFrame()
-        for year in taintedtx.yearlist:
-            temp_tx_input = read_option(taintedtx.input_filename, taintedtx.path + str(year) + '/')
-            temp_tx_input = temp_tx_input[temp_tx_input['tx_index'].isin(tx_tainted.index)]
-            tx_input = tx_input.append(temp_tx_input)
-        del temp_tx_input
+        tx_input = taintedtx.read_partitions('tx_input.csv', taintedtx.partition_list, isin=('tx_index', list(set(tx_tainted.index))))
 
     tx_height = taintedtx.tx_height
     if len(taintedtx.tx_height) == 0:
-        tx_height = pd.DataFrame()
-
-        for index, txrange in enumerate(taintedtx.tx_range_list):
+        partition_list = []
+        for index, txrange in enumerate(taintedtx.partition_range_list):
             if txrange[1] >= tx_tainted.index[0]:
-                temp_tx_height = read_option(taintedtx.txheight_filename, taintedtx.path + str(taintedtx.yearlist[index]) + '/')
-                tx_height = tx_height.append(temp_tx_height)
+                partition_list.append(taintedtx.partition_list[index])
             if tx_tainted.index[-1] <= txrange[1]:
                 break
-        del temp_tx_height
-
-    block = read_option(taintedtx.block_filename, taintedtx.path)
+        tx_height = taintedtx.read_partitions('tx_height.csv', partition_list)
 
     new_tx_tainted = pd.DataFrame(
         columns=['total_address', 'reuse_adr', 'fresh_reuse_adr', 'fresh_adr',
@@ -76,22 +67,23 @@ def tx_analysis(taintedtx, case_name, poison_df=None, tx_tainted=None, service_a
     # Frequency
     frequency = []
     last_tx_list = []
-    first_tx_list = []
     start_tx = tx_tainted.index[0]
-    start_block = tx_height[tx_height.index == start_tx]['block_index'].values[0]
-    start_time = block[block.index == start_block]['time'].values
+    first_tx_list = [start_tx]  # the first day starts from the first tainted transaction
+    time_index = taintedtx.get_time_index()
+    start_time = time_index.tx_time([start_tx])[0]
     for i in range(1, 15 + 1):
         end_time = start_time + np.timedelta64(i, 'D')
-        start_txday = \
-            tx_height[tx_height['block_index'] == block['time'].loc[block['time'].dt.date == np.datetime64(end_time[0], 'D')].index[0]].index[0]
-        end_txday = \
-            tx_height[tx_height['block_index'] == block['time'].loc[block['time'].dt.date == np.datetime64(end_time[0], 'D')].index[-1]].index[-1]
+        day_range = time_index.day_range_tx(end_time)
+        if day_range is None:  # no block in the day, placeholder keeps the lists aligned by day
+            day_range = [None, None]
+        start_txday, end_txday = day_range
         last_tx_list.append(end_txday)
         if i != 1:
             first_tx_list.append(start_txday)
-        else:
-            first_tx_list.append(start_tx)
     for this_index, last_tx in enumerate(last_tx_list):
+        if last_tx is None:  # no transaction in the day
+            frequency.append(0)
+            continue
         first_tx = first_tx_list[this_index]
         df = tx_tainted[tx_tainted.index >= first_tx]
         df = df[df.index <= last_tx]
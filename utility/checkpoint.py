@@ -0,0 +1,118 @@
+import logging
+import os.path
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+logging.getLogger().setLevel(logging.INFO)
+pd.options.mode.chained_assignment = None  # default='warn'
+
+checkpoint_suffix = '_checkpoint'  # checkpoint folder e.g., taintresults/case1tx_taintedNone_checkpoint/
+state_filename = 'state.npz'
+chunk_filename = 'chunk_%06d.npz'
+bit_prefix = 'bits_'  # boolean arrays are stored packed, 8 per byte
+default_interval = 600  # seconds between saves
+
+
+class Checkpoint(object):
+    def __init__(self, path, interval=default_interval):
+        """
+        Binary checkpoint of a long search: a state file with the frontier and visited sets, replaced at every save,
+        and one chunk file per save with only the results found since the previous save.
+        A run continues from the last complete save without searching again.
+
+        :param path: Folder path of the checkpoint e.g., 'taintresults/case1tx_taintedNone_checkpoint/'.
+        :param interval: Seconds between saves, None to save only when save is called with force=True.
+        """
+
+        self.path = path
+        self.interval = interval
+        self.last_save = time.time()
+        self.chunk_count = 0
+        self.saved_mask = {}  # results already in a chunk, by result name
+
+    def exists(self):
+        """Check if a complete save is in the checkpoint folder"""
+        return os.path.isfile(os.path.join(self.path, state_filename))
+
+    def due(self):
+        """Check if interval seconds have passed since the last save"""
+        return self.interval is not None and time.time() - self.last_save >= self.interval
+
+    def new_item(self, name, found):
+        """
+        Items of a result not saved yet, marked as saved.
+
+        :param name: Result name.
+        :param found: Boolean array of the items in the result now.
+
+        :return: Array of positions of the new items.
+        """
+
+        if name not in self.saved_mask:
+            self.saved_mask[name] = np.zeros(len(found), dtype=bool)
+        new = np.flatnonzero(found & ~self.saved_mask[name])
+        self.saved_mask[name][new] = True
+        return new
+
+    def save(self, state, chunk, force=False):
+        """
+        Write a chunk of new results and then the state, the state file is replaced in one step so a stopped save leaves the previous one usable.
+
+        :param state: Dictionary of arrays and numbers describing where the search is.
+        :param chunk: Dictionary of arrays with the results found since the previous save.
+        :param force: Save even if the interval has not passed.
+
+        :return: True if saved.
+        """
+
+        if not force and not self.due():
+            return False
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        np.savez(os.path.join(self.path, chunk_filename % self.chunk_count), **chunk)
+        self.chunk_count += 1
+        array_dict = {'chunk_count': np.array(self.chunk_count)}
+        for key, value in state.items():
+            value = np.asarray(value)
+            if value.dtype == bool and value.ndim == 1:
+                array_dict[bit_prefix + key] = np.packbits(value)
+                array_dict[bit_prefix + key + '_length'] = np.array(len(value))
+            else:
+                array_dict[key] = value
+        temp_file = os.path.join(self.path, 'temp_' + state_filename)
+        np.savez(temp_file, **array_dict)
+        os.replace(temp_file, os.path.join(self.path, state_filename))
+        self.last_save = time.time()
+        logging.info('Checkpoint saved in ' + self.path)
+        return True
+
+    def load(self):
+        """
+        Read the last complete save.
+
+        :return: Tuple (state dictionary, chunk dictionary with the arrays of every chunk concatenated).
+        """
+
+        state = {}
+        with np.load(os.path.join(self.path, state_filename)) as data:
+            for key in data.files:
+                if key.startswith(bit_prefix) and not key.endswith('_length'):
+                    state[key[len(bit_prefix):]] = np.unpackbits(data[key])[:int(data[key + '_length'])].astype(bool)
+                elif not key.startswith(bit_prefix):
+                    state[key] = data[key]
+        self.chunk_count = int(state.pop('chunk_count'))
+        chunk = {}
+        for number in range(self.chunk_count):  # chunks after the state are from a stopped save
+            with np.load(os.path.join(self.path, chunk_filename % number)) as data:
+                for key in data.files:
+                    chunk.setdefault(key, []).append(data[key])
+        chunk = {key: np.concatenate(value) for key, value in chunk.items()}
+        self.last_save = time.time()
+        return state, chunk
+
+    def remove(self):
+        """Delete the checkpoint folder"""
+        shutil.rmtree(self.path, ignore_errors=True)
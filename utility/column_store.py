@@ -0,0 +1,276 @@
+import logging
+import os.path
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from utility import utility_function
+from utility import columnar
+from utility import partition
+
+logging.getLogger().setLevel(logging.INFO)
+pd.options.mode.chained_assignment = None  # default='warn'
+
+read_option = utility_function.read_option
+find_file = utility_function.find_file
+
+store_suffix = '_npy'  # column store folder of a data file e.g., 2009/tx_output_npy/
+chunk_prefix = 'part_'  # chunk folders of rows appended to the store e.g., 2009/tx_output_npy/part_1/
+no_spent = -1  # spent_index value of unspent outputs in the column store
+
+# columns kept in the column store, the first column is the dataframe index
+store_column = {
+    'tx_output': ['output_index', 'tx_index', 'adr_index', 'output_value', 'spent_index'],
+    'tx_input': ['output_index', 'tx_index', 'adr_index', 'input_value', 'spent_index'],
+}
+
+
+def write_column_store(df, table_name, path):
+    """
+    Write a tx_input or tx_output dataframe as one flat int64 .npy file per column, rows are sorted by tx_index.
+
+    :param df: Dataframe of tx_input or tx_output.
+    :param table_name: Either 'tx_input' or 'tx_output'.
+    :param path: Folder path of the partition e.g., 'sampledata/2009/'.
+
+    :return: Number of rows written.
+    """
+
+    store_path = os.path.join(path, table_name + store_suffix)
+    if not os.path.isdir(store_path):
+        os.makedirs(store_path)
+    for chunk_path in chunk_list(store_path)[1:]:  # the new store holds every row
+        shutil.rmtree(chunk_path)
+    df = df.reset_index()
+    if not df['tx_index'].is_monotonic_increasing:
+        df = df.sort_values('tx_index', kind='stable')
+    for column in store_column[table_name]:
+        values = df[column].fillna(no_spent).values.astype('int64') if column == 'spent_index' else df[column].values.astype('int64')
+        np.save(os.path.join(store_path, column + '.npy'), values)
+    return len(df)
+
+
+def append_column_store(df, table_name, path):
+    """
+    Add rows of new transactions after the column store of a partition as a new chunk folder (part_N/), the existing files are not changed.
+    The store is created if the partition has none.
+
+    :param df: Dataframe of tx_input or tx_output with tx_index after the last tx_index of the store.
+    :param table_name: Either 'tx_input' or 'tx_output'.
+    :param path: Folder path of the partition e.g., 'sampledata/2009/'.
+
+    :return: Number of rows written.
+    """
+
+    if not has_column_store(table_name, path):
+        return write_column_store(df, table_name, path)
+    store_path = os.path.join(path, table_name + store_suffix)
+    chunk_path = os.path.join(store_path, chunk_prefix + str(len(chunk_list(store_path))))
+    if not os.path.isdir(chunk_path):
+        os.makedirs(chunk_path)
+    df = df.reset_index()
+    if not df['tx_index'].is_monotonic_increasing:
+        df = df.sort_values('tx_index', kind='stable')
+    for column in store_column[table_name]:
+        values = df[column].fillna(no_spent).values.astype('int64') if column == 'spent_index' else df[column].values.astype('int64')
+        np.save(os.path.join(chunk_path, column + '.npy'), values)
+    return len(df)
+
+
+def chunk_list(store_path):
+    """Folders of the column store in tx_index order: the store folder then its chunk folders (part_1/, part_2/, ...)"""
+    if not os.path.isdir(store_path):
+        return [store_path]
+    number_list = [int(name[len(chunk_prefix):]) for name in os.listdir(store_path)
+                   if name.startswith(chunk_prefix) and name[len(chunk_prefix):].isdigit() and os.path.isdir(os.path.join(store_path, name))]
+    return [store_path] + [os.path.join(store_path, chunk_prefix + str(number)) for number in sorted(number_list)]
+
+
+def patch_spent(spent_index, output_index, spent):
+    """
+    Apply the spent_index patch of a partition (utility.utility_function.load_spent_patch) to its memory-mapped spent_index,
+    the column is copied and patched in memory when the patch has any of its outputs and the store files are never written.
+
+    :param spent_index: spent_index array of the store.
+    :param output_index: output_index array of the store.
+    :param spent: Series of spending tx_index with output_index as index, or None.
+
+    :return: spent_index array with the patch applied.
+    """
+
+    if spent is None or len(spent) == 0:
+        return spent_index
+    found = np.flatnonzero(np.isin(output_index, spent.index.values))
+    if len(found) == 0:
+        return spent_index
+    values = spent.reindex(output_index[found]).values.astype('int64')
+    spent_index = np.array(spent_index)
+    spent_index[found] = values
+    return spent_index
+
+
+def build_column_store(path, table_list=('tx_output', 'tx_input')):
+    """
+    Build the memory-mapped column store for every partition (year or month folder) of a dataset.
+
+    :param path: String of folder path of the dataset e.g., 'sampledata/'.
+    :param table_list: Data files to store.
+
+    :return: DataFrame with the number of rows stored for each folder and file.
+    """
+
+    stored = pd.DataFrame(columns=['folder', 'file', 'rows'])
+    for this_partition in partition.find_partition(path):
+        for table_name in table_list:
+            folder = os.path.join(path, this_partition)
+            file_name = find_file(table_name + '.csv', folder)
+            if not os.path.isfile(os.path.join(folder, file_name)):
+                continue
+            logging.info('storing ' + this_partition + table_name)
+            rows = write_column_store(read_option(file_name, folder), table_name, folder)
+            stored.loc[len(stored)] = [this_partition, table_name, rows]
+    return stored
+
+
+def has_column_store(table_name, path):
+    """Check if the partition folder in path has the column store of table_name"""
+    return os.path.isfile(os.path.join(path, table_name + store_suffix, store_column[table_name][0] + '.npy'))
+
+
+class ColumnStore(object):
+    def __init__(self, table_name, part_list):
+        """
+        Zero-copy view over the memory-mapped columns of tx_input or tx_output.
+        Arrays are opened with mmap_mode='r' so the data stays in the OS page cache and is shared by every process reading the same files.
+
+        :param table_name: Either 'tx_input' or 'tx_output'.
+        :param part_list: List of dictionaries (one per partition) of column name to array.
+        """
+
+        self.table_name = table_name
+        self.part_list = part_list
+
+    @classmethod
+    def open(cls, table_name, path_list, columns=None):
+        """
+        Open the column store of several partitions, with their appended chunks and the spent_index patch of tx_output applied.
+
+        :param table_name: Either 'tx_input' or 'tx_output'.
+        :param path_list: List of partition folder paths in tx_index order.
+        :param columns: Optional list of columns to open, default is all stored columns.
+
+        :return: ColumnStore of the partitions.
+        """
+
+        if columns is None:
+            columns = store_column[table_name]
+        part_list = []
+        for path in path_list:
+            spent = utility_function.load_spent_patch(path) if table_name == 'tx_output' and 'spent_index' in columns else None
+            for chunk_path in chunk_list(os.path.join(path, table_name + store_suffix)):  # appended chunks are parts of their own
+                part = {column: np.load(os.path.join(chunk_path, column + '.npy'), mmap_mode='r') for column in columns}
+                if spent is not None:
+                    part['spent_index'] = patch_spent(part['spent_index'], np.load(os.path.join(chunk_path, 'output_index.npy'), mmap_mode='r'), spent)
+                part_list.append(part)
+        return cls(table_name, part_list)
+
+    def __len__(self):
+        return sum([len(next(iter(part.values()))) for part in self.part_list if len(part) > 0])
+
+    def tx_range(self):
+        """First and last tx_index of the store, None for an empty store"""
+        part_list = [part for part in self.part_list if len(part['tx_index']) > 0]
+        if len(part_list) == 0:
+            return None
+        return [int(part_list[0]['tx_index'][0]), int(part_list[-1]['tx_index'][-1])]
+
+    def window(self, first_tx=None, last_tx=None):
+        """
+        Slice every partition to the rows with first_tx <= tx_index <= last_tx, the slices are still views of the files.
+
+        :param first_tx: First tx_index to keep, None for no lower bound.
+        :param last_tx: Last tx_index to keep, None for no upper bound.
+
+        :return: ColumnStore of the slices.
+        """
+
+        part_list = []
+        for part in self.part_list:
+            tx_index = part['tx_index']
+            start = 0 if first_tx is None else np.searchsorted(tx_index, first_tx, side='left')
+            end = len(tx_index) if last_tx is None else np.searchsorted(tx_index, last_tx, side='right')
+            if end > start:
+                part_list.append({column: values[start:end] for column, values in part.items()})
+        return ColumnStore(self.table_name, part_list)
+
+    def select(self, column, values):
+        """
+        Keep only the rows where column is in values.
+
+        :param column: Column name e.g., 'tx_index'.
+        :param values: Array like of values to keep.
+
+        :return: ColumnStore of the selected rows (copies of the matching rows only).
+        """
+
+        values = np.asarray(values)
+        part_list = []
+        for part in self.part_list:
+            found = np.isin(part[column], values)
+            part_list.append({this_column: this_values[found] for this_column, this_values in part.items()})
+        return ColumnStore(self.table_name, part_list)
+
+    def take(self, position):
+        """
+        Keep only the rows at positions of the whole store (partitions one after another).
+
+        :param position: Sorted array of row positions.
+
+        :return: ColumnStore of the rows (copies of the rows only).
+        """
+
+        position = np.asarray(position, dtype='int64')
+        part_list = []
+        first = 0
+        for part in self.part_list:
+            length = len(next(iter(part.values()))) if len(part) > 0 else 0
+            start, end = np.searchsorted(position, [first, first + length])
+            part_list.append({column: values[position[start:end] - first] for column, values in part.items()})
+            first += length
+        return ColumnStore(self.table_name, part_list)
+
+    def column(self, column):
+        """
+        Get one column of the whole store as a single array.
+
+        :param column: Column name.
+
+        :return: Array view when the store has a single partition, otherwise a concatenated copy.
+        """
+
+        if len(self.part_list) == 1:
+            return self.part_list[0][column]
+        if len(self.part_list) == 0:
+            return np.array([], dtype='int64')
+        return np.concatenate([part[column] for part in self.part_list])
+
+    def to_frame(self, columns=None, schema='default'):
+        """
+        Materialise the store into the same dataframe as the tx_input or tx_output file read.
+
+        :param columns: Optional list of columns, the index column is always included.
+        :param schema: Dtype schema of the dataframe, either 'default' or 'compact' (see utility.columnar).
+
+        :return: Dataframe copy of the store.
+        """
+
+        index_name = store_column[self.table_name][0]
+        if columns is None:
+            columns = store_column[self.table_name][1:]
+        df = pd.DataFrame({column: np.array(self.column(column)) for column in [index_name] + [column for column in columns if column != index_name]})
+        df = df.set_index(index_name)
+        if 'spent_index' in df.columns and self.table_name == 'tx_output':
+            df['spent_index'] = df['spent_index'].astype('float64')
+            df.loc[df['spent_index'] == no_spent, 'spent_index'] = np.nan
+        return columnar.apply_schema(df, self.table_name, schema)
@@ -0,0 +1,183 @@
+import logging
+import os.path
+
+import numpy as np
+import pandas as pd
+
+from utility import utility_function
+from utility import partition
+from utility import manifest
+
+logging.getLogger().setLevel(logging.INFO)
+pd.options.mode.chained_assignment = None  # default='warn'
+
+read_option = utility_function.read_option
+write_option = utility_function.write_option
+
+# index name and column dtypes of each blockchain data file, same as the csv read (output spent_index is float as unspent outputs are NaN)
+table_schema = {
+    'tx_input': ['output_index', {'tx_index': 'int64', 'adr_index': 'int64', 'input_value': 'int64', 'spent_index': 'int64'}],
+    'tx_output': ['output_index', {'tx_index': 'int64', 'adr_index': 'int64', 'output_value': 'int64', 'spent_index': 'float64'}],
+    'tx_height': ['tx_index', {'block_index': 'int64'}],
+    'tx_hash': ['tx_index', {'tx_hash': 'str'}],
+    'adr_hash': ['adr_index', {'adr_hash': 'str'}],
+    'tx_range': ['year', {'first_tx': 'int64', 'last_tx': 'int64'}],
+    'month_range': ['month', {'first_tx': 'int64', 'last_tx': 'int64'}],
+    'block': ['block_index', {'time': 'datetime64[ns]'}],
+}
+
+# compact in-memory schema: narrowest integer widths safe for the whole bitcoin chain (tx and block index below 2^32),
+# adr_index narrowed when the values of the file fit (checked, int64 otherwise), values kept int64 (satoshi amounts pass 2^32),
+# nullable spent_index for unspent outputs, address type (adr_index % 10) as its own column and categorical repeated strings.
+# An index that steps evenly (tx_index of tx_height) becomes a RangeIndex, other indexes stay int64 as pandas 1.x has no 32 bit index.
+# On the sampledata 2009 files the compact frames use 0.72 (tx_input), 0.75 (tx_output) and 0.25 (tx_height) of the default memory (memory_report):
+# the int64 output_index index and the satoshi value columns are most of what is left.
+compact_schema = {
+    'tx_input': ['output_index', {'tx_index': 'uint32', 'adr_index': 'uint32', 'input_value': 'int64', 'spent_index': 'uint32', 'adr_type': 'uint8'}],
+    'tx_output': ['output_index', {'tx_index': 'uint32', 'adr_index': 'uint32', 'output_value': 'int64', 'spent_index': 'UInt32', 'adr_type': 'uint8'}],
+    'tx_height': ['tx_index', {'block_index': 'uint32'}],
+    'tx_hash': ['tx_index', {'tx_hash': 'str'}],
+    'adr_hash': ['adr_index', {'adr_hash': 'str'}],
+    'tx_range': ['year', {'first_tx': 'int64', 'last_tx': 'int64'}],
+    'month_range': ['month', {'first_tx': 'int64', 'last_tx': 'int64'}],
+    'block': ['block_index', {'time': 'datetime64[ns]', 'miner': 'category'}],
+}
+schema_dict = {'default': table_schema, 'compact': compact_schema}
+
+year_file_list = ['tx_input', 'tx_output', 'tx_height', 'tx_hash', 'adr_hash']
+root_file_list = ['tx_range', 'block']
+
+
+def apply_schema(df, table_name, schema='default'):
+    """
+    Cast dataframe index and columns to the dtypes of table_schema or compact_schema.
+    Integer columns with values out of the range of the compact dtype are kept as int64, the compact schema turns an evenly stepping index into a RangeIndex.
+
+    :param df: Dataframe read from a blockchain data file.
+    :param table_name: File name without extension e.g., 'tx_output'.
+    :param schema: Either 'default' (same dtypes as the csv read) or 'compact' (see compact_schema).
+
+    :return: Dataframe with the schema dtypes, columns not found in the schema are kept as they are.
+    """
+
+    if schema not in schema_dict:
+        raise Exception('Unknown schema: use "default" or "compact"')
+    index_name, dtype_dict = schema_dict[schema][table_name]
+    df.index = df.index.astype('int64')
+    if schema == 'compact':
+        df.index = range_index(df.index)
+    df.index.names = [index_name]
+    if 'adr_type' in dtype_dict and 'adr_type' not in df.columns and 'adr_index' in df.columns:
+        df['adr_type'] = df['adr_index'] % 10
+    dtype_dict = {column: dtype for column, dtype in dtype_dict.items() if column in df.columns}
+    for column, dtype in dtype_dict.items():
+        if pd.api.types.is_integer_dtype(dtype) and len(df) > 0:
+            values = df[column]
+            if not (safe_integer(values.min(), dtype) and safe_integer(values.max(), dtype)):
+                logging.warning(table_name + ' ' + column + ' exceeds ' + dtype + ', kept as int64')
+                dtype_dict[column] = 'Int64' if values.isna().any() else 'int64'
+    return df.astype(dtype_dict)
+
+
+def range_index(index):
+    """RangeIndex with the same values as an int64 index stepping evenly (e.g., tx_index of tx_height), which takes no memory, the index itself otherwise"""
+    if len(index) < 2:
+        return index
+    values = index.values
+    step = values[1] - values[0]
+    if step == 0 or not (np.diff(values) == step).all():
+        return index
+    return pd.RangeIndex(values[0], values[-1] + step, step, name=index.name)
+
+
+def safe_integer(value, dtype):
+    """Check if value (NaN is always safe) fits in the integer dtype"""
+    if pd.isna(value):
+        return True
+    info = np.iinfo(pd.api.types.pandas_dtype(dtype).type)
+    return info.min <= value <= info.max
+
+
+def memory_report(df_dict, schema='compact'):
+    """
+    Compare the memory use of tables in the default schema and in another schema.
+
+    :param df_dict: Dictionary of table name (e.g., 'tx_output') to dataframe.
+    :param schema: Schema to compare with the default schema.
+
+    :return: DataFrame with rows and memory in MB of each table before (default) and after (schema).
+    """
+
+    report = pd.DataFrame(columns=['table', 'rows', 'default_mb', schema + '_mb', 'ratio'])
+    for table_name, df in df_dict.items():
+        before = apply_schema(df.drop(columns=['adr_type'], errors='ignore'), table_name, 'default').memory_usage(index=True, deep=True).sum() / 1e6
+        after = apply_schema(df.copy(), table_name, schema).memory_usage(index=True, deep=True).sum() / 1e6
+        report.loc[len(report)] = [table_name, len(df), before, after, after / before if before > 0 else np.nan]
+    return report
+
+
+def convert_file(table_name, path, out_path, file_format='.parquet', row_group_size=1000000):
+    """
+    Convert one csv blockchain data file to a typed columnar file.
+
+    :param table_name: File name without extension e.g., 'tx_output'.
+    :param path: Folder path of the csv file.
+    :param out_path: Folder path for the converted file.
+    :param file_format: Either '.parquet' or '.feather'.
+    :param row_group_size: Number of rows in each parquet row group, smaller groups let filtered reads skip more data.
+
+    :return: Number of rows converted, None if the csv file does not exist.
+    """
+
+    if not os.path.isfile(os.path.join(path, table_name + '.csv')):
+        return None
+    df = apply_schema(read_option(table_name + '.csv', path), table_name)
+    if not os.path.isdir(out_path):
+        os.makedirs(out_path)
+    if file_format == '.parquet':
+        df.to_parquet(os.path.join(out_path, table_name + file_format), index=True, row_group_size=row_group_size)
+    else:
+        write_option(df, table_name + file_format, out_path)
+    for part_file in utility_function.part_file_list(table_name + file_format, out_path):  # rows appended to the replaced file
+        os.remove(os.path.join(out_path, part_file))
+    return len(df)
+
+
+def convert_dataset(path, out_path=None, file_format='.parquet', row_group_size=1000000):
+    """
+    Rewrite a year folder (the sampledata layout) or month folder dataset into a typed columnar format.
+    TaintedTX reads the converted files instead of the csv files whenever both exist in the same folder.
+    The manifest of the converted dataset is written at the end (see utility.manifest).
+
+    :param path: String of folder path of the csv dataset e.g., 'sampledata/'.
+    :param out_path: String of folder path for the converted dataset, None to write next to the csv files.
+    :param file_format: Either '.parquet' (default, supports filtered reads) or '.feather'.
+    :param row_group_size: Number of rows in each parquet row group.
+
+    :return: DataFrame with the number of rows converted for each folder and file.
+    """
+
+    if file_format not in ('.parquet', '.feather'):
+        raise Exception('Unknown file format: use ".parquet" or ".feather"')
+    if out_path is None:
+        out_path = path
+
+    converted = pd.DataFrame(columns=['folder', 'file', 'rows'])
+    for table_name in root_file_list:
+        rows = convert_file(table_name, path, out_path, file_format, row_group_size)
+        if rows is not None:
+            converted.loc[len(converted)] = ['', table_name, rows]
+
+    partition_list = partition.find_partition(path)
+    for year in sorted(set([this_partition.split('/')[0] for this_partition in partition_list if this_partition.count('/') > 1])):
+        rows = convert_file('month_range', os.path.join(path, year), os.path.join(out_path, year), file_format, row_group_size)
+        if rows is not None:
+            converted.loc[len(converted)] = [year + '/', 'month_range', rows]
+    for this_partition in partition_list:
+        for table_name in year_file_list:
+            logging.info('converting ' + this_partition + table_name)
+            rows = convert_file(table_name, os.path.join(path, this_partition), os.path.join(out_path, this_partition), file_format, row_group_size)
+            if rows is not None:
+                converted.loc[len(converted)] = [this_partition, table_name, rows]
+    manifest.build_manifest(out_path)
+    return converted
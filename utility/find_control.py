@@ -30,19 +30,20 @@ def find_control(taintedtx, target_list, search_type, value, limit_option, input
         taintedtx.prepare_data(tx=target_list, limit_option=[np.timedelta64(1, 'D'), limit_option])
     elif search_type == 'adr':
         taintedtx.prepare_data(adr=target_list, limit_option=[np.timedelta64(1, 'D'), limit_option])
-    block = read_option(taintedtx.block_filename, taintedtx.path)
     logging.info('find control')
     start_tx = taintedtx.result['tx_index'].values[0]
     tx_input = taintedtx.tx_input[taintedtx.tx_input.index < start_tx]
     tx_output = taintedtx.tx_output[taintedtx.tx_output.index < start_tx]
-    start_block = taintedtx.tx_height[taintedtx.tx_height.index == start_tx]['block_index'].values
-    start_time = block[block.index == start_block[0]]['time'].values
+    time_index = taintedtx.get_time_index()
+    start_time = time_index.tx_time([start_tx])[0]
 
     after_time = start_time - np.timedelta64(1, 'D')  # remove 1 more day
-    after_tx = \
-        taintedtx.tx_height[
-            taintedtx.tx_height['block_index'] == block['time'].loc[block['time'].dt.date == np.datetime64(after_time[0], 'D')].index[
-                -1]].index[-1]
+    after_range = time_index.day_range_tx(after_time)
+    if after_range is None:  # no block in the day, until the nearest earlier block
+        after_range = time_index.time_range_tx(time_index.first_time(), after_time, whole_day=True)
+    if after_range is None:
+        raise Exception('No block found before ' + str(after_time)[:10] + ', the data must start at least one day before the target')
+    after_tx = after_range[1]
     tx_input = tx_input[tx_input.index <= after_tx]
     tx_output = tx_output[tx_output.index <= after_tx]
 
@@ -67,13 +68,7 @@ def find_control(taintedtx, target_list, search_type, value, limit_option, input
     df3 = df3.drop(columns=['spent_index', 'adr_index'])
     df3 = df3.groupby('tx_index').sum()
     df2 = df3.iloc[(df3['input_value'] - (value * 100000000)).abs().argsort()]
-    df = pd.DataFrame()
-    for year in taintedtx.yearlist:
-        tx_hash = read_option(taintedtx.txhash_filename, taintedtx.path + str(year) + '/')
-        temp_hash = tx_hash[tx_hash.index.isin(df3.index)]
-        df = df.append(temp_hash)
-        if len(df) == len(df3):
-            break
+    df = taintedtx.tx_check('tx_index', df3.index.tolist())
     df = df.reindex(df2.index)
 
     if case_name is not None:
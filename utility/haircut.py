@@ -0,0 +1,154 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from utility import spend_graph
+
+logging.getLogger().setLevel(logging.INFO)
+pd.options.mode.chained_assignment = None  # default='warn'
+
+csr_edge = spend_graph.csr_edge
+lookup_node = spend_graph.lookup_node
+
+
+def group_pointer(group, group_count):
+    """
+    Stable order of items by group and the row pointer of each group in that order.
+
+    :param group: Group number of each item, -1 for items in no group.
+    :param group_count: Number of groups.
+
+    :return: Tuple (item positions in group order, row pointer array of length group_count + 1).
+    """
+
+    order = np.flatnonzero(group >= 0)
+    order = order[np.argsort(group[order], kind='stable')]
+    indptr = np.zeros(group_count + 1, dtype='int64')
+    np.cumsum(np.bincount(group[order], minlength=group_count), out=indptr[1:])
+    return order, indptr
+
+
+def topological_level(link_src, link_dst, node_count):
+    """
+    Topological levels of a directed acyclic graph, a node is in the level after the last node linking to it.
+
+    :param link_src: Source node of each link.
+    :param link_dst: Destination node of each link.
+    :param node_count: Number of nodes.
+
+    :return: List of sorted node arrays, the first one has the nodes without incoming links.
+    """
+
+    link = np.unique(np.stack([link_src, link_dst], axis=1).astype('int64').reshape(-1, 2), axis=0)
+    link_order, link_ptr = group_pointer(link[:, 0], node_count)
+    link_dst = link[link_order, 1]
+    in_degree = np.bincount(link[:, 1], minlength=node_count)
+    level_list = []
+    level = np.flatnonzero(in_degree == 0)
+    while len(level) > 0:
+        level_list.append(level)
+        in_degree -= np.bincount(link_dst[csr_edge(link_ptr, level)], minlength=node_count)
+        in_degree[level] = -1
+        level = np.flatnonzero(in_degree == 0)
+    return level_list
+
+
+def input_match(tx_input, pending_tx, feed_node, feed_adr):
+    """
+    Inputs of the pending transactions matching each tainted output they spend by address, as the left merge of TaintedTX.haircut_distribute.
+
+    :param tx_input: tx_input dataframe.
+    :param pending_tx: Sorted array of tx index to distribute.
+    :param feed_node: Position in pending_tx of the transaction spending each tainted output.
+    :param feed_adr: adr index of each tainted output.
+
+    :return: Tuple (number of matching inputs, sum of their input_value) for each tainted output.
+    """
+
+    input_node = lookup_node(pending_tx, tx_input['tx_index'].values)
+    found = input_node >= 0
+    input_node = input_node[found]
+    input_adr = tx_input['adr_index'].values.astype('int64')[found]
+    base = int(max(input_adr.max(initial=0), feed_adr.max(initial=0))) + 1  # one key per (transaction, address)
+    key, inverse = np.unique(input_node * base + input_adr, return_inverse=True)
+    count = np.bincount(inverse, minlength=len(key))
+    value = np.bincount(inverse, weights=tx_input['input_value'].values.astype('float64')[found], minlength=len(key))
+
+    position = lookup_node(key, feed_node * base + feed_adr)
+    hit = position >= 0
+    match_count, match_value = np.zeros(len(feed_node), dtype='int64'), np.zeros(len(feed_node))
+    match_count[hit], match_value[hit] = count[position[hit]], value[position[hit]]
+    return match_count, match_value
+
+
+def haircut_taint(tx_tainted, tx_input, test=0):
+    """
+    Haircut distribution of every tainted transaction without a taint_value, the batch version of TaintedTX.haircut_distribute.
+    The transactions are put into topological levels once (a transaction is in the level after the last transaction it spends from),
+    each level is distributed with grouped numpy operations on the taint already distributed to its inputs, and the rounding is fixed
+    with the same rule as haircut_distribute (the difference is added in steps to the outputs in order), so each output gets the same taint_value
+    as calling haircut_distribute one transaction after another in tx index order.
+
+    :param tx_tainted: DataFrame from tx_taint_search, rows without taint_value are distributed.
+    :param tx_input: tx_input data.
+    :param test: Number to limit how many transactions to distribute (in tx index order), 0 means all.
+
+    :return: DataFrame of tx_tainted with taint_value and clean_value, transactions not distributed have taint_value 0.
+    """
+
+    tx_tainted = tx_tainted.copy()
+    row_tx = tx_tainted['tx_index'].values.astype('int64')
+    row_adr = tx_tainted['adr_index'].values.astype('int64')
+    row_spent = tx_tainted['spent_index'].values.astype('float64')
+    output_value = tx_tainted['output_value'].values.astype('float64')
+    taint = tx_tainted['taint_value'].values.astype('float64')
+
+    pending_tx = np.unique(row_tx[np.isnan(taint)])
+    if test > 0:
+        pending_tx = pending_tx[:test]
+    node_count = len(pending_tx)
+    own_node = lookup_node(pending_tx, row_tx)
+    feed_node = lookup_node(pending_tx, np.where(np.isnan(row_spent), -1, row_spent))
+
+    own_order, own_ptr = group_pointer(own_node, node_count)  # outputs of each transaction, in dataframe order
+    feed_order, feed_ptr = group_pointer(feed_node, node_count)  # tainted outputs each transaction spends
+
+    match_count, match_value = input_match(tx_input, pending_tx, feed_node[feed_order], row_adr[feed_order])
+    feed_group = feed_node[feed_order]
+    merge_output = np.bincount(feed_group, weights=output_value[feed_order] * np.maximum(match_count, 1), minlength=node_count)
+    merge_input = np.bincount(feed_group, weights=match_value, minlength=node_count)
+    fee_value = merge_output - merge_input
+
+    source = own_node[feed_order]  # spending links between pending transactions
+    level_list = topological_level(source[source >= 0], feed_group[source >= 0], node_count)
+    for level in level_list:
+        feed = feed_order[csr_edge(feed_ptr, level)]
+        feed_level = np.repeat(np.arange(len(level)), feed_ptr[level + 1] - feed_ptr[level])
+        input_taint = np.bincount(feed_level, weights=np.nan_to_num(taint[feed]), minlength=len(level))
+        fee, input_sum = fee_value[level], merge_input[level]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            input_taint = np.where(fee > 0, np.round(input_taint - (input_taint * (fee / input_sum))), input_taint)
+
+        out = own_order[csr_edge(own_ptr, level)]
+        out_count = own_ptr[level + 1] - own_ptr[level]
+        out_level = np.repeat(np.arange(len(level)), out_count)
+        output_sum = np.bincount(out_level, weights=output_value[out], minlength=len(level))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out_taint = np.round(output_value[out] * input_taint[out_level] / output_sum[out_level])
+            sum_fix = input_taint - np.bincount(out_level, weights=out_taint, minlength=len(level))
+            each_fix = np.round(sum_fix / out_count)
+            each_fix[each_fix == 0] = np.where(sum_fix[each_fix == 0] < 0, -1, 1)
+            how_many = np.round(sum_fix / each_fix)  # number of each_fix steps, given to the outputs in order and again from the first
+            rank = np.arange(len(out)) - np.repeat(np.cumsum(out_count) - out_count, out_count)  # position of the output in its transaction
+            step = how_many[out_level] // out_count[out_level] + (rank < how_many[out_level] % out_count[out_level])
+        fixed = (sum_fix != 0) & ~np.isnan(sum_fix)
+        out_taint += np.where(fixed[out_level], each_fix[out_level] * step, 0)
+        taint[out] = out_taint
+    logging.info('Haircut of ' + str(node_count) + ' transactions in ' + str(len(level_list)) + ' levels')
+
+    distributed = own_node >= 0
+    tx_tainted['taint_value'] = taint
+    tx_tainted['clean_value'] = np.where(distributed, output_value - taint, tx_tainted['clean_value'].values)
+    tx_tainted = tx_tainted.fillna(value={'taint_value': 0})
+    return tx_tainted.sort_index()
@@ -0,0 +1,171 @@
+import logging
+import os.path
+
+import numpy as np
+import pandas as pd
+
+from utility import utility_function
+from utility import partition
+
+logging.getLogger().setLevel(logging.INFO)
+pd.options.mode.chained_assignment = None  # default='warn'
+
+read_option = utility_function.read_option
+find_file = utility_function.find_file
+index_folder = utility_function.index_folder
+
+# hash file and column names of each index kind
+hash_kind = {
+    'tx': ['tx_hash.csv', 'tx_index', 'tx_hash'],
+    'adr': ['adr_hash.csv', 'adr_index', 'adr_hash'],
+}
+
+
+def hash_key(hash_list):
+    """
+    Hash strings into uint64 keys for the sorted hash index.
+
+    :param hash_list: Array like of hash strings.
+
+    :return: Array of uint64 keys.
+    """
+
+    return pd.util.hash_array(np.asarray(hash_list, dtype=object))
+
+
+def build_hash_index(path, kind='tx'):
+    """
+    Build the on-disk hash to index lookup (and index to hash) from the tx_hash or adr_hash file of every partition.
+    Files are saved in the index folder of the dataset:
+    <kind>_hash_key.npy (sorted uint64 keys of the hashes) and <kind>_hash_index.npy (index of each key) for hash to index lookup,
+    <kind>_index.npy (sorted index) and <kind>_hash.npy (fixed width hash bytes of each index) for index to hash lookup.
+
+    :param path: String of folder path of the dataset e.g., 'sampledata/'.
+    :param kind: Either 'tx' or 'adr'.
+
+    :return: Number of hashes in the index.
+    """
+
+    file_name, index_name, hash_name = hash_kind[kind]
+    index_list = []
+    hash_list = []
+    for this_partition in partition.find_partition(path):
+        folder = os.path.join(path, this_partition)
+        this_file = find_file(file_name, folder)
+        if not os.path.isfile(os.path.join(folder, this_file)):
+            continue
+        logging.info('indexing ' + this_partition + this_file)
+        df = read_option(this_file, folder)
+        df.columns = [column.strip() for column in df.columns]
+        index_list.append(df.index.values.astype('int64'))
+        hash_list.append(df[hash_name].astype(str).values.astype(bytes))
+
+    index_array = np.concatenate(index_list) if len(index_list) > 0 else np.array([], dtype='int64')
+    hash_array = np.concatenate(hash_list) if len(hash_list) > 0 else np.array([], dtype='S1')
+    return save_hash_index(path, kind, index_array, hash_array)
+
+
+def append_hash_index(path, kind, df):
+    """
+    Add the hashes of new transactions or addresses to the hash index of the dataset, index already in the hash index are skipped.
+
+    :param path: String of folder path of the dataset e.g., 'sampledata/'.
+    :param kind: Either 'tx' or 'adr'.
+    :param df: Dataframe of tx_hash or adr_hash rows (index is tx_index or adr_index).
+
+    :return: Number of hashes in the index.
+    """
+
+    hash_name = hash_kind[kind][2]
+    load_path = os.path.join(path, index_folder)
+    index_array = np.concatenate([np.load(os.path.join(load_path, kind + '_index.npy')), df.index.values.astype('int64')])
+    hash_array = np.concatenate([np.load(os.path.join(load_path, kind + '_hash.npy')), df[hash_name].astype(str).values.astype(bytes)])
+    return save_hash_index(path, kind, index_array, hash_array)
+
+
+def save_hash_index(path, kind, index_array, hash_array):
+    """
+    Sort and save the hash index files of build_hash_index.
+
+    :param path: String of folder path of the dataset e.g., 'sampledata/'.
+    :param kind: Either 'tx' or 'adr'.
+    :param index_array: Array of int64 index.
+    :param hash_array: Array of hash bytes of each index.
+
+    :return: Number of hashes in the index.
+    """
+
+    index_array, first = np.unique(index_array, return_index=True)  # keep the first hash of duplicate index
+    hash_array = hash_array[first]
+
+    save_path = os.path.join(path, index_folder)
+    if not os.path.isdir(save_path):
+        os.makedirs(save_path)
+    key_array = hash_key(hash_array.astype(str))
+    order = np.argsort(key_array, kind='stable')
+    np.save(os.path.join(save_path, kind + '_hash_key.npy'), key_array[order])
+    np.save(os.path.join(save_path, kind + '_hash_index.npy'), index_array[order])
+    np.save(os.path.join(save_path, kind + '_index.npy'), index_array)
+    np.save(os.path.join(save_path, kind + '_hash.npy'), hash_array)
+    return len(index_array)
+
+
+def has_hash_index(path, kind='tx'):
+    """Check if the dataset in path has the hash index of kind"""
+    return os.path.isfile(os.path.join(path, index_folder, kind + '_hash.npy'))
+
+
+class HashIndex(object):
+    def __init__(self, path, kind='tx'):
+        """
+        Memory-mapped hash to index and index to hash lookup built with build_hash_index.
+
+        :param path: String of folder path of the dataset e.g., 'sampledata/'.
+        :param kind: Either 'tx' or 'adr'.
+        """
+
+        self.kind = kind
+        self.index_name = hash_kind[kind][1]
+        self.hash_name = hash_kind[kind][2]
+        load_path = os.path.join(path, index_folder)
+        self.key = np.load(os.path.join(load_path, kind + '_hash_key.npy'), mmap_mode='r')
+        self.key_index = np.load(os.path.join(load_path, kind + '_hash_index.npy'), mmap_mode='r')
+        self.index = np.load(os.path.join(load_path, kind + '_index.npy'), mmap_mode='r')
+        self.hash = np.load(os.path.join(load_path, kind + '_hash.npy'), mmap_mode='r')
+
+    def hash_to_index(self, hash_list):
+        """
+        Find the index of each hash.
+
+        :param hash_list: List of hash strings.
+
+        :return: DataFrame with index as the internal index and the hash column, hashes not found are left out.
+        """
+
+        hash_list = np.unique(np.asarray(hash_list, dtype=str))
+        key_list = hash_key(hash_list)
+        start = np.searchsorted(self.key, key_list, side='left')
+        count = np.searchsorted(self.key, key_list, side='right') - start
+        query = np.repeat(np.arange(len(hash_list)), count)  # more than one candidate only on key collision
+        position = np.repeat(start, count) + np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        found_index = np.asarray(self.key_index)[position]
+        found = np.asarray(self.hash)[np.searchsorted(self.index, found_index)] == hash_list.astype(bytes)[query]
+        df = pd.DataFrame({self.hash_name: hash_list[query[found]]}, index=pd.Index(found_index[found], name=self.index_name, dtype='int64'))
+        return df.sort_index()
+
+    def index_to_hash(self, index_list):
+        """
+        Find the hash of each index.
+
+        :param index_list: List of internal index.
+
+        :return: DataFrame with index as the internal index and the hash column, index not found are left out.
+        """
+
+        index_list = np.unique(np.asarray(index_list, dtype='int64'))
+        position = np.searchsorted(self.index, index_list)
+        position[position >= len(self.index)] = len(self.index) - 1
+        found = np.asarray(self.index)[position] == index_list if len(self.index) > 0 else np.zeros(len(index_list), dtype=bool)
+        df = pd.DataFrame({self.hash_name: np.asarray(self.hash)[position[found]].astype(str)},
+                          index=pd.Index(index_list[found], name=self.index_name))
+        return df
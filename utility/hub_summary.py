@@ -0,0 +1,228 @@
+import logging
+import os.path
+
+import numpy as np
+import pandas as pd
+
+from utility import utility_function
+
+logging.getLogger().setLevel(logging.INFO)
+pd.options.mode.chained_assignment = None  # default='warn'
+
+index_folder = utility_function.index_folder
+
+hub_summary_name = 'hub_summary'  # saved as index/hub_summary_<hub name>.npz
+hub_summary_column = ['adr', 'source_tx', 'cone_tx', 'max_source', 'rel_depth']
+
+
+def build_hub_summary(graph, adr_list, name):
+    """
+    Offline job summarizing what a hub (a high-fanout entity such as an exchange, given by its address set) reaches, from the forward spend graph.
+    The hub is taken as one pool of funds: its payments are the transactions spending any output paid to its addresses (source_tx)
+    and its cone is every transaction reachable from a payment. For each cone transaction the summary keeps the latest payment reaching it
+    (max_source), so the cone of the payments made from a tx index on is one comparison, and the distance from the nearest payment (rel_depth, payments are 1).
+
+    :param graph: utility.spend_graph.SpendGraph (forward) of the data to summarize, usually the whole dataset.
+    :param adr_list: List of adr index of the hub.
+    :param name: Name of the hub, used for saving.
+
+    :return: HubSummary object.
+    """
+
+    hub_adr = np.unique(np.asarray(adr_list, dtype='int64'))
+    node_tx, edge_dst, indptr = np.asarray(graph.node_tx), np.asarray(graph.edge_dst), np.asarray(graph.indptr)
+    source = np.unique(edge_dst[np.isin(graph.edge_adr, hub_adr)])
+    source = source[source >= 0]
+
+    rel_depth = np.full(len(node_tx), -1, dtype='int64')  # breadth first search from every payment
+    rel_depth[source] = 1
+    frontier, depth = source, 1
+    while len(frontier) > 0:
+        frontier = np.unique(edge_dst[graph.edge(frontier)])
+        frontier = frontier[frontier >= 0]
+        frontier = frontier[rel_depth[frontier] < 0]
+        depth += 1
+        rel_depth[frontier] = depth
+
+    max_source = np.full(len(node_tx), -1, dtype='int64')  # latest payment reaching each transaction, pushed until nothing changes
+    max_source[source] = node_tx[source]
+    frontier = source
+    while len(frontier) > 0:
+        edge = graph.edge(frontier)
+        value = np.repeat(max_source[frontier], indptr[frontier + 1] - indptr[frontier])
+        dst = edge_dst[edge]
+        value, dst = value[dst >= 0], dst[dst >= 0]
+        target = np.unique(dst)
+        before = max_source[target]
+        np.maximum.at(max_source, dst, value)
+        frontier = target[max_source[target] > before]
+
+    cone = np.flatnonzero(rel_depth > 0)
+    logging.info('Hub ' + str(name) + ': ' + str(len(source)) + ' payments, ' + str(len(cone)) + ' transactions in the cone')
+    return HubSummary(name, {'adr': hub_adr, 'source_tx': node_tx[source], 'cone_tx': node_tx[cone], 'max_source': max_source[cone],
+                             'rel_depth': rel_depth[cone]})
+
+
+def has_hub_summary(path, name):
+    """Check if a hub summary is saved in the index folder of the dataset"""
+    return os.path.isfile(os.path.join(path, index_folder, hub_summary_name + '_' + name + '.npz'))
+
+
+def load_hub_summary(path, name):
+    """
+    Load a hub summary saved with HubSummary.save.
+
+    :param path: String of folder path of the dataset e.g., 'sampledata/'.
+    :param name: Name of the hub.
+
+    :return: HubSummary object.
+    """
+
+    with np.load(os.path.join(path, index_folder, hub_summary_name + '_' + name + '.npz')) as data:
+        return HubSummary(name, {column: data[column] for column in hub_summary_column})
+
+
+def hub_edge(graph, hub_list):
+    """Boolean array over the edges of a spend graph (forward or reverse), True for the outputs (inputs) of the addresses of any hub"""
+    return np.isin(graph.edge_adr, np.concatenate([summary.adr for summary in hub_list]))
+
+
+def max_depth(depth_limit):
+    """Largest depth kept by a search with depth_limit (the first two levels both have depth 1), None for no limit"""
+    if depth_limit == -1:
+        return None
+    return 0 if depth_limit <= 1 else max(depth_limit - 2, 1)
+
+
+class HubSummary(object):
+    def __init__(self, name, array_dict):
+        """
+        Reachability summary of a hub, see build_hub_summary.
+
+        :param name: Name of the hub.
+        :param array_dict: Dictionary with 'adr' (sorted hub adr index), 'source_tx' (tx index of the payments), and the cone transactions
+        'cone_tx' (sorted tx index), 'max_source' (latest payment tx index reaching each) and 'rel_depth' (distance from the nearest payment).
+        """
+
+        self.name = name
+        for column in hub_summary_column:
+            setattr(self, column, np.asarray(array_dict[column], dtype='int64'))
+
+    def __len__(self):
+        return len(self.cone_tx)
+
+    def tx_range(self):
+        """[first tx index, last tx index] reached by the hub payments, None for an empty cone"""
+        if len(self.cone_tx) == 0:
+            return None
+        return [int(self.cone_tx[0]), int(self.cone_tx[-1])]
+
+    def save(self, path):
+        """
+        Save the summary into the index folder of the dataset.
+
+        :param path: String of folder path of the dataset e.g., 'sampledata/'.
+        """
+
+        save_path = os.path.join(path, index_folder)
+        if not os.path.isdir(save_path):
+            os.makedirs(save_path)
+        np.savez(os.path.join(save_path, hub_summary_name + '_' + self.name + '.npz'), **{column: getattr(self, column) for column in hub_summary_column})
+
+    def cone(self, first_tx):
+        """
+        Cone of the payments made from first_tx on.
+
+        :param first_tx: tx index where the taint enters the hub.
+
+        :return: Tuple (tx index array, rel_depth array).
+        """
+
+        found = self.max_source >= first_tx
+        return self.cone_tx[found], self.rel_depth[found]
+
+
+def merge(graph, state, hub_list, hub_mask, entry, node, blocked=None, depth_cap=None):
+    """
+    Merge the cones of the hubs paid by the nodes into the search state without walking them.
+    A hub is entered at the earliest tainted transaction paying it, its cone from there on gets the depth of that transaction plus rel_depth
+    and is marked searched, so the frontier does not walk into it. Cone transactions paying other hubs enter them too.
+
+    :param graph: SpendGraph searched.
+    :param state: State dictionary of SpendGraph.search, updated in place.
+    :param hub_list: List of HubSummary.
+    :param hub_mask: List of boolean arrays over the edges, the outputs of each hub.
+    :param entry: Dictionary of hub position to the tx index where it was entered, updated in place.
+    :param node: Array of newly tainted nodes.
+    :param blocked: Optional boolean array over the edges from SpendGraph.blocked_edge.
+    :param depth_cap: Largest depth kept, None for no limit.
+    """
+
+    depth_of, searched = state['depth_of'], state['searched']
+    node_tx = np.asarray(graph.node_tx)
+    while len(node) > 0:
+        edge = graph.edge(node)
+        if blocked is not None:
+            edge = edge[~blocked[edge]]
+        merged = []
+        for position, summary in enumerate(hub_list):
+            paid = np.unique(graph.edge_node(edge[hub_mask[position][edge]]))
+            if len(paid) == 0:
+                continue
+            entry_node = paid[np.argmin(node_tx[paid])]
+            if position in entry and entry[position] <= node_tx[entry_node]:
+                continue
+            entry[position] = int(node_tx[entry_node])
+            cone_tx, rel_depth = summary.cone(entry[position])
+            cone_node = graph.node(cone_tx)
+            depth = depth_of[entry_node] + rel_depth
+            found = cone_node >= 0
+            if depth_cap is not None:
+                found &= depth <= depth_cap
+            cone_node, depth = cone_node[found], depth[found]
+            fresh = depth_of[cone_node] < 0
+            depth_of[cone_node[fresh]] = depth[fresh]
+            searched[cone_node] = True
+            merged.append(cone_node[fresh])
+            logging.info('Merged hub ' + str(summary.name) + ' from tx ' + str(entry[position]) + ', ' + str(int(fresh.sum())) + ' transactions')
+        node = np.unique(np.concatenate(merged)) if len(merged) > 0 else node[:0]
+    state['frontier'] = state['frontier'][~searched[state['frontier']]]
+
+
+def search(graph, target_tx, hub_list, mode='stop', depth_limit=-1, blocked=None, state=None, checkpoint=None):
+    """
+    utility.spend_graph.SpendGraph.search that does not walk through hubs.
+    'stop': outputs (inputs for the reverse graph) of the hub addresses are tainted but not followed, the search stops at the hub.
+    'merge' (forward graph only): the search stops at the hub as well and the hub cone from the entry on is merged from the summary (merge),
+    this taints what the whole pooled hub pays from the entry on (not only the tainted outputs) and the depth of merged transactions is
+    counted from the entry. Summaries do not know taint_limit, merged transactions are not blocked by it.
+
+    :param graph: SpendGraph to search.
+    :param target_tx: List of tx index to start from.
+    :param hub_list: List of HubSummary.
+    :param mode: 'stop' or 'merge'.
+    :param depth_limit: Limit how many transaction depth to search, -1 for no limit.
+    :param blocked: Optional boolean array over the edges from SpendGraph.blocked_edge.
+    :param state: Optional dictionary from an earlier search to continue.
+    :param checkpoint: Optional function called with the state dictionary after every level.
+
+    :return: State dictionary, 'depth_of' is the depth of each node (-1 for untainted nodes).
+    """
+
+    if mode not in ['stop', 'merge']:
+        raise Exception('Unknown hub mode: use "stop" or "merge"')
+    stop = hub_edge(graph, hub_list)
+    if state is None:
+        state = graph.start(target_tx, stop)
+    if mode == 'stop':
+        return graph.search(target_tx, depth_limit, blocked, state, checkpoint, stop)
+
+    hub_mask = [np.isin(graph.edge_adr, summary.adr) for summary in hub_list]
+    depth_cap = max_depth(depth_limit)
+    entry = {}
+    merge(graph, state, hub_list, hub_mask, entry, np.flatnonzero(state['depth_of'] >= 0), blocked, depth_cap)
+    for new, _ in graph.search_level(state, depth_limit, blocked, stop):
+        merge(graph, state, hub_list, hub_mask, entry, new, blocked, depth_cap)
+        if checkpoint is not None:
+            checkpoint(state)
+    return state
@@ -0,0 +1,224 @@
+import logging
+import os.path
+
+import numpy as np
+import pandas as pd
+
+from utility import utility_function
+from utility import columnar
+from utility import partition
+from utility import column_store
+from utility import hash_index
+from utility import time_index
+from utility import manifest
+
+logging.getLogger().setLevel(logging.INFO)
+pd.options.mode.chained_assignment = None  # default='warn'
+
+read_option = utility_function.read_option
+write_option = utility_function.write_option
+find_file = utility_function.find_file
+
+ingest_file_list = ['tx_input', 'tx_output', 'tx_height', 'tx_hash', 'adr_hash', 'block']
+
+
+def read_new_data(new_data):
+    """
+    Read the data of the new blocks.
+
+    :param new_data: Dictionary of table name (ingest_file_list) to dataframe, or folder path with the data files of the new blocks.
+
+    :return: Dictionary of table name to dataframe with the default schema.
+    """
+
+    if type(new_data) == str:
+        data_dict = {}
+        for table_name in ingest_file_list:
+            file_name = find_file(table_name + '.csv', new_data)
+            if os.path.isfile(os.path.join(new_data, file_name)):
+                data_dict[table_name] = read_option(file_name, new_data)
+        new_data = data_dict
+    for table_name in ('tx_input', 'tx_output', 'tx_height'):
+        if table_name not in new_data:
+            raise Exception('New data must include ' + table_name)
+    data_dict = {}
+    for table_name, df in new_data.items():
+        df = columnar.apply_schema(df.copy(), table_name)
+        data_dict[table_name] = df.drop(columns=['adr_type'], errors='ignore')
+    return data_dict
+
+
+def append_file(df, table_name, path, file_format):
+    """
+    Add rows at the end of a data file, csv files are appended in place while the rows of columnar files go to a new part file
+    (e.g., tx_output.part_1.parquet, see utility.utility_function.part_file_list) so the file itself is not rewritten.
+
+    :param df: Dataframe of the new rows.
+    :param table_name: File name without extension e.g., 'tx_output'.
+    :param path: Folder path of the file.
+    :param file_format: File extension for a new file e.g., '.csv'.
+
+    :return: Number of rows added.
+    """
+
+    file_name = find_file(table_name + '.csv', path)
+    if not os.path.isfile(os.path.join(path, file_name)):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        write_option(df, table_name + file_format, path)
+    elif file_name[-4:] == '.csv':
+        header = pd.read_csv(os.path.join(path, file_name), index_col=0, nrows=0)
+        df.reindex(columns=header.columns).to_csv(os.path.join(path, file_name), mode='a', header=False)
+    else:
+        stem, extension = os.path.splitext(file_name)
+        write_option(df, stem + utility_function.part_tag + str(len(utility_function.part_file_list(file_name, path)) + 1) + extension, path)
+    return len(df)
+
+
+def update_range(file_name, path, key, tx_range, index_name):
+    """Set the [first_tx, last_tx] row of key (year or month) in a tx_range or month_range file, the first_tx of an existing row is kept"""
+    this_file = find_file(file_name, path)
+    if os.path.isfile(os.path.join(path, this_file)):
+        range_df = read_option(this_file, path)
+    else:
+        this_file = file_name
+        range_df = pd.DataFrame(columns=['first_tx', 'last_tx'], index=pd.Index([], name=index_name))
+    if key in range_df.index:
+        tx_range = [min(int(range_df.loc[key, 'first_tx']), tx_range[0]), tx_range[1]]
+    range_df.loc[key] = tx_range
+    write_option(range_df.astype('int64').sort_index(), this_file, path)
+
+
+def update_spent_patch(path, this_partition, spent):
+    """
+    Add spent_index of outputs to the spent_index patch of a partition (index/spent_patch_<partition>.npz), applied when
+    tx_output of the partition is read (utility.utility_function.read_option and utility.column_store.ColumnStore), no data file or column store is changed.
+
+    :param path: String of folder path of the dataset e.g., 'sampledata/'.
+    :param this_partition: Partition folder e.g., '2009/'.
+    :param spent: Series of spending tx_index with output_index as index.
+    """
+
+    file_path = utility_function.spent_patch_file(path, this_partition)
+    if os.path.isfile(file_path):
+        with np.load(file_path) as data:
+            old_spent = pd.Series(data['spent_index'], index=data['output_index'])
+        spent = pd.concat([old_spent[~old_spent.index.isin(spent.index)], spent])
+    spent = spent.sort_index()
+    if not os.path.isdir(os.path.dirname(file_path)):
+        os.makedirs(os.path.dirname(file_path))
+    np.savez(file_path, output_index=spent.index.values.astype('int64'), spent_index=spent.values.astype('int64'))
+
+
+def append_blocks(path, new_data, spent_check=True):
+    """
+    Add the data of new blocks to a dataset without rewriting the existing data files.
+    New transactions go to the partition of their block time (YYYY/MM/ in a month layout dataset, YYYY/ in a year layout dataset):
+    appended to csv files, or written as new part files next to parquet and feather files and as a new chunk of the column store.
+    The tx_range and month_range files are updated, earlier outputs spent by the new inputs get their spent_index in the spent_index patch
+    of their partition (update_spent_patch), and the hash index, time index and manifest of the dataset are extended when they exist.
+
+    :param path: String of folder path of the dataset e.g., 'sampledata/'.
+    :param new_data: Dictionary of table name to dataframe ('tx_input', 'tx_output', 'tx_height' and optional 'tx_hash', 'adr_hash', 'block')
+    or folder path with these data files, in the same format as the dataset files. The first new tx_index must follow the last tx_index of the dataset.
+    adr_hash should only have the addresses first seen in the new blocks.
+    :param spent_check: Set spent_index of the earlier outputs spent by the new inputs.
+
+    :return: DataFrame with the number of rows added to each folder and file ('spent_patch' rows are the outputs patched in a partition).
+    """
+
+    data_dict = read_new_data(new_data)
+    time_index_fresh = time_index.check_time_index(path)  # a stale index is built again instead of extended
+    partition_list = partition.find_partition(path)
+    range_list = partition.partition_range(path, partition_list)
+    tx_height = data_dict['tx_height'].sort_index()
+    if len(tx_height) == 0:
+        raise Exception('New data has no transaction')
+    if len(range_list) > 0 and tx_height.index[0] <= range_list[-1][1]:
+        raise Exception('New transactions must start after the last transaction of the dataset (tx index ' + str(range_list[-1][1]) + ')')
+
+    file_format = '.csv'
+    month_layout = any([this_partition.count('/') > 1 for this_partition in partition_list])
+    if len(partition_list) > 0:
+        file_format = os.path.splitext(find_file('tx_output.csv', os.path.join(path, partition_list[-1])))[1]
+    use_store = any([column_store.has_column_store('tx_output', os.path.join(path, this_partition)) for this_partition in partition_list])
+
+    # block time of each new transaction
+    if 'block' in data_dict:
+        append_file(data_dict['block'], 'block', path, '.csv')
+        block = data_dict['block']
+    else:
+        block = read_option(find_file('block.csv', path), path, columns=['time'])
+    tx_time = pd.to_datetime(block['time']).reindex(tx_height['block_index']).values
+    if pd.isna(tx_time).any():
+        raise Exception('Block time not found for new blocks, include them in new_data["block"]')
+    tx_time = pd.DatetimeIndex(np.maximum.accumulate(tx_time.astype('datetime64[ns]').astype('int64')).astype('datetime64[ns]'))
+    if month_layout:
+        folder = pd.Series(tx_time.strftime('%Y/%m/'), index=tx_height.index)
+    else:
+        folder = pd.Series(tx_time.strftime('%Y/'), index=tx_height.index)
+
+    # earlier outputs spent by the new inputs
+    tx_input = data_dict['tx_input']
+    spent = tx_input.reset_index().drop_duplicates(subset=['output_index']).set_index('output_index')['tx_index']
+    tx_output = data_dict['tx_output']
+    new_spent = tx_output.index.isin(spent.index)
+    tx_output.loc[new_spent, 'spent_index'] = spent.reindex(tx_output.index[new_spent]).values
+
+    added = pd.DataFrame(columns=['folder', 'file', 'rows'])
+    adr_folder = None
+    if 'adr_hash' in data_dict:
+        if hash_index.has_hash_index(path, 'adr'):  # keep only addresses not in the dataset yet
+            data_dict['adr_hash'] = data_dict['adr_hash'][
+                ~data_dict['adr_hash'].index.isin(hash_index.HashIndex(path, 'adr').index_to_hash(data_dict['adr_hash'].index).index)]
+        first_tx = tx_output.groupby('adr_index')['tx_index'].min()  # addresses go to the folder of their first output
+        adr_folder = pd.Series(folder.reindex(first_tx.values).values, index=first_tx.index)
+    for this_folder in list(dict.fromkeys(folder.values)):
+        this_tx = folder.index[folder.values == this_folder]
+        tx_range = [int(this_tx.min()), int(this_tx.max())]
+        folder_path = os.path.join(path, this_folder)
+        logging.info('appending ' + this_folder)
+        for table_name in ('tx_input', 'tx_output', 'tx_height', 'tx_hash', 'adr_hash'):
+            if table_name not in data_dict:
+                continue
+            df = data_dict[table_name]
+            if table_name == 'adr_hash':
+                df = df[(adr_folder.reindex(df.index).fillna(folder.iloc[0]) == this_folder).values]
+            else:
+                tx_index = df['tx_index'] if 'tx_index' in df.columns else df.index.to_series()
+                df = df[((tx_index >= tx_range[0]) & (tx_index <= tx_range[1])).values]
+            if len(df) == 0 and os.path.isfile(os.path.join(folder_path, find_file(table_name + '.csv', folder_path))):
+                continue
+            append_file(df, table_name, folder_path, file_format)
+            added.loc[len(added)] = [this_folder, table_name, len(df)]
+            if use_store and table_name in column_store.store_column:
+                column_store.append_column_store(df, table_name, folder_path)
+
+        year = int(this_folder.split('/')[0])
+        if month_layout:
+            update_range(partition.month_range_filename, os.path.join(path, str(year)), int(this_folder.split('/')[1]), tx_range, 'month')
+        update_range(partition.tx_range_filename, path, year, tx_range, 'year')
+
+    if spent_check:
+        old_input = tx_input[tx_input['spent_index'] < tx_height.index[0]]  # inputs spending outputs of the dataset
+        old_input = old_input[~old_input.index.duplicated(keep='first')]
+        for this_partition, this_range in zip(partition_list, range_list):
+            this_spent = old_input[(old_input['spent_index'] >= this_range[0]) & (old_input['spent_index'] <= this_range[1])]['tx_index']
+            if len(this_spent) == 0:
+                continue
+            logging.info('patching spent outputs of ' + this_partition)
+            update_spent_patch(path, this_partition, this_spent)
+            added.loc[len(added)] = [this_partition, 'spent_patch', len(this_spent)]
+
+    if hash_index.has_hash_index(path, 'tx') and 'tx_hash' in data_dict:
+        hash_index.append_hash_index(path, 'tx', data_dict['tx_hash'])
+    if hash_index.has_hash_index(path, 'adr') and 'adr_hash' in data_dict:
+        hash_index.append_hash_index(path, 'adr', data_dict['adr_hash'])
+    if time_index_fresh:
+        time_index.append_time_index(path, tx_height, block)
+    elif time_index.has_time_index(path):
+        time_index.build_time_index(path)
+    if manifest.has_manifest(path):  # only the changed files are described again
+        manifest.build_manifest(path)
+    return added
+
@@ -0,0 +1,429 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from utility import spend_graph
+from utility import haircut
+
+logging.getLogger().setLevel(logging.INFO)
+pd.options.mode.chained_assignment = None  # default='warn'
+
+csr_edge = spend_graph.csr_edge
+lookup_node = spend_graph.lookup_node
+group_pointer = haircut.group_pointer
+topological_level = haircut.topological_level
+
+dirtyfirst_policy = ('dirtyfirst', 'puredirtyfirst', 'df', 'pdf')
+in_order_letter = ('f', 'l', 't', 'c', 'b', 'h', 's')  # first, last, taint, clean, biggest/highest, smallest
+out_order_letter = ('f', 'l', 'b', 'h', 's')
+stable_sort_size = 16  # numpy quicksort sorts up to this many items by insertion, which keeps the order of equal keys
+
+
+def pandas_order(key, ascending=True):
+    """Positions of key in the order of DataFrame.sort_values on one column (default quicksort), equal keys end up where pandas puts them"""
+    position = np.arange(len(key))
+    if not ascending:
+        key, position = key[::-1], position[::-1]
+    order = position[np.asarray(key).argsort(kind='quicksort')]
+    return order[::-1] if not ascending else order
+
+
+def group_first(group):
+    """Position of the first item of the group of each item, the items of a group are next to each other"""
+    if len(group) == 0:
+        return np.zeros(0, dtype='int64')
+    first = np.concatenate([[True], group[1:] != group[:-1]])
+    return np.maximum.accumulate(np.where(first, np.arange(len(group)), 0))
+
+
+def group_order(group, key, ascending, pandas_key, tie_only):
+    """
+    Order of the items sorted by key within each group, the same order as sorting each group with pandas_order.
+    Equal keys keep their order (stable lexsort) except in the groups where numpy quicksort may move them, which are sorted with pandas_order.
+
+    :param group: Sorted group of each item.
+    :param key: Numeric sort key of each item.
+    :param ascending: Sort ascending.
+    :param pandas_key: Key array with the dtype pandas sorts (e.g., object strings), for the groups sorted with pandas_order.
+    :param tie_only: True to use pandas_order only for groups with equal keys, False for groups larger than stable_sort_size.
+
+    :return: Array of item positions.
+    """
+
+    order = np.lexsort((np.arange(len(key)), key if ascending else -key, group))
+    sorted_group = group[order]
+    if tie_only:
+        same = (sorted_group[1:] == sorted_group[:-1]) & (key[order][1:] == key[order][:-1])
+        exact = np.unique(sorted_group[1:][same])
+    else:
+        size = np.bincount(group) if len(group) > 0 else np.zeros(0, dtype='int64')
+        exact = np.flatnonzero(size > stable_sort_size)
+    start, end = np.searchsorted(group, exact), np.searchsorted(group, exact, side='right')
+    for this_start, this_end in zip(start, end):
+        order[this_start:this_end] = this_start + pandas_order(pandas_key[this_start:this_end], ascending)
+    return order
+
+
+def merge_run(label, letter, value):
+    """
+    Merge of consecutive inputs with the same taint type done as TaintedTX.order_tainting does it, one row after another.
+    Merging drops every row with the label (output_index) of the merged row, which also removes the other record portions of that input,
+    so transactions where a portion is merged into the row before it can not use the plain run merge.
+
+    :param label: output_index of each input row.
+    :param letter: Taint type ('t' or 'c') of each row.
+    :param value: Value of each row.
+
+    :return: Tuple (list of taint types, list of values) of the merged rows.
+    """
+
+    row = [[this_label, this_letter, this_value] for this_label, this_letter, this_value in zip(label, letter, value)]
+    run = 0
+    while len(row) > run:
+        if len(row) > run + 1:
+            coin_type = row[run][1]
+            next_one = row[run + 1]
+            while next_one[1] == coin_type:
+                row[run][2] += next_one[2]
+                row = [item for item in row if item[0] != next_one[0]]
+                if len(row) > run + 1:
+                    next_one = row[run + 1]
+                else:
+                    break
+        run += 1
+    return [item[1] for item in row], [item[2] for item in row]
+
+
+def replaced_label(record_label, input_label):
+    """
+    Labels (output_index) whose record portions replace the input in TaintedTX.order_tainting, which takes the labels in set order
+    and stops at the first one that is not an input of the transaction (a record row with the spent_index of another transaction).
+
+    :param record_label: output_index of the record rows with the spent_index of the transaction, in record order.
+    :param input_label: output_index of the inputs of the transaction.
+
+    :return: List of labels.
+    """
+
+    label_list = []
+    for label in list(set(record_label)):
+        if label not in input_label:
+            break
+        label_list.append(label)
+    return label_list
+
+
+def overlap(in_group, in_value, out_group, out_value):
+    """
+    Portions of the distribution of each group (transaction): its ordered inputs and outputs are laid on one value line as
+    cumulative intervals and every step of the walk over both gives the input, the output and the amount between two interval ends.
+    Ends at the same value are taken one input with one output in order (zero value items included), and the walk stops when
+    the inputs run out, as the distribution loop of policy_tx_taint does.
+
+    :param in_group: Sorted group of each input.
+    :param in_value: Value of each input in distribution order.
+    :param out_group: Sorted group of each output.
+    :param out_value: Value of each output in distribution order.
+
+    :return: Tuple (input position, output position, amount) of each portion, in walk order of each group.
+    """
+
+    in_value, out_value = np.asarray(in_value, dtype='int64'), np.asarray(out_value, dtype='int64')
+    if len(in_value) == 0 or len(out_value) == 0:
+        return np.zeros(0, dtype='int64'), np.zeros(0, dtype='int64'), np.zeros(0, dtype='int64')
+    in_end = np.cumsum(in_value) - (np.cumsum(in_value) - in_value)[group_first(in_group)]
+    out_end = np.cumsum(out_value) - (np.cumsum(out_value) - out_value)[group_first(out_group)]
+    group = np.concatenate([in_group, out_group])
+    end = np.concatenate([in_end, out_end])
+    kind = np.concatenate([np.zeros(len(in_end), dtype='int64'), np.ones(len(out_end), dtype='int64')])
+    rank = np.concatenate([np.arange(len(in_end)) - group_first(in_group * (in_end.max(initial=0) + 1) + in_end),
+                           np.arange(len(out_end)) - group_first(out_group * (out_end.max(initial=0) + 1) + out_end)])  # n-th end at the same value
+    order = np.lexsort((kind, rank, end, group))
+    group, end, kind, rank = group[order], end[order], kind[order], rank[order]
+
+    pair = np.zeros(len(group), dtype=bool)  # input end followed by the output end of the same value and rank, one step for both
+    pair[:-1] = (kind[:-1] == 0) & (kind[1:] == 1) & (group[:-1] == group[1:]) & (end[:-1] == end[1:]) & (rank[:-1] == rank[1:])
+    tail = np.concatenate([[False], pair[:-1]])
+    step = np.flatnonzero(~tail)
+    step_group, step_end = group[step], end[step]
+    move_in = (kind[step] == 0).astype('int64')
+    move_out = ((kind[step] == 1) | pair[step]).astype('int64')
+    first = group_first(step_group)
+    in_before = np.cumsum(move_in) - move_in
+    in_before -= in_before[first]
+    out_before = np.cumsum(move_out) - move_out
+    out_before -= out_before[first]
+    previous_end = np.concatenate([[0], step_end[:-1]])
+    previous_end[first == np.arange(len(step))] = 0
+
+    in_start = np.searchsorted(in_group, step_group)
+    in_count = np.searchsorted(in_group, step_group, side='right') - in_start
+    out_start = np.searchsorted(out_group, step_group)
+    out_count = np.searchsorted(out_group, step_group, side='right') - out_start
+    kept = (in_before < in_count) & (out_before < out_count)
+    return (in_start + in_before)[kept], (out_start + out_before)[kept], (step_end - previous_end)[kept]
+
+
+def spent_replace(position, spent_list):
+    """
+    spent_index of the record rows of one transaction as policy_tx_taint sets it: the output position of each row is replaced with
+    the spent_index of that output, one position after another, so a spent_index equal to a later position is replaced again.
+
+    :param position: Output position of each record row.
+    :param spent_list: spent_index of the outputs by position.
+
+    :return: Array of spent_index.
+    """
+
+    value = pd.Series(position.astype('int64'))
+    for this_position in sorted(set(value.tolist())):
+        value = value.replace(this_position, spent_list[this_position])
+    return value.values.astype('float64')
+
+
+def taint_plan(tx_tainted, tx_input, tx_output):
+    """
+    Arrays in_out_taint works on that do not depend on the policy: the tainted transactions (cone), their inputs and outputs grouped by
+    transaction and the topological levels. Several policies distributed on the same data can share one plan.
+
+    :param tx_tainted: DataFrame from tx_taint_search.
+    :param tx_input: tx_input of the tainted transactions, with fee distributed.
+    :param tx_output: tx_output of the tainted transactions.
+
+    :return: Dictionary of arrays.
+    """
+
+    tainted_tx = tx_tainted['tx_index'].values.astype('int64')
+    cone = np.unique(tainted_tx)
+    node_count = len(cone)
+    tainted_node = lookup_node(cone, tainted_tx)
+    tainted_sum = np.zeros(node_count, dtype='int64')  # output value of each transaction in tx_tainted, for the fee
+    np.add.at(tainted_sum, tainted_node, tx_tainted['output_value'].values.astype('int64'))
+
+    out_node = lookup_node(cone, tx_output['tx_index'].values)
+    out_order, out_ptr = group_pointer(out_node, node_count)
+    out_label = np.asarray(tx_output.index, dtype='int64')
+    out_adr = tx_output['adr_index'].values.astype('int64')
+    out_value = tx_output['output_value'].values
+    out_spent = tx_output['spent_index'].values.astype('float64')
+    out_dst = lookup_node(cone, np.where(np.isnan(out_spent), -1, out_spent))
+    in_node = lookup_node(cone, tx_input['tx_index'].values)
+    in_order, in_ptr = group_pointer(in_node, node_count)
+    in_label = np.asarray(tx_input.index, dtype='int64')
+    in_value = tx_input['input_value'].values.astype('int64')
+
+    level_list = topological_level(out_node[(out_node >= 0) & (out_dst >= 0)], out_dst[(out_node >= 0) & (out_dst >= 0)], node_count)
+    level_of = np.full(node_count, -1, dtype='int64')
+    for number, level in enumerate(level_list):
+        level_of[level] = number
+
+    return {'cone': cone, 'tainted_sum': tainted_sum, 'out_order': out_order, 'out_ptr': out_ptr, 'out_label': out_label, 'out_adr': out_adr,
+            'out_value': out_value, 'out_spent': out_spent, 'out_dst': out_dst, 'in_order': in_order, 'in_ptr': in_ptr, 'in_label': in_label,
+            'in_value': in_value, 'level_list': level_list, 'level_of': level_of}
+
+
+def in_out_taint(tx_tainted, tx_input, tx_output, record, policy, test=0, show_progress=False, plan=None):
+    """
+    In-Out (e.g., FIFO, LIFO, TIHO) and dirtyfirst distribution of policy_tx_taint by topological levels of transactions.
+    The ordered inputs (record portions of tainted inputs merged by taint type) and ordered outputs of every transaction in a level are
+    cumulative value intervals and the taint and clean portions of the outputs are their overlaps (overlap), computed for the whole level at once.
+    Transactions are distributed when the taint reaches them as in the one transaction at a time loop, with the same record rows and taint_value.
+
+    :param tx_tainted: DataFrame from tx_taint_search.
+    :param tx_input: tx_input of the tainted transactions, with fee distributed.
+    :param tx_output: tx_output of the tainted transactions.
+    :param record: utility.taint_record.TaintRecord of the tainted target outputs (or of the previous run), the new rows are appended to it.
+    :param policy: Lower case policy name.
+    :param test: Number to limit how many transactions to distribute (in tx index order), 0 means all.
+    :param show_progress: Log each level.
+    :param plan: Optional dictionary from taint_plan of the same data.
+
+    :return: Tuple (tx_tainted without the distributed transactions, DataFrame of distributed outputs, TaintRecord).
+    """
+
+    if policy in dirtyfirst_policy:
+        in_letter, out_letter = 'f', 'f'
+    else:
+        in_letter, out_letter = policy[0], policy[2]
+    if in_letter not in in_order_letter:
+        logging.warning(in_letter + ' of ' + policy + 'not found')
+    if out_letter not in out_order_letter:
+        raise Exception('Unknown out order ' + out_letter + ' of ' + policy + ', use one of ' + ', '.join(out_order_letter))
+
+    if plan is None:
+        plan = taint_plan(tx_tainted, tx_input, tx_output)
+    cone, tainted_sum, level_list, level_of = plan['cone'], plan['tainted_sum'], plan['level_list'], plan['level_of']
+    out_order, out_ptr, out_label, out_adr = plan['out_order'], plan['out_ptr'], plan['out_label'], plan['out_adr']
+    out_value, out_spent, out_dst = plan['out_value'], plan['out_spent'], plan['out_dst']
+    in_order, in_ptr, in_label, in_value = plan['in_order'], plan['in_ptr'], plan['in_label'], plan['in_value']
+    node_count = len(cone)
+
+    searching = tx_tainted[(tx_tainted['taint_value'] > 0) & tx_tainted['spent_index'].notnull()]
+    searching = searching[~searching['tx_index'].isin(searching['spent_index'])]
+    start_tx = np.unique(searching['spent_index'].values.astype('int64'))
+    start_node = lookup_node(cone, start_tx)
+    found = np.zeros(node_count, dtype=bool)  # transactions the taint reaches
+    found[start_node[start_node >= 0]] = True
+
+    bucket = {}  # record rows waiting for the level of the transaction spending them
+    label_base = int(max(in_label.max(initial=0), record.column('output_index').max(initial=0))) + 1
+
+    def add_record(chunk):
+        dst = lookup_node(cone, np.where(np.isnan(chunk['spent_index']), -1, chunk['spent_index']))
+        chunk['dst'] = dst
+        dst_level = np.where(dst >= 0, level_of[np.maximum(dst, 0)], -1)
+        for number in np.unique(dst_level[dst_level >= 0]):
+            bucket.setdefault(int(number), []).append({key: value[dst_level == number] for key, value in chunk.items()})
+
+    add_record({'output_index': record.column('output_index'), 'input_value': record.column('portion_value'), 'spent_index': record.column('spent_index'),
+                'taint': record.column('taint'), 'source': np.full(len(record), -1, dtype='int64'), 'step': np.arange(len(record))})
+
+    record_list, new_list, clean_list, done_node = [], [], [], []
+    for number, level in enumerate(level_list):
+        node = level[found[level]]
+        chunk_list = bucket.pop(number, [])
+        if len(node) == 0:
+            continue
+        group_count = len(node)
+
+        # input rows: each input of the transaction, replaced by its record portions when it has any
+        base = in_order[csr_edge(in_ptr, node)]
+        base_count = in_ptr[node + 1] - in_ptr[node]
+        base_group = np.repeat(np.arange(group_count), base_count)
+        base_position = np.arange(len(base)) - np.repeat(np.cumsum(base_count) - base_count, base_count)
+        base_key = base_group * label_base + in_label[base]
+        if len(chunk_list) > 0:
+            chunk = {key: np.concatenate([this_chunk[key] for this_chunk in chunk_list]) for key in chunk_list[0]}
+        else:
+            chunk = {key: np.zeros(0, dtype='int64') for key in ('output_index', 'input_value', 'dst', 'source', 'step')}
+            chunk['taint'] = np.zeros(0, dtype=bool)
+        record_group = lookup_node(node, chunk['dst'])
+        key_order = np.argsort(base_key, kind='stable')
+        record_base = lookup_node(base_key[key_order], np.where(record_group >= 0, record_group * label_base + chunk['output_index'], -1))
+        kept = record_base >= 0  # portions of outputs that are not an input of the transaction are left out
+        for group in np.unique(record_group[(record_group >= 0) & ~kept]):  # and stop the replacing of the transaction
+            row = np.flatnonzero(record_group == group)
+            row = row[np.lexsort((chunk['step'][row], chunk['source'][row]))]
+            label_list = replaced_label(chunk['output_index'][row].tolist(), set(in_label[base][base_group == group].tolist()))
+            kept[row] &= np.isin(chunk['output_index'][row], label_list)
+        record_base = key_order[record_base[kept]]
+        replaced = np.zeros(len(base), dtype=bool)
+        replaced[record_base] = True
+        row_group = np.concatenate([base_group[~replaced], base_group[record_base]])
+        row_order = np.lexsort((np.concatenate([np.zeros(int((~replaced).sum()), dtype='int64'), np.arange(1, len(record_base) + 1)]),
+                                np.concatenate([base_position[~replaced], base_position[record_base]]), row_group))
+        row_group = row_group[row_order]
+        row_label = np.concatenate([in_label[base][~replaced], chunk['output_index'][kept]])[row_order]
+        row_taint = np.concatenate([np.zeros(int((~replaced).sum()), dtype=bool), chunk['taint'][kept]])[row_order]
+        row_value = np.concatenate([in_value[base][~replaced], chunk['input_value'][kept]])[row_order]
+        row_portion = np.concatenate([np.zeros(int((~replaced).sum()), dtype=bool), np.ones(int(kept.sum()), dtype=bool)])[row_order]
+
+        # merge consecutive rows of the same taint type
+        same = np.zeros(len(row_group), dtype=bool)
+        same[1:] = (row_group[1:] == row_group[:-1]) & (row_taint[1:] == row_taint[:-1])
+        label_size = pd.Series(row_group * label_base + row_label).map(pd.Series(row_group * label_base + row_label).value_counts()).values
+        sequential = np.unique(row_group[same & row_portion & (label_size > 1)])  # merging would drop other portions of the same input
+        start = np.flatnonzero(~same)
+        run_group, run_taint, run_value = row_group[start], row_taint[start], np.add.reduceat(row_value, start) if len(start) > 0 else row_value
+        if len(sequential) > 0:
+            kept = ~np.isin(run_group, sequential)
+            run_group, run_taint, run_value = [run_group[kept]], [run_taint[kept]], [run_value[kept]]
+            for group in sequential:
+                row = row_group == group
+                letter, value = merge_run(row_label[row], np.where(row_taint[row], 't', 'c'), row_value[row].tolist())
+                run_group.append(np.full(len(letter), group, dtype='int64'))
+                run_taint.append(np.asarray(letter) == 't')
+                run_value.append(np.asarray(value, dtype='int64'))
+            run_group, run_taint, run_value = np.concatenate(run_group), np.concatenate(run_taint), np.concatenate(run_value)
+            run_order = np.argsort(run_group, kind='stable')
+            run_group, run_taint, run_value = run_group[run_order], run_taint[run_order], run_value[run_order]
+
+        tainted_group = np.zeros(group_count, dtype=bool)  # transactions with tainted inputs, the others get no taint
+        tainted_group[run_group[run_taint]] = True
+        kept = tainted_group[run_group]
+        run_group, run_taint, run_value = run_group[kept], run_taint[kept], run_value[kept]
+        input_sum = np.bincount(run_group, weights=run_value, minlength=group_count).astype('int64')
+        fee_value = input_sum - tainted_sum[node]
+        fee = fee_value[run_group] > 0  # fee taken from every input in proportion, cut to whole numbers
+        run_value[fee] = (run_value[fee] - (run_value[fee] * (fee_value[run_group][fee] / input_sum[run_group][fee]))).astype('int64')
+
+        if in_letter == 'l':
+            run_order = np.lexsort((-np.arange(len(run_group)), run_group))
+        elif in_letter in ('t', 'c'):  # 't' sorts before 'c' in descending order
+            run_order = group_order(run_group, run_taint.astype('int64'), in_letter == 'c', np.where(run_taint, 't', 'c').astype(object), False)
+        elif in_letter in ('b', 'h', 's'):
+            run_order = group_order(run_group, run_value, in_letter == 's', run_value, True)
+        else:
+            run_order = np.arange(len(run_group))
+        run_group, run_taint, run_value = run_group[run_order], run_taint[run_order], run_value[run_order]
+
+        out_group_node = np.flatnonzero(tainted_group)
+        out = out_order[csr_edge(out_ptr, node[out_group_node])]
+        out_count = out_ptr[node[out_group_node] + 1] - out_ptr[node[out_group_node]]
+        out_group = np.repeat(out_group_node, out_count)
+        if out_letter == 'l':
+            out = out[np.lexsort((-np.arange(len(out)), out_group))]
+        elif out_letter in ('b', 'h', 's'):
+            out = out[group_order(out_group, out_value[out].astype('float64'), out_letter == 's', out_value[out], True)]
+
+        in_item, out_item, amount = overlap(run_group, run_value, out_group, out_value[out])
+        taint_value = np.bincount(out_item, weights=np.where(run_taint[in_item], amount, 0), minlength=len(out))
+        clean_value = out_value[out] - taint_value
+
+        out_position = np.arange(len(out)) - np.repeat(np.cumsum(out_count) - out_count, out_count)
+        record_spent = out_spent[out][out_item]
+        collide = np.unique(out_group[out_item][(record_spent >= 0) & (record_spent < out_count.max(initial=0))])
+        for group in collide:  # spent_index equal to an output position of the same transaction
+            row = out_group[out_item] == group
+            this_out = out_group == group
+            record_spent[row] = spent_replace(out_position[out_item][row], out_spent[out][this_out])
+        record_chunk = {'output_index': out_label[out][out_item], 'tx_index': cone[node[out_group[out_item]]], 'adr_index': out_adr[out][out_item],
+                        'portion_value': amount, 'spent_index': record_spent, 'total_amount': out_value[out][out_item].astype('int64'),
+                        'taint': run_taint[in_item], 'step': np.arange(len(amount))}
+        record_list.append(record_chunk)
+        add_record({'output_index': record_chunk['output_index'], 'input_value': amount, 'spent_index': record_spent, 'taint': record_chunk['taint'],
+                    'source': record_chunk['tx_index'], 'step': record_chunk['step']})
+
+        reach = (taint_value > 0) & (out_dst[out] >= 0)
+        if policy in dirtyfirst_policy:  # transactions with clean outputs do not spread
+            has_clean = np.zeros(group_count, dtype=bool)
+            has_clean[out_group[clean_value > 0]] = True
+            reach &= ~has_clean[out_group]
+        found[out_dst[out][reach]] = True
+
+        new_list.append((cone[node[out_group]], out, taint_value, clean_value))
+        clean_list.append(cone[node[~tainted_group]])
+        done_node.append(node)
+        if show_progress:
+            logging.info('level ' + str(number) + ' of ' + str(len(level_list)) + ': ' + str(len(node)) + ' transactions, ' +
+                         str(int(tainted_group.sum())) + ' tainted')
+
+    done_tx = cone[np.concatenate(done_node)] if len(done_node) > 0 else np.zeros(0, dtype='int64')
+    if test > 0:  # transactions taken one at a time in tx index order, with the targets' spending transactions outside tx_tainted
+        tainted_done = np.concatenate([this_new[0] for this_new in new_list]) if len(new_list) > 0 else np.zeros(0, dtype='int64')
+        outside = start_tx[lookup_node(cone, start_tx) < 0]
+        if len(tainted_done) > 0:
+            outside = outside[outside < tainted_done.min()]  # removed from the queue by the first distributed transaction
+        done_tx = np.sort(np.concatenate([done_tx, outside]))[:test]
+
+    if len(record_list) > 0:
+        record_chunk = {column: np.concatenate([this_chunk[column] for this_chunk in record_list]) for column in record_list[0]}
+        row = np.flatnonzero(np.isin(record_chunk['tx_index'], done_tx))
+        row = row[np.lexsort((record_chunk['step'][row], record_chunk['tx_index'][row]))]
+        record.append({column: value[row] for column, value in record_chunk.items()})
+
+    new_tainted_tx = pd.DataFrame()
+    if len(new_list) > 0:
+        new_tx = np.concatenate([this_new[0] for this_new in new_list])
+        new_tainted_tx = tx_output.iloc[np.concatenate([this_new[1] for this_new in new_list])]
+        new_tainted_tx['taint_value'] = np.concatenate([this_new[2] for this_new in new_list])
+        new_tainted_tx['clean_value'] = np.concatenate([this_new[3] for this_new in new_list])
+        new_tainted_tx = new_tainted_tx[np.isin(new_tx, done_tx)]
+    clean_tx = np.concatenate(clean_list) if len(clean_list) > 0 else np.zeros(0, dtype='int64')
+    clean_tainted = tx_tainted[tx_tainted['tx_index'].isin(clean_tx[np.isin(clean_tx, done_tx)])]  # reached without tainted inputs
+    clean_tainted['taint_value'] = 0
+    clean_tainted['clean_value'] = clean_tainted['output_value'] - clean_tainted['taint_value']
+    new_tainted_tx = new_tainted_tx.append(clean_tainted)
+    logging.info('Distributed ' + str(len(done_tx)) + ' transactions in ' + str(len(level_list)) + ' levels')
+    return tx_tainted[~tx_tainted['tx_index'].isin(done_tx)], new_tainted_tx, record
@@ -6,6 +6,8 @@ from bs4 import BeautifulSoup
 import random
 import time
 
+from utility import utility_function
+
 logging.getLogger().setLevel(logging.INFO)
 pd.options.mode.chained_assignment = None  # default='warn'
 
@@ -32,7 +34,7 @@ def lightning_check(tx_input, tx_output, tx_tainted=None, service_adr=None, valu
     else:
         found_tx = tx_output
 
-    found_tx['adr_type'] = found_tx['adr_index'] % 10
+    found_tx['adr_type'] = utility_function.adr_type(found_tx)
     found_tx = found_tx[found_tx['adr_type'] == lightning_adr_type]  # only witness script hash multi-sig adr output
 
     if value_limit is None:
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import logging
+import os.path
+
+import numpy as np
+import pandas as pd
+
+from utility import utility_function
+from utility import partition
+
+logging.getLogger().setLevel(logging.INFO)
+pd.options.mode.chained_assignment = None  # default='warn'
+
+read_option = utility_function.read_option
+find_file = utility_function.find_file
+
+manifest_filename = 'manifest.json'
+manifest_version = 1
+manifest_root_file_list = ['tx_range', 'block']
+manifest_file_list = ['tx_input', 'tx_output', 'tx_height', 'tx_hash', 'adr_hash']
+
+
+def file_checksum(file_path, block_size=1 << 20):
+    """md5 hex digest of a file, read by block"""
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def file_info(file_name, path, checksum=True, previous=None):
+    """
+    Describe one data file for the manifest: rows, column dtypes, size and checksum.
+    Parquet and feather files are described from their metadata, csv files are counted by line.
+
+    :param file_name: Filename with file extension e.g., tx_output.parquet.
+    :param path: Path string to file's folder.
+    :param checksum: Compute the md5 checksum of the file.
+    :param previous: Manifest entry of the same file from an earlier manifest, reused when the file size and modified time are the same.
+
+    :return: Dictionary of the file entry.
+    """
+
+    file_path = os.path.join(path, file_name)
+    stat = os.stat(file_path)
+    if previous is not None and previous['file'] == file_name and previous['size'] == stat.st_size and previous['mtime'] == stat.st_mtime_ns:
+        if not checksum or previous.get('checksum') is not None:
+            return previous
+
+    if file_name[-8:] == '.parquet':
+        import pyarrow.parquet
+
+        metadata = pyarrow.parquet.ParquetFile(file_path).metadata
+        rows = metadata.num_rows
+        dtype = {field.name: str(field.type) for field in metadata.schema.to_arrow_schema() if not field.name.startswith('__')}
+    elif file_name[-8:] == '.feather':
+        import pyarrow
+
+        with pyarrow.memory_map(file_path) as source:
+            reader = pyarrow.ipc.open_file(source)
+            rows = sum([reader.get_batch(i).num_rows for i in range(reader.num_record_batches)])
+            dtype = {field.name: str(field.type) for field in reader.schema}
+    elif file_name[-4:] == '.npz':  # spent_index patch of a partition
+        with np.load(file_path) as data:
+            rows = len(data['output_index'])
+            dtype = {column: str(data[column].dtype) for column in data.files}
+    else:
+        with open(file_path, 'rb') as f:
+            rows = sum([block.count(b'\n') for block in iter(lambda: f.read(1 << 20), b'')]) - 1  # without the header line
+        df = pd.read_csv(file_path, nrows=1000)
+        dtype = {column: str(df[column].dtype) for column in df.columns}
+    return {'file': file_name, 'rows': int(rows), 'dtype': dtype, 'size': int(stat.st_size), 'mtime': int(stat.st_mtime_ns),
+            'checksum': file_checksum(file_path) if checksum else None}
+
+
+def build_manifest(path, checksum=True, save=True):
+    """
+    Build the manifest of a dataset: partitions with their tx and block ranges, and rows, column dtypes, size and checksum of every data file
+    (and of the spent_index patch of the partition, see utility.ingest.update_spent_patch).
+    TaintedTX starts from the manifest without listing folders or reading tx_range, entries of files unchanged since the last manifest are reused.
+
+    :param path: String of folder path of the dataset e.g., 'sampledata/'.
+    :param checksum: Compute md5 checksums of the files (reads every file once).
+    :param save: Write the manifest into the dataset folder as manifest.json.
+
+    :return: Dictionary of the manifest.
+    """
+
+    previous = load_manifest(path)
+    previous_file = {}
+    if previous is not None:
+        previous_file = {'': previous['root_file']}
+        previous_file.update({this_partition['folder']: this_partition['file'] for this_partition in previous['partition']})
+
+    root_file = {}
+    for table_name in manifest_root_file_list:
+        file_name = find_file(table_name + '.csv', path)
+        if os.path.isfile(os.path.join(path, file_name)):
+            root_file[table_name] = file_info(file_name, path, checksum, previous_file.get('', {}).get(table_name))
+        for part_file in utility_function.part_file_list(file_name, path):
+            part_name = os.path.splitext(part_file)[0]
+            root_file[part_name] = file_info(part_file, path, checksum, previous_file.get('', {}).get(part_name))
+
+    partition_list = partition.find_partition(path)
+    range_list = partition.partition_range(path, partition_list)
+    partition_entry_list = []
+    for this_partition, this_range in zip(partition_list, range_list):
+        folder = os.path.join(path, this_partition)
+        entry = {'folder': this_partition, 'first_tx': this_range[0], 'last_tx': this_range[1], 'file': {}}
+        for table_name in manifest_file_list:
+            file_name = find_file(table_name + '.csv', folder)
+            if os.path.isfile(os.path.join(folder, file_name)):
+                entry['file'][table_name] = file_info(file_name, folder, checksum, previous_file.get(this_partition, {}).get(table_name))
+            for part_file in utility_function.part_file_list(file_name, folder):  # appended rows, e.g. tx_output.part_1
+                part_name = os.path.splitext(part_file)[0]
+                entry['file'][part_name] = file_info(part_file, folder, checksum, previous_file.get(this_partition, {}).get(part_name))
+        patch_file = os.path.relpath(utility_function.spent_patch_file(path, this_partition), path)
+        if os.path.isfile(os.path.join(path, patch_file)):  # kept with the partition entry, the file is in the index folder of the dataset
+            previous_patch = [item.get('spent_patch') for item in (previous['partition'] if previous is not None else []) if item['folder'] == this_partition]
+            entry['spent_patch'] = file_info(patch_file, path, checksum, previous_patch[0] if len(previous_patch) > 0 else None)
+        previous_entry = [item for item in (previous['partition'] if previous is not None else []) if item['folder'] == this_partition]
+        if len(previous_entry) > 0 and table_entry(previous_entry[0]['file'], 'tx_height') == table_entry(entry['file'], 'tx_height'):  # unchanged tx_height
+            entry['first_block'], entry['last_block'] = previous_entry[0]['first_block'], previous_entry[0]['last_block']
+        else:
+            tx_height = read_option(find_file('tx_height.csv', folder), folder, columns=['block_index'])
+            entry['first_block'], entry['last_block'] = int(tx_height['block_index'].min()), int(tx_height['block_index'].max())
+        partition_entry_list.append(entry)
+
+    manifest = {'version': manifest_version,
+                'created': pd.Timestamp.now().isoformat(),
+                'tx_range': [range_list[0][0], range_list[-1][1]] if len(range_list) > 0 else None,
+                'block_range': [partition_entry_list[0]['first_block'], partition_entry_list[-1]['last_block']] if len(range_list) > 0 else None,
+                'root_file': root_file,
+                'partition': partition_entry_list}
+    if save:
+        with open(os.path.join(path, manifest_filename), 'w') as f:
+            json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def has_manifest(path):
+    """Check if the dataset in path has a manifest"""
+    return os.path.isfile(os.path.join(path, manifest_filename))
+
+
+def load_manifest(path):
+    """
+    Read the manifest of a dataset.
+
+    :param path: String of folder path of the dataset e.g., 'sampledata/'.
+
+    :return: Dictionary of the manifest, None if the dataset has no manifest.
+    """
+
+    if not has_manifest(path):
+        return None
+    with open(os.path.join(path, manifest_filename)) as f:
+        return json.load(f)
+
+
+def check_manifest(path, manifest, checksum=False):
+    """
+    Validate a manifest against the files of the dataset, by file size (no file is read) or also by checksum.
+
+    :param path: String of folder path of the dataset e.g., 'sampledata/'.
+    :param manifest: Dictionary of the manifest.
+    :param checksum: Also compare md5 checksums (reads every file).
+
+    :return: List of the files that are missing or changed, empty list for a valid manifest.
+    """
+
+    changed = []
+    folder_file_list = [('', manifest['root_file'])] + [(this_partition['folder'], this_partition['file']) for this_partition in manifest['partition']]
+    folder_file_list += [('', {'spent_patch': this_partition['spent_patch']}) for this_partition in manifest['partition'] if 'spent_patch' in this_partition]
+    for folder, file_dict in folder_file_list:
+        for entry in file_dict.values():
+            file_path = os.path.join(path, folder, entry['file'])
+            if not os.path.isfile(file_path) or os.path.getsize(file_path) != entry['size']:
+                changed.append(folder + entry['file'])
+            elif checksum and entry.get('checksum') is not None and file_checksum(file_path) != entry['checksum']:
+                changed.append(folder + entry['file'])
+    return changed
+
+
+def table_entry(file_dict, table_name):
+    """Manifest entries of a data file and of its part files (appended rows) from the file dictionary of a partition"""
+    return {name: entry for name, entry in file_dict.items() if name == table_name or name.startswith(table_name + utility_function.part_tag)}
+
+
+def manifest_rows(manifest, table_name='tx_output'):
+    """
+    Number of rows of a data file in each partition of the manifest, for planning reads.
+
+    :param manifest: Dictionary of the manifest.
+    :param table_name: Data file name without extension.
+
+    :return: DataFrame with partition folder as index and first_tx, last_tx and rows columns.
+    """
+
+    return pd.DataFrame([[this_partition['folder'], this_partition['first_tx'], this_partition['last_tx'],
+                          sum([entry['rows'] for entry in table_entry(this_partition['file'], table_name).values()])]
+                         for this_partition in manifest['partition']],
+                        columns=['folder', 'first_tx', 'last_tx', 'rows']).set_index('folder')
@@ -86,7 +86,7 @@ def neo4j_export(tttx, export_path='export/', option='detailed'):
         df2.to_csv(os.path.join(export_path, 'tx_height.csv'), header=False)
 
         # txhash.csv for list of tx hash
-        df2 = tttx.tx_check(input_type="index", tx=tttx.tx_tainted.index)
+        df2 = tttx.tx_check(input_type="tx_index", tx=tttx.tx_tainted.index)
         df2.to_csv(os.path.join(export_path, 'tx_hash.csv'), header=False)
         # create header file for csv import to neo4j
 
@@ -182,7 +182,7 @@ def neo4j_export(tttx, export_path='export/', option='detailed'):
         df2.to_csv(os.path.join(export_path, 'rel_addressinput.csv'), header=False)
 
         # txhash.csv for list of tx
-        df2 = tttx.tx_check(input_type="index", tx=tttx.tx_tainted.index)
+        df2 = tttx.tx_check(input_type="tx_index", tx=tttx.tx_tainted.index)
 
         df2['block'] = tttx.tx_height[tttx.tx_height.index.isin(df2.index)]['block_index'].values.tolist()
         df2.to_csv(os.path.join(export_path, 'txhash.csv'), header=False)
@@ -222,10 +222,10 @@ def neo4j_export(tttx, export_path='export/', option='detailed'):
         export_path += 'outputonly/'
         df2 = tttx.tx_output
         df2 = df2[df2.index.isin(tttx.tx_tainted.index)]
-        df3 = tttx.tx_check(input_type="index", tx=tttx.tx_tainted.index)
+        df3 = tttx.tx_check(input_type="tx_index", tx=tttx.tx_tainted.index)
         df2 = df2.append(df3)
         address_list = tttx.tx_tainted['address_index'].tolist()
-        addressdf = tttx.address_check(address_list)
+        addressdf = tttx.adr_check(input_type='adr_index', adr=address_list)
         addressdf = addressdf[addressdf.index.isin(address_list)]
         addressdf = addressdf.reset_index()
         df2 = df2.merge(addressdf, left_on="address_index", right_on="address_index")
@@ -251,7 +251,7 @@ def neo4j_export(tttx, export_path='export/', option='detailed'):
         address_list = address_list + input_address
         df2 = pd.DataFrame()
         # make one adr into list so can be used with pandas isin command
-        addressdf = tttx.address_check(address_list)
+        addressdf = tttx.adr_check(input_type='adr_index', adr=address_list)
         addressdf = addressdf[addressdf.index.isin(address_list)]
         df2 = df2.append(addressdf)
         # stop searching when found all input adr
@@ -0,0 +1,156 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utility import spend_graph
+from utility import haircut
+from utility import interval_taint
+from utility import taint_record
+
+logging.getLogger().setLevel(logging.INFO)
+pd.options.mode.chained_assignment = None  # default='warn'
+
+lookup_node = spend_graph.lookup_node
+
+min_parallel_row = 20000  # tx_tainted rows below this are distributed in the main process
+part_per_worker = 4  # parts of the cone for each worker, for balance when one component is much larger than the others
+
+
+def weak_component(link_src, link_dst, node_count):
+    """
+    Weakly connected components of a graph: the smallest node of the component is pushed over the links (both ways) with pointer jumping until nothing changes.
+
+    :param link_src: Source node of each link.
+    :param link_dst: Destination node of each link.
+    :param node_count: Number of nodes.
+
+    :return: Array of component number of each node, components are numbered in the order of their smallest node.
+    """
+
+    label = np.arange(node_count)
+    while True:
+        low = np.minimum(label[link_src], label[link_dst])
+        new = label.copy()
+        np.minimum.at(new, link_src, low)
+        np.minimum.at(new, link_dst, low)
+        new = new[new]
+        if np.array_equal(new, label):
+            break
+        label = new
+    return np.unique(label, return_inverse=True)[1]
+
+
+def split_component(component, size, part_count):
+    """
+    Split the components into parts with about the same size, components are kept whole and in order.
+
+    :param component: Component number of each node.
+    :param size: Size (e.g., tx_tainted rows) of each node.
+    :param part_count: Number of parts.
+
+    :return: List of sorted node arrays, empty parts are left out.
+    """
+
+    component_size = np.cumsum(np.bincount(component, weights=size))
+    cut = np.searchsorted(component_size, component_size[-1] * np.arange(1, part_count) / part_count, side='right')
+    cut = np.unique(np.concatenate([[0], cut, [len(component_size)]]))
+    return [np.flatnonzero((component >= start) & (component < end)) for start, end in zip(cut[:-1], cut[1:])]
+
+
+def cone_part(tx_tainted, tx_output, part_count):
+    """
+    Parts of the tainted transactions that can be distributed apart: transactions linked by spending (in tx_tainted or tx_output) are in the same part.
+
+    :param tx_tainted: DataFrame from tx_taint_search.
+    :param tx_output: tx_output of the tainted transactions.
+    :param part_count: Number of parts.
+
+    :return: Tuple (sorted tx index of the cone, list of sorted tx index arrays of each part).
+    """
+
+    cone = np.unique(tx_tainted['tx_index'].values.astype('int64'))
+    link_src = np.concatenate([tx_tainted['tx_index'].values, tx_output['tx_index'].values]).astype('int64')
+    link_dst = np.concatenate([tx_tainted['spent_index'].values, tx_output['spent_index'].values]).astype('float64')
+    link_src, link_dst = lookup_node(cone, link_src), lookup_node(cone, np.where(np.isnan(link_dst), -1, link_dst))
+    kept = (link_src >= 0) & (link_dst >= 0)
+    component = weak_component(link_src[kept], link_dst[kept], len(cone))
+    size = np.bincount(lookup_node(cone, tx_tainted['tx_index'].values), minlength=len(cone))
+    part_list = split_component(component, size, part_count)
+    logging.info(str(len(cone)) + ' transactions in ' + str(int(component.max(initial=-1)) + 1) + ' components, ' + str(len(part_list)) + ' parts')
+    return cone, [cone[part] for part in part_list]
+
+
+def policy_job(job):
+    """Distribute one part of the cone in a worker process, job is (policy, dictionary of keyword arguments of the kernel)"""
+    policy, kwarg = job
+    if policy == 'haircut':
+        return haircut.haircut_taint(**kwarg)
+    return interval_taint.in_out_taint(policy=policy, **kwarg)
+
+
+def run_job(job_list, workers):
+    """Run policy_job over the jobs in a process pool, results in job order"""
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(policy_job, job_list))
+
+
+def in_out_taint(tx_tainted, tx_input, tx_output, record, policy, test=0, show_progress=False, workers=2, plan=None):
+    """
+    utility.interval_taint.in_out_taint with the independent parts of the cone (cone_part) distributed in worker processes.
+    Every part gets its transactions, inputs, outputs and the record rows they spend, and the record rows of the parts are merged
+    in (tx index, step) order, so the result is the same as the one process distribution. Small cones and test runs (test takes
+    transactions in tx index order across the whole cone) are distributed in this process.
+
+    :param tx_tainted: DataFrame from tx_taint_search.
+    :param tx_input: tx_input of the tainted transactions, with fee distributed.
+    :param tx_output: tx_output of the tainted transactions.
+    :param record: utility.taint_record.TaintRecord of the tainted target outputs (or of the previous run), the new rows are appended to it.
+    :param policy: Lower case policy name.
+    :param test: Number to limit how many transactions to distribute (in tx index order), 0 means all.
+    :param show_progress: Log each level.
+    :param workers: Number of worker processes.
+    :param plan: Optional dictionary from utility.interval_taint.taint_plan of the same data, used when distributing in this process.
+
+    :return: Tuple (tx_tainted without the distributed transactions, DataFrame of distributed outputs, TaintRecord).
+    """
+
+    if workers <= 1 or test > 0 or len(tx_tainted) < min_parallel_row:
+        return interval_taint.in_out_taint(tx_tainted, tx_input, tx_output, record, policy, test, show_progress, plan)
+    cone, part_list = cone_part(tx_tainted, tx_output, workers * part_per_worker)
+    record_spent = record.column('spent_index')
+    job_list = []
+    for part in part_list:
+        part_record = record.take(np.isin(record_spent, part))
+        job_list.append((policy, {'tx_tainted': tx_tainted[tx_tainted['tx_index'].isin(part)], 'tx_input': tx_input[tx_input['tx_index'].isin(part)],
+                                  'tx_output': tx_output[tx_output['tx_index'].isin(part)], 'record': part_record, 'show_progress': show_progress}))
+    result_list = run_job(job_list, workers)
+
+    part_record = [result[2].take(np.arange(len(job[1]['record']), len(result[2]))) for job, result in zip(job_list, result_list)]  # rows added by the part
+    part_tx = np.concatenate([this_record.column('tx_index') for this_record in part_record])
+    row = np.argsort(part_tx, kind='stable')
+    record.append({column: np.concatenate([this_record.column(column) for this_record in part_record])[row] for column in taint_record.record_column})
+    return pd.concat([result[0] for result in result_list]), pd.concat([result[1] for result in result_list]), record
+
+
+def haircut_taint(tx_tainted, tx_input, test=0, workers=2):
+    """
+    utility.haircut.haircut_taint with the independent parts of the cone (cone_part) distributed in worker processes, the same result
+    as the one process distribution. Small cones and test runs are distributed in this process.
+
+    :param tx_tainted: DataFrame from tx_taint_search, rows without taint_value are distributed.
+    :param tx_input: tx_input data.
+    :param test: Number to limit how many transactions to distribute (in tx index order), 0 means all.
+    :param workers: Number of worker processes.
+
+    :return: DataFrame of tx_tainted with taint_value and clean_value, transactions not distributed have taint_value 0.
+    """
+
+    if workers <= 1 or test > 0 or len(tx_tainted) < min_parallel_row:
+        return haircut.haircut_taint(tx_tainted, tx_input, test)
+    cone, part_list = cone_part(tx_tainted, tx_tainted, workers * part_per_worker)
+    tx_input = tx_input[tx_input['tx_index'].isin(cone)]
+    job_list = [('haircut', {'tx_tainted': tx_tainted[tx_tainted['tx_index'].isin(part)], 'tx_input': tx_input[tx_input['tx_index'].isin(part)]})
+                for part in part_list]
+    return pd.concat(run_job(job_list, workers)).sort_index()
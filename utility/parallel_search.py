@@ -0,0 +1,169 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from utility import spend_graph
+
+logging.getLogger().setLevel(logging.INFO)
+pd.options.mode.chained_assignment = None  # default='warn'
+
+csr_edge = spend_graph.csr_edge
+
+min_parallel_edge = 100000  # levels with fewer frontier edges are searched in the main process
+chunk_per_worker = 4  # frontier chunks of a level for each worker, for balance when some transactions have many outputs
+shared_array = {}  # shared memory arrays attached in a worker process
+
+
+def share_array(array_dict):
+    """
+    Copy arrays into shared memory blocks that worker processes can open without copying.
+
+    :param array_dict: Dictionary of name to array.
+
+    :return: Tuple (list of SharedMemory blocks to close and unlink, dictionary of name to (block name, dtype, shape) for attach_shared,
+    dictionary of name to array views of the blocks).
+    """
+
+    block_list, spec, view = [], {}, {}
+    for name, array in array_dict.items():
+        array = np.asarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        view[name] = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        view[name][...] = array
+        block_list.append(block)
+        spec[name] = (block.name, array.dtype.str, array.shape)
+    return block_list, spec, view
+
+
+def attach_shared(spec):
+    """Open the shared memory blocks of share_array in a worker process, initializer of the process pool"""
+    for name, (block_name, dtype, shape) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        shared_array[name] = (block, np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf))
+
+
+def expand(indptr, edge_dst, blocked, searched, frontier):
+    """
+    Search one part of a level: the frontier transactions with at least one output not blocked, and the transactions spending those outputs.
+
+    :param indptr: Row pointer array of the spend graph.
+    :param edge_dst: Spending node of each edge, -1 for none.
+    :param blocked: Boolean array over the edges, None when nothing is blocked.
+    :param searched: Boolean array of the nodes searched in the previous levels.
+    :param frontier: Sorted array of frontier nodes.
+
+    :return: Tuple (sorted reached nodes, sorted unique next nodes not searched in the previous levels).
+    """
+
+    edge = csr_edge(indptr, frontier)
+    source = np.repeat(np.arange(len(frontier)), indptr[frontier + 1] - indptr[frontier])
+    if blocked is not None:
+        kept = ~blocked[edge]
+        edge, source = edge[kept], source[kept]
+    reached = frontier[np.unique(source)]
+    next_node = np.unique(edge_dst[edge])
+    next_node = next_node[next_node >= 0]
+    return reached, next_node[~searched[next_node]]
+
+
+def expand_job(job):
+    """Run expand in a worker process for the frontier positions [start, end) of the shared frontier array"""
+    start, end = job
+    array = {name: value[1] for name, value in shared_array.items()}
+    return expand(array['indptr'], array['edge_dst'], array.get('blocked'), array['searched'], array['frontier'][start:end])
+
+
+def split_frontier(indptr, frontier, part_count):
+    """
+    Split a frontier into parts with about the same number of edges.
+
+    :param indptr: Row pointer array of the spend graph.
+    :param frontier: Array of frontier nodes.
+    :param part_count: Number of parts.
+
+    :return: List of (start, end) positions in the frontier, empty parts are left out.
+    """
+
+    edge_count = np.cumsum(indptr[frontier + 1] - indptr[frontier])
+    cut = np.searchsorted(edge_count, edge_count[-1] * np.arange(1, part_count) / part_count, side='right')
+    cut = np.unique(np.concatenate([[0], cut, [len(frontier)]]))
+    return [(int(start), int(end)) for start, end in zip(cut[:-1], cut[1:])]
+
+
+def search_level(graph, state, depth_limit=-1, blocked=None, workers=2):
+    """
+    Generator of the levels of utility.spend_graph.SpendGraph.search_level with each level split over worker processes.
+    The graph arrays, the blocked edges, the searched bitmap and the frontier are put into shared memory once, every worker expands
+    a part of the frontier and the parts are merged in frontier order into sorted unique arrays, so the result is the same as the one process search.
+
+    :param graph: SpendGraph to search.
+    :param state: State dictionary from SpendGraph.start or an earlier search, updated in place.
+    :param depth_limit: Limit how many transaction depth to search, -1 for no limit.
+    :param blocked: Optional boolean array over the edges from SpendGraph.blocked_edge.
+    :param workers: Number of worker processes.
+
+    :return: Yields tuple (array of nodes tainted in the level, their depth).
+    """
+
+    indptr = np.asarray(graph.indptr)
+    array_dict = {'indptr': indptr, 'edge_dst': graph.edge_dst, 'searched': state['searched'],
+                  'frontier': np.zeros(len(graph.node_tx), dtype='int64')}
+    if blocked is not None:
+        array_dict['blocked'] = blocked
+    block_list, spec, view = share_array(array_dict)
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=attach_shared, initargs=(spec,))
+    depth_of, searched = state['depth_of'], view['searched']
+    state['searched'] = searched
+    try:
+        frontier, label, depth = state['frontier'], state['label'], state['depth']
+        while depth != depth_limit and len(frontier) > 0:
+            edge_count = int((indptr[frontier + 1] - indptr[frontier]).sum())
+            if edge_count < min_parallel_edge:
+                part_list = [expand(indptr, view['edge_dst'], view.get('blocked'), searched, frontier)]
+            else:
+                view['frontier'][:len(frontier)] = frontier
+                part_list = list(executor.map(expand_job, split_frontier(indptr, frontier, workers * chunk_per_worker)))
+            reached = np.concatenate([part[0] for part in part_list])  # parts are in frontier order, reached stays sorted
+            new = reached[depth_of[reached] < 0]
+            depth_of[new] = label
+            searched[reached] = True
+            frontier = np.unique(np.concatenate([part[1] for part in part_list]))
+            frontier = frontier[~searched[frontier]]
+            new_label = label
+            label = depth
+            depth += 1
+            state.update({'frontier': frontier, 'label': label, 'depth': depth})
+            yield new, new_label
+    finally:
+        executor.shutdown()
+        state['searched'] = np.array(searched)  # copy out before the shared block is removed
+        del view, searched
+        for block in block_list:
+            block.close()
+            block.unlink()
+
+
+def search(graph, target_tx, depth_limit=-1, blocked=None, state=None, checkpoint=None, workers=2):
+    """
+    utility.spend_graph.SpendGraph.search with the levels split over worker processes (search_level).
+
+    :param graph: SpendGraph to search.
+    :param target_tx: List of tx index to start from.
+    :param depth_limit: Limit how many transaction depth to search, -1 for no limit.
+    :param blocked: Optional boolean array over the edges from SpendGraph.blocked_edge.
+    :param state: Optional dictionary from an earlier search to continue.
+    :param checkpoint: Optional function called with the state dictionary after every level.
+    :param workers: Number of worker processes.
+
+    :return: State dictionary, 'depth_of' is the depth of each node (-1 for untainted nodes).
+    """
+
+    if state is None:
+        state = graph.start(target_tx)
+    for _ in search_level(graph, state, depth_limit, blocked, workers):
+        if checkpoint is not None:
+            checkpoint(state)
+    return state
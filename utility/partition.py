@@ -0,0 +1,171 @@
+import logging
+import os.path
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utility import utility_function
+
+logging.getLogger().setLevel(logging.INFO)
+pd.options.mode.chained_assignment = None  # default='warn'
+
+read_option = utility_function.read_option
+write_option = utility_function.write_option
+find_file = utility_function.find_file
+
+partition_key_file = 'tx_height.csv'  # a folder with this data file (in any stored format) is a partition
+tx_range_filename = 'tx_range.csv'  # tx range of the year partitions, in the dataset folder
+month_range_filename = 'month_range.csv'  # tx range of the month partitions, in the year folder
+month_file_list = ['tx_input', 'tx_output', 'tx_height', 'tx_hash', 'adr_hash']
+root_file_list = ['block', 'tx_range']  # dataset folder files copied along with the month folders
+
+
+def digit_folder_list(path):
+    """List of the sub folders named with a number in path, in number order"""
+    return sorted([x.name for x in Path(path).iterdir() if x.is_dir() and x.name.isdigit()], key=int)
+
+
+def is_partition(path):
+    """Check if the folder in path holds partition data files"""
+    return os.path.isfile(os.path.join(path, find_file(partition_key_file, path)))
+
+
+def find_partition(path):
+    """
+    Find the data partitions of a dataset, either year folders (YYYY/) or month folders inside a year folder (YYYY/MM/).
+    A year folder with month folders is read by month, the data files of the year folder itself are then ignored.
+
+    :param path: String of folder path of the dataset e.g., 'sampledata/'.
+
+    :return: List of partition folders relative to path in tx index order e.g., ['2009/', '2010/01/', '2010/02/'].
+    """
+
+    partition_list = []
+    for year in digit_folder_list(path):
+        year_path = os.path.join(path, year)
+        month_list = [month for month in digit_folder_list(year_path) if is_partition(os.path.join(year_path, month))]
+        if len(month_list) > 0:
+            partition_list += [year + '/' + month + '/' for month in month_list]
+        elif is_partition(year_path):
+            partition_list.append(year + '/')
+    return partition_list
+
+
+def partition_year(partition):
+    """Year number of a partition folder e.g., 2010 for '2010/01/'"""
+    return int(partition.split('/')[0])
+
+
+def partition_range(path, partition_list):
+    """
+    Find the first and last tx index of each partition.
+    Year partitions use the tx_range file of the dataset folder and month partitions the month_range file of their year folder,
+    partitions missing from the range files are read from their tx_height file.
+
+    :param path: String of folder path of the dataset e.g., 'sampledata/'.
+    :param partition_list: List of partition folders from find_partition.
+
+    :return: List of [first tx index, last tx index] of each partition.
+    """
+
+    range_file = {}  # range file of each folder, read once
+    range_list = []
+    for partition in partition_list:
+        part = partition.strip('/').split('/')
+        folder = '' if len(part) == 1 else part[0] + '/'
+        file_name = tx_range_filename if len(part) == 1 else month_range_filename
+        if folder not in range_file:
+            range_path = os.path.join(path, folder)
+            this_file = find_file(file_name, range_path)
+            range_file[folder] = read_option(this_file, range_path) if os.path.isfile(os.path.join(range_path, this_file)) else pd.DataFrame()
+        range_df = range_file[folder]
+        if int(part[-1]) in range_df.index:
+            range_list.append([int(range_df.loc[int(part[-1]), 'first_tx']), int(range_df.loc[int(part[-1]), 'last_tx'])])
+        else:
+            tx_height = read_option(find_file(partition_key_file, os.path.join(path, partition)), os.path.join(path, partition), columns=[])
+            range_list.append([int(tx_height.index.min()), int(tx_height.index.max())])
+    return range_list
+
+
+def split_month(path, out_path=None):
+    """
+    Split the year folders of a dataset into month folders (YYYY/MM/) by block time, with a month_range file in each year folder.
+    Files keep their stored format, addresses of adr_hash go to the month of their first output in the year.
+    The block times come from the block file of the dataset folder, the block and tx_range files are copied into out_path.
+
+    :param path: String of folder path of the dataset in year folders with a block file e.g., 'fulldatabases/'.
+    :param out_path: String of folder path for the month folders, None to write them next to the year files (the year files are then no longer read).
+
+    :return: DataFrame with the tx range and number of rows of each month folder.
+    """
+
+    from utility import time_index
+
+    if out_path is None:
+        out_path = path
+    if not os.path.isfile(os.path.join(path, find_file('block.csv', path))):
+        raise Exception('No block file in ' + path + ', the block time of each block (block.csv) is needed to split the years into months')
+    lookup = time_index.build_time_index(path, save=False)
+    if os.path.abspath(out_path) != os.path.abspath(path):
+        if not os.path.isdir(out_path):
+            os.makedirs(out_path)
+        for table_name in root_file_list:
+            file_name = find_file(table_name + '.csv', path)
+            if os.path.isfile(os.path.join(path, file_name)):
+                shutil.copy2(os.path.join(path, file_name), os.path.join(out_path, file_name))
+    split = pd.DataFrame(columns=['folder', 'first_tx', 'last_tx', 'rows'])
+    for year in digit_folder_list(path):
+        year_path = os.path.join(path, year)
+        if not is_partition(year_path):
+            continue
+        logging.info('splitting ' + year)
+        df_dict = {}
+        for table_name in month_file_list:
+            file_name = find_file(table_name + '.csv', year_path)
+            if os.path.isfile(os.path.join(year_path, file_name)):
+                df_dict[file_name] = read_option(file_name, year_path)
+        tx_height = read_option(find_file(partition_key_file, year_path), year_path, columns=[])
+        year_range = [int(tx_height.index.min()), int(tx_height.index.max())]
+
+        month_range = pd.DataFrame(columns=['first_tx', 'last_tx'])
+        month_range.index = month_range.index.set_names('month')
+        for month in range(1, 12 + 1):
+            start_time = pd.Timestamp(year=int(year), month=month, day=1)
+            tx_range = lookup.time_range_tx(start_time, start_time + pd.DateOffset(months=1) - pd.Timedelta(1, 'ns'))
+            if tx_range is None or tx_range[1] < year_range[0] or tx_range[0] > year_range[1]:
+                continue
+            month_range.loc[month] = [max(tx_range[0], year_range[0]), min(tx_range[1], year_range[1])]
+        if len(month_range) == 0:
+            continue
+        month_range['first_tx'] = month_range['last_tx'].shift(1) + 1  # months are contiguous, no tx is left out
+        month_range.iloc[0, 0] = year_range[0]
+        month_range.iloc[-1, 1] = year_range[1]
+        month_range = month_range.astype('int64')
+
+        adr_month = None
+        output_file = [file_name for file_name in df_dict if file_name.startswith('tx_output')]
+        if len(output_file) > 0:  # month of the first output of each address
+            adr_month = df_dict[output_file[0]].groupby('adr_index')['tx_index'].min()
+            adr_month = pd.Series(month_range.index.values[np.searchsorted(month_range['last_tx'].values, adr_month.values).clip(0, len(month_range) - 1)], index=adr_month.index)
+        for month, (first_tx, last_tx) in month_range.iterrows():
+            month_folder = os.path.join(out_path, year, '%02d' % month)
+            if not os.path.isdir(month_folder):
+                os.makedirs(month_folder)
+            rows = 0
+            for file_name, df in df_dict.items():
+                if file_name.startswith('adr_hash'):
+                    if adr_month is None:
+                        this_df = df if month == month_range.index[0] else df.iloc[0:0]
+                    else:
+                        this_month = adr_month.reindex(df.index).fillna(month_range.index[0])
+                        this_df = df[(this_month == month).values]
+                else:
+                    tx_index = df['tx_index'] if 'tx_index' in df.columns else df.index.to_series()
+                    this_df = df[((tx_index >= first_tx) & (tx_index <= last_tx)).values]
+                write_option(this_df, file_name, month_folder)
+                rows += len(this_df)
+            split.loc[len(split)] = [year + '/' + '%02d' % month + '/', first_tx, last_tx, rows]
+        write_option(month_range, month_range_filename, os.path.join(out_path, year))
+    return split
@@ -5,6 +5,8 @@ import time
 import logging
 import pandas as pd
 
+from utility import utility_function
+
 logging.getLogger().setLevel(logging.INFO)
 pd.options.mode.chained_assignment = None  # default='warn'
 
@@ -28,8 +30,8 @@ def coinjoin_find(wasabi_pattern, tx_input, tx_output):
     coinjoin_tx = pd.DataFrame()
 
     # wasabi coinjoin_tx
-    tx_input['adr_type'] = tx_input['adr_index'] % 10
-    tx_output['adr_type'] = tx_output['adr_index'] % 10
+    tx_input['adr_type'] = utility_function.adr_type(tx_input)
+    tx_output['adr_type'] = utility_function.adr_type(tx_output)
 
     tx_input = tx_input[~tx_input.index.isin(tx_input[tx_input['adr_type'] != adr_witness_pubkeyhash].index)]  # general 5, address type must be this type only
     tx_output = tx_output[~tx_output.index.isin(tx_output[tx_output['adr_type'] != adr_witness_pubkeyhash].index)]  # general 5, address type must be this type only
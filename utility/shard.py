@@ -0,0 +1,445 @@
+import logging
+import multiprocessing
+import os
+import os.path
+import traceback
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+import pandas as pd
+
+from utility import utility_function
+from utility import column_store
+from utility import spend_graph
+from utility import address_graph
+
+logging.getLogger().setLevel(logging.INFO)
+pd.options.mode.chained_assignment = None  # default='warn'
+
+find_file = utility_function.find_file
+read_job = utility_function.read_job
+csr_edge = spend_graph.csr_edge
+
+local_host = '127.0.0.1'
+
+
+def group_partition(partition_list, range_list, shard_count):
+    """
+    Split the partitions of a dataset into contiguous groups with about the same number of transactions.
+
+    :param partition_list: List of partition folders in tx index order.
+    :param range_list: [first tx index, last tx index] of each partition.
+    :param shard_count: Number of groups.
+
+    :return: List of (partition list, [first tx index, last tx index]) of each non-empty group.
+    """
+
+    tx_count = np.cumsum([this_range[1] - this_range[0] + 1 for this_range in range_list])
+    cut = np.searchsorted(tx_count, tx_count[-1] * np.arange(1, shard_count) / shard_count, side='left') + 1
+    cut = np.unique(np.concatenate([[0], cut.clip(0, len(partition_list)), [len(partition_list)]]))
+    return [(partition_list[start:end], [range_list[start][0], range_list[end - 1][1]]) for start, end in zip(cut[:-1], cut[1:])]
+
+
+def shard_spend_graph(table):
+    """
+    Spend graph (utility.spend_graph.build_spend_graph) of the rows of a shard, where edge_dst holds the tx index of the spending transaction
+    (-1 for unspent outputs) instead of its node, as the spending transaction may be in another shard.
+
+    :param table: tx_output (or tx_input for the reverse graph) dataframe or ColumnStore of the shard.
+
+    :return: SpendGraph object.
+    """
+
+    tx_index, adr_index, spent_index = spend_graph.table_array(table)
+    order = np.argsort(tx_index, kind='stable')
+    node_tx, count = np.unique(tx_index, return_counts=True)
+    indptr = np.zeros(len(node_tx) + 1, dtype='int64')
+    np.cumsum(count, out=indptr[1:])
+    edge_dst = np.where(spent_index == column_store.no_spent, -1, spent_index)[order]
+    return spend_graph.SpendGraph({'node_tx': node_tx.astype('int64'), 'indptr': indptr, 'edge_dst': edge_dst, 'edge_adr': adr_index[order]})
+
+
+class Shard(object):
+    def __init__(self):
+        """
+        Part of the dataset owned by one shard process, with the graphs and search state of its transactions.
+        The methods are called by ShardEngine through serve.
+        """
+
+        self.table = {}
+        self.graph = {}
+        self.state = {}
+
+    def load(self, path, partition_list, tx_range, storage='pandas', schema='default'):
+        """
+        Open the data of the shard, tx_input and tx_output are read (or opened as column store views in 'mmap' storage) when first used.
+
+        :param path: Folder path of the dataset on the machine of the shard.
+        :param partition_list: Partition folders of the shard.
+        :param tx_range: [first tx index, last tx index] owned by the shard.
+        :param storage: 'pandas' or 'mmap', see TaintedTX.
+        :param schema: 'default' or 'compact', see TaintedTX.
+
+        :return: Process id of the shard.
+        """
+
+        self.path, self.partition_list, self.tx_range = path, partition_list, tx_range
+        self.storage, self.schema = storage, schema
+        self.table, self.graph, self.state = {}, {}, {}
+        return os.getpid()
+
+    def get_table(self, table_name):
+        """tx_input or tx_output rows of the shard, a dataframe or a ColumnStore in 'mmap' storage"""
+        if table_name not in self.table:
+            path_list = [os.path.join(self.path, this_partition) for this_partition in self.partition_list]
+            if self.storage == 'mmap':
+                table = column_store.ColumnStore.open(table_name, path_list).window(self.tx_range[0], self.tx_range[1])
+            else:
+                table_schema = None if self.schema == 'default' else (table_name, self.schema)
+                df_list = [read_job({'file_name': find_file(table_name + '.csv', folder), 'path': folder, 'tx_range': self.tx_range,
+                                     'schema': table_schema}) for folder in path_list]
+                df_list = [df for df in df_list if len(df.columns) > 0]
+                table = pd.concat(df_list) if len(df_list) > 0 else pd.DataFrame()
+            self.table[table_name] = table
+        return self.table[table_name]
+
+    def rows(self, table_name, tx_list):
+        """Rows of the shard for the transactions in tx_list with tx_index as index, in row order"""
+        table = self.get_table(table_name)
+        if isinstance(table, column_store.ColumnStore):
+            table = table.select('tx_index', tx_list).to_frame(schema=self.schema)
+        if 'tx_index' in table.columns:
+            return table[table['tx_index'].isin(tx_list)].reset_index().set_index('tx_index')
+        rows = table[table.index.isin(tx_list)]
+        rows.index.names = ['tx_index']
+        return rows
+
+    def get_graph(self, name):
+        """Graph of the shard: 'forward' (tx_output), 'backward' (tx_input) or 'address'"""
+        if name not in self.graph:
+            if name == 'address':
+                self.graph[name] = address_graph.build_address_graph(self.get_table('tx_input'), self.get_table('tx_output'))
+            else:
+                self.graph[name] = shard_spend_graph(self.get_table('tx_input' if name == 'backward' else 'tx_output'))
+        return self.graph[name]
+
+    def tx_start(self, target_tx, backward=False, limit_adr=None, limit_tx=None):
+        """
+        Start a tx taint search, see utility.spend_graph.SpendGraph.start.
+
+        :param target_tx: List of target tx index (targets of other shards are ignored).
+        :param backward: Search with the reverse graph.
+        :param limit_adr: Optional list of adr index excluded during tainting.
+        :param limit_tx: Optional list of tx index excluded during tainting.
+
+        :return: Array of tx index of the first frontier (spending transactions of the target outputs).
+        """
+
+        graph = self.get_graph('backward' if backward else 'forward')
+        depth_of = np.full(len(graph), -1, dtype='int64')
+        target = graph.node(target_tx)
+        target = np.unique(target[target >= 0])
+        depth_of[target] = 0
+        self.state = {'graph': graph, 'depth_of': depth_of, 'searched': np.zeros(len(graph), dtype=bool),
+                      'blocked': graph.blocked_edge(limit_adr, limit_tx), 'limit_adr': limit_adr, 'limit_tx': limit_tx,
+                      'table_name': 'tx_input' if backward else 'tx_output'}
+        next_tx = np.unique(graph.edge_dst[graph.edge(target)])
+        return next_tx[next_tx >= 0]
+
+    def tx_level(self, frontier_tx, label):
+        """
+        Search one level of the tx taint search for the frontier transactions of the shard, see utility.spend_graph.SpendGraph.search_level.
+
+        :param frontier_tx: Array of frontier tx index owned by the shard.
+        :param label: Depth of the transactions tainted in the level.
+
+        :return: Array of tx index of the next frontier, in any shard.
+        """
+
+        graph, depth_of, searched, blocked = self.state['graph'], self.state['depth_of'], self.state['searched'], self.state['blocked']
+        frontier = graph.node(frontier_tx)
+        frontier = np.unique(frontier[frontier >= 0])
+        frontier = frontier[~searched[frontier]]
+        edge = graph.edge(frontier)
+        if blocked is not None:
+            edge = edge[~blocked[edge]]
+        reached = np.unique(graph.edge_node(edge))
+        depth_of[reached[depth_of[reached] < 0]] = label
+        searched[reached] = True
+        next_tx = np.unique(graph.edge_dst[edge])
+        return next_tx[next_tx >= 0]
+
+    def tx_rows(self):
+        """
+        Rows of the transactions tainted in the shard, the rows excluded during tainting are left out except for the targets.
+
+        :return: DataFrame with tx_index as index and depth column, in row order.
+        """
+
+        graph, depth_of = self.state['graph'], self.state['depth_of']
+        found = np.flatnonzero(depth_of >= 0)
+        depth = pd.Series(depth_of[found], index=np.asarray(graph.node_tx)[found])
+        rows = self.rows(self.state['table_name'], depth.index.values)
+        rows['depth'] = depth.reindex(rows.index).values
+        excluded = np.zeros(len(rows), dtype=bool)
+        if self.state['limit_adr'] is not None:
+            excluded |= rows['adr_index'].isin(self.state['limit_adr']).values
+        if self.state['limit_tx'] is not None:
+            excluded |= rows.index.isin(self.state['limit_tx'])
+        return rows[~excluded | (rows['depth'].values == 0)]
+
+    def adr_start(self, target_adr, backward=False, limit_adr=None):
+        """
+        Start an address taint search, see utility.address_graph.AddressGraph.start.
+
+        :param target_adr: List of target adr index.
+        :param backward: Direction of the search.
+        :param limit_adr: Optional list of adr index discontinued during tainting.
+
+        :return: Array of adr index of the outputs of the shard transactions paying the targets.
+        """
+
+        graph = self.get_graph('address')
+        blocked = None
+        if limit_adr is not None:
+            blocked = np.zeros(len(graph.node_adr), dtype=bool)
+            limit_node = graph.adr_node(limit_adr)
+            blocked[limit_node[limit_node >= 0]] = True
+        self.state = {'graph': graph, 'backward': backward, 'blocked': blocked, 'tx_depth': np.full(len(graph.node_tx), -1, dtype='int64'),
+                      'edge_tainted': np.zeros(len(graph.direction(backward)[3]), dtype=bool), 'done': np.zeros(len(graph.node_adr), dtype=bool)}
+        target = graph.adr_node(target_adr)
+        target = np.unique(target[target >= 0])
+        paying = np.unique(graph.adr_output_tx[csr_edge(graph.adr_output_ptr, target)])
+        return np.asarray(graph.node_adr)[np.unique(graph.tx_output_adr[csr_edge(graph.tx_output_ptr, paying)])]
+
+    def adr_step(self, adr_list, depth, first=False):
+        """
+        Search one level of the address taint search from the addresses found by every shard in the previous level,
+        see utility.address_graph.AddressGraph.search_level.
+
+        :param adr_list: Array of adr index found in the previous level (the starting addresses for the first level).
+        :param depth: Depth of the transactions tainted in the level.
+        :param first: First level, the starting addresses are not marked as searched.
+
+        :return: Array of adr index of the tainted rows of the level.
+        """
+
+        graph, done, blocked = self.state['graph'], self.state['done'], self.state['blocked']
+        adr_tx_ptr, adr_tx, tx_adr_ptr, tx_adr = graph.direction(self.state['backward'])
+        adr = graph.adr_node(adr_list)
+        adr = adr[adr >= 0]
+        if not first:
+            done[adr] = True
+        tx = np.unique(adr_tx[csr_edge(adr_tx_ptr, adr)])
+        edge = csr_edge(tx_adr_ptr, tx)
+        if not first:
+            edge = edge[~done[tx_adr[edge]]]
+            if blocked is not None:
+                edge = edge[~blocked[tx_adr[edge]]]
+        edge_tx = np.searchsorted(tx_adr_ptr, edge, side='right') - 1
+        new = self.state['tx_depth'][edge_tx] < 0
+        self.state['edge_tainted'][edge[new]] = True
+        self.state['tx_depth'][edge_tx[new]] = depth
+        return np.asarray(graph.node_adr)[np.unique(tx_adr[edge])]
+
+    def adr_rows(self):
+        """
+        Rows tainted by the address taint search in the shard, as utility.address_graph.AddressGraph.tainted_pair matched to the data.
+
+        :return: DataFrame with tx_index as index and depth column, in row order.
+        """
+
+        graph, backward = self.state['graph'], self.state['backward']
+        pair = graph.tainted_pair(self.state, backward)
+        rows = self.rows('tx_input' if backward else 'tx_output', pair['tx_index'].unique())
+        rows = rows[pd.MultiIndex.from_arrays([rows.index, rows['adr_index']]).isin(pd.MultiIndex.from_arrays([pair['tx_index'], pair['adr_index']]))]
+        rows['depth'] = pair.drop_duplicates('tx_index').set_index('tx_index')['depth'].reindex(rows.index).values
+        return rows
+
+    def tx_count(self, adr_list):
+        """Number of inputs and outputs of the addresses in the shard"""
+        return self.get_graph('address').tx_count(adr_list)
+
+
+def serve(address, authkey, ready=None):
+    """
+    Run a shard server: accept one ShardEngine connection and run the Shard methods it asks for until it closes.
+    Start it on each machine (e.g., serve(('0.0.0.0', 6000), b'secret')) to use ShardEngine.connect across machines.
+
+    :param address: (host, port) to listen on, port 0 for any free port.
+    :param authkey: Bytes shared with the ShardEngine to authenticate the connection.
+    :param ready: Optional connection to send the listening address to (used by ShardEngine.start_local).
+    """
+
+    with Listener(address, authkey=authkey) as listener:
+        if ready is not None:
+            ready.send(listener.address)
+            ready.close()
+        with listener.accept() as conn:
+            shard = Shard()
+            while True:
+                name, args = conn.recv()
+                if name == 'close':
+                    break
+                try:
+                    conn.send(('ok', getattr(shard, name)(*args)))
+                except Exception:
+                    conn.send(('error', traceback.format_exc()))
+
+
+class ShardEngine(object):
+    def __init__(self, conn_list, process_list=None):
+        """
+        Coordinator of shard servers (serve), each owning a contiguous tx index range of the dataset.
+        Searches run level by level: the frontier of each level is split by owner and sent to the shards, which return the next frontier.
+        Messages go through multiprocessing.connection, so the shards may be local processes (start_local) or servers on other machines (connect).
+
+        :param conn_list: List of connections to the shard servers.
+        :param process_list: Optional list of local shard processes to stop on close.
+        """
+
+        self.conn_list = conn_list
+        self.process_list = process_list if process_list is not None else []
+        self.range_list = []
+
+    @classmethod
+    def start_local(cls, shard_count):
+        """
+        Start shard server processes on this machine.
+
+        :param shard_count: Number of shard processes.
+
+        :return: ShardEngine connected to the processes, load the data with load.
+        """
+
+        authkey = os.urandom(16)
+        conn_list, process_list = [], []
+        for _ in range(shard_count):
+            receive, send = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=serve, args=((local_host, 0), authkey, send), daemon=True)
+            process.start()
+            send.close()
+            address = receive.recv()
+            receive.close()
+            conn_list.append(Client(address, authkey=authkey))
+            process_list.append(process)
+        return cls(conn_list, process_list)
+
+    @classmethod
+    def connect(cls, address_list, authkey):
+        """
+        Connect to shard servers already running (serve).
+
+        :param address_list: List of (host, port) of the servers.
+        :param authkey: Bytes given to serve.
+
+        :return: ShardEngine, load the data with load.
+        """
+
+        return cls([Client(tuple(address), authkey=authkey) for address in address_list])
+
+    def call(self, name, arg_list):
+        """
+        Run a Shard method on every shard at the same time.
+
+        :param name: Method name.
+        :param arg_list: List of argument tuples, one per shard.
+
+        :return: List of results in shard order.
+        """
+
+        for conn, args in zip(self.conn_list, arg_list):
+            conn.send((name, args))
+        result_list = []
+        for conn in self.conn_list:
+            status, result = conn.recv()
+            if status == 'error':
+                raise Exception('Shard failed:\n' + result)
+            result_list.append(result)
+        return result_list
+
+    def load(self, path, group_list, storage='pandas', schema='default'):
+        """
+        Give each shard its partitions.
+
+        :param path: Folder path of the dataset on the shard machines.
+        :param group_list: List of (partition list, [first tx index, last tx index]) from group_partition, one per shard in tx index order.
+        :param storage: 'pandas' or 'mmap'.
+        :param schema: 'default' or 'compact'.
+        """
+
+        if len(group_list) != len(self.conn_list):
+            raise Exception('Need one partition group per shard: ' + str(len(self.conn_list)) + ' shards')
+        self.call('load', [(path, this_partition, this_range, storage, schema) for this_partition, this_range in group_list])
+        self.range_list = [this_range for _, this_range in group_list]
+
+    def route(self, tx_list):
+        """Split tx index into the lists of their owner shards, transactions outside every shard are left out"""
+        first = np.array([this_range[0] for this_range in self.range_list])
+        last = np.array([this_range[1] for this_range in self.range_list])
+        owner = np.searchsorted(first, tx_list, side='right') - 1
+        found = owner >= 0
+        found[found] = tx_list[found] <= last[owner[found]]
+        return [tx_list[found & (owner == shard)] for shard in range(len(self.conn_list))]
+
+    def tx_search(self, target_tx, depth_limit=-1, limit_adr=None, limit_tx=None, backward=False):
+        """
+        Tx taint search over every shard, with the same depth as utility.spend_graph.SpendGraph.search on the whole data.
+
+        :param target_tx: List of target tx index.
+        :param depth_limit: Limit how many transaction depth to search, -1 for no limit.
+        :param limit_adr: Optional list of adr index excluded during tainting.
+        :param limit_tx: Optional list of tx index excluded during tainting.
+        :param backward: Search backward with the inputs.
+
+        :return: DataFrame of the tainted rows with tx_index as index and depth column, the targets first and the others in depth order.
+        """
+
+        limit_adr = None if limit_adr is None else np.asarray(limit_adr, dtype='int64')
+        limit_tx = None if limit_tx is None else np.asarray(limit_tx, dtype='int64')
+        next_list = self.call('tx_start', [(np.asarray(target_tx, dtype='int64'), backward, limit_adr, limit_tx)] * len(self.conn_list))
+        frontier = np.unique(np.concatenate(next_list))
+        label, depth = 1, 1
+        while depth != depth_limit and len(frontier) > 0:
+            next_list = self.call('tx_level', [(shard_tx, label) for shard_tx in self.route(frontier)])
+            frontier = np.unique(np.concatenate(next_list))
+            label = depth
+            depth += 1
+        rows = pd.concat(self.call('tx_rows', [()] * len(self.conn_list)))
+        return rows.iloc[np.argsort(rows['depth'].values, kind='stable')]
+
+    def adr_search(self, target_adr, depth_limit=-1, limit_adr=None, backward=False):
+        """
+        Address taint search over every shard, the addresses found in each level are sent to every shard.
+
+        :param target_adr: List of target adr index.
+        :param depth_limit: Limit how many depth to search, -1 for no limit.
+        :param limit_adr: Optional list of adr index discontinued during tainting.
+        :param backward: Search backward.
+
+        :return: Tuple (DataFrame of the tainted rows with tx_index as index and depth column in depth order, array of the starting adr index).
+        """
+
+        limit_adr = None if limit_adr is None else np.asarray(limit_adr, dtype='int64')
+        start_adr = np.unique(np.concatenate(self.call('adr_start', [(np.asarray(target_adr, dtype='int64'), backward, limit_adr)] * len(self.conn_list))))
+        adr, depth = start_adr, 0
+        while depth != depth_limit:
+            adr = np.unique(np.concatenate(self.call('adr_step', [(adr, depth, depth == 0)] * len(self.conn_list))))
+            if len(adr) == 0:  # no tainted row in the level
+                break
+            depth += 1
+        rows = pd.concat(self.call('adr_rows', [()] * len(self.conn_list)))
+        return rows.iloc[np.argsort(rows['depth'].values, kind='stable')], start_adr
+
+    def tx_count(self, adr_list):
+        """Number of inputs and outputs of the addresses over every shard"""
+        return np.sum(self.call('tx_count', [(np.asarray(adr_list, dtype='int64'),)] * len(self.conn_list)), axis=0)
+
+    def close(self):
+        """Stop the shard servers"""
+        for conn in self.conn_list:
+            conn.send(('close', ()))
+            conn.close()
+        for process in self.process_list:
+            process.join()
+        self.conn_list, self.process_list = [], []
@@ -0,0 +1,391 @@
+import logging
+import os.path
+
+import numpy as np
+import pandas as pd
+
+from utility import utility_function
+from utility import column_store
+
+logging.getLogger().setLevel(logging.INFO)
+pd.options.mode.chained_assignment = None  # default='warn'
+
+index_folder = utility_function.index_folder
+
+spend_graph_name = 'spend_graph'  # saved as index/spend_graph_<column>.npy
+reverse_graph_name = 'reverse_spend_graph'  # graph of tx_input for backward search, index/reverse_spend_graph_<column>.npy
+spend_graph_column = ['node_tx', 'indptr', 'edge_dst', 'edge_adr']
+bit_word = 64  # cases per uint64 label word of batch_search
+
+
+def table_array(table):
+    """
+    tx_index, adr_index and spent_index (-1 for missing) arrays of a tx_input or tx_output dataframe or column store.
+
+    :param table: tx_input or tx_output dataframe (tx_index as column or index) or utility.column_store.ColumnStore.
+
+    :return: Tuple of three int64 arrays.
+    """
+
+    if isinstance(table, column_store.ColumnStore):
+        return np.asarray(table.column('tx_index')), np.asarray(table.column('adr_index')), np.asarray(table.column('spent_index'))
+    tx_index = table['tx_index'].values if 'tx_index' in table.columns else table.index.values
+    spent_index = pd.to_numeric(table['spent_index']).fillna(column_store.no_spent).values
+    return tx_index.astype('int64'), table['adr_index'].values.astype('int64'), spent_index.astype('int64')
+
+
+def csr_edge(indptr, node):
+    """
+    Edge positions of nodes in a compressed sparse row array.
+
+    :param indptr: Row pointer array, edges of node i are indptr[i]:indptr[i + 1].
+    :param node: Array of nodes.
+
+    :return: Array of edge positions, in node order.
+    """
+
+    indptr = np.asarray(indptr)
+    start = indptr[node]
+    count = indptr[np.asarray(node) + 1] - start
+    offset = np.repeat(start - np.cumsum(count) + count, count)
+    return offset + np.arange(int(count.sum()), dtype='int64')
+
+
+def lookup_node(node_value, value_list):
+    """
+    Node number of each value in a sorted node value array.
+
+    :param node_value: Sorted array of the value (tx index or adr index) of each node.
+    :param value_list: List of values to look up.
+
+    :return: Array of node numbers, -1 for values without a node.
+    """
+
+    value_list = np.asarray(value_list, dtype='int64')
+    if len(node_value) == 0:
+        return np.full(len(value_list), -1, dtype='int64')
+    node = np.searchsorted(node_value, value_list).clip(0, len(node_value) - 1)
+    node[np.asarray(node_value)[node] != value_list] = -1
+    return node
+
+
+def csr_array(node, value, node_count):
+    """
+    Build a compressed sparse row array from (node, value) pairs, the values of a node keep their order.
+
+    :param node: Array of source nodes.
+    :param value: Array of values (target nodes), same length as node.
+    :param node_count: Number of source nodes.
+
+    :return: Tuple (indptr, value array ordered by node).
+    """
+
+    order = np.argsort(node, kind='stable')
+    indptr = np.zeros(node_count + 1, dtype='int64')
+    np.cumsum(np.bincount(node, minlength=node_count), out=indptr[1:])
+    return indptr, np.asarray(value)[order]
+
+
+def build_spend_graph(table):
+    """
+    Build the compressed sparse row (CSR) spend graph of the outputs: each transaction links through its outputs to the transactions spending them.
+    Row i of the graph holds the outputs of node_tx[i] (edge_adr) and the node of their spending transaction (edge_dst, -1 for unspent outputs
+    or spending transactions without outputs in the data).
+    Built from tx_input the graph is reversed: each transaction links through its inputs to the transactions they spend from.
+
+    :param table: tx_output (or tx_input) dataframe (tx_index as column or index) or utility.column_store.ColumnStore.
+
+    :return: SpendGraph object.
+    """
+
+    tx_index, adr_index, spent_index = table_array(table)
+    if len(tx_index) > 1 and (np.diff(tx_index) < 0).any():
+        order = np.argsort(tx_index, kind='stable')
+        tx_index, adr_index, spent_index = tx_index[order], adr_index[order], spent_index[order]
+    node_tx, count = np.unique(tx_index, return_counts=True)
+    indptr = np.zeros(len(node_tx) + 1, dtype='int64')
+    np.cumsum(count, out=indptr[1:])
+    edge_dst = np.searchsorted(node_tx, spent_index)
+    found = (spent_index != column_store.no_spent) & (edge_dst < len(node_tx))
+    found[found] = node_tx[edge_dst[found]] == spent_index[found]
+    edge_dst[~found] = -1
+    return SpendGraph({'node_tx': node_tx.astype('int64'), 'indptr': indptr, 'edge_dst': edge_dst.astype('int64'), 'edge_adr': adr_index})
+
+
+def has_spend_graph(path, graph_name=spend_graph_name):
+    """Check if the dataset in path has a saved spend graph (graph_name spend_graph_name or reverse_graph_name)"""
+    return os.path.isfile(os.path.join(path, index_folder, graph_name + '_' + spend_graph_column[-1] + '.npy'))
+
+
+def load_spend_graph(path, graph_name=spend_graph_name):
+    """
+    Open the spend graph saved in the dataset folder.
+
+    :param path: String of folder path of the dataset e.g., 'sampledata/'.
+    :param graph_name: Either spend_graph_name or reverse_graph_name.
+
+    :return: SpendGraph object.
+    """
+
+    return SpendGraph({column: np.load(os.path.join(path, index_folder, graph_name + '_' + column + '.npy'), mmap_mode='r')
+                       for column in spend_graph_column})
+
+
+class SpendGraph(object):
+    def __init__(self, array_dict):
+        """
+        Transaction spend graph in compressed sparse row form, searched level by level with NumPy arrays instead of dataframe filtering.
+
+        :param array_dict: Dictionary of spend_graph_column name to array, see build_spend_graph.
+        """
+
+        self.node_tx = array_dict['node_tx']
+        self.indptr = array_dict['indptr']
+        self.edge_dst = array_dict['edge_dst']
+        self.edge_adr = array_dict['edge_adr']
+
+    def __len__(self):
+        return len(self.node_tx)
+
+    def tx_range(self):
+        """[first tx index, last tx index] of the graph, None for an empty graph"""
+        if len(self.node_tx) == 0:
+            return None
+        return [int(self.node_tx[0]), int(self.node_tx[-1])]
+
+    def save(self, path, graph_name=spend_graph_name):
+        """
+        Save the graph into the index folder of the dataset.
+
+        :param path: String of folder path of the dataset e.g., 'sampledata/'.
+        :param graph_name: Either spend_graph_name or reverse_graph_name.
+        """
+
+        save_path = os.path.join(path, index_folder)
+        if not os.path.isdir(save_path):
+            os.makedirs(save_path)
+        for column in spend_graph_column:
+            np.save(os.path.join(save_path, graph_name + '_' + column + '.npy'), np.asarray(getattr(self, column)))
+
+    def window(self, first_tx, last_tx):
+        """
+        Sub graph of the transactions within [first_tx, last_tx], links to transactions outside the window are removed.
+
+        :param first_tx: First tx index of the window.
+        :param last_tx: Last tx index of the window.
+
+        :return: SpendGraph object.
+        """
+
+        start, end = np.searchsorted(self.node_tx, [first_tx, last_tx + 1])
+        edge_start, edge_end = int(self.indptr[start]), int(self.indptr[end])
+        edge_dst = np.array(self.edge_dst[edge_start:edge_end]) - start
+        edge_dst[(edge_dst < 0) | (edge_dst >= end - start)] = -1
+        return SpendGraph({'node_tx': np.asarray(self.node_tx[start:end]), 'indptr': np.asarray(self.indptr[start:end + 1]) - edge_start,
+                           'edge_dst': edge_dst, 'edge_adr': np.asarray(self.edge_adr[edge_start:edge_end])})
+
+    def node(self, tx_list):
+        """Graph node of each tx index in tx_list, -1 for transactions not in the graph"""
+        return lookup_node(self.node_tx, tx_list)
+
+    def edge(self, node):
+        """Edge (output) positions of the nodes, in node order"""
+        return csr_edge(self.indptr, node)
+
+    def edge_node(self, edge):
+        """Node (transaction) of each edge position"""
+        return np.searchsorted(self.indptr, edge, side='right') - 1
+
+    def blocked_edge(self, adr_list=None, tx_list=None):
+        """
+        Mark the outputs excluded while tainting.
+
+        :param adr_list: Optional list of adr index whose outputs are excluded.
+        :param tx_list: Optional list of tx index whose outputs are excluded.
+
+        :return: Boolean array over the edges, None when nothing is excluded.
+        """
+
+        blocked = None
+        if adr_list is not None:
+            blocked = np.isin(self.edge_adr, np.asarray(adr_list, dtype='int64'))
+        if tx_list is not None:
+            tx_blocked = np.repeat(np.isin(self.node_tx, np.asarray(tx_list, dtype='int64')), np.diff(self.indptr))
+            blocked = tx_blocked if blocked is None else blocked | tx_blocked
+        return blocked
+
+    def start(self, target_tx, stop=None):
+        """
+        Search state of a new search from the targets, see search.
+
+        :param target_tx: List of tx index to start from.
+        :param stop: Optional boolean array over the edges, outputs not followed.
+
+        :return: State dictionary ('depth_of', 'searched', 'frontier', 'label', 'depth').
+        """
+
+        depth_of = np.full(len(self.node_tx), -1, dtype='int64')
+        target = self.node(target_tx)
+        target = np.unique(target[target >= 0])
+        depth_of[target] = 0
+        edge = self.edge(target)
+        if stop is not None:
+            edge = edge[~stop[edge]]
+        frontier = np.unique(self.edge_dst[edge])
+        frontier = frontier[frontier >= 0]
+        return {'depth_of': depth_of, 'searched': np.zeros(len(self.node_tx), dtype=bool), 'frontier': frontier, 'label': 1, 'depth': 1}
+
+    def search_level(self, state, depth_limit=-1, blocked=None, stop=None):
+        """
+        Generator of the levels of search, the state is updated in place before each level is yielded.
+        The caller may stop at any level and continue later from the state, or change it (e.g., remove frontier nodes) before the next level.
+
+        :param state: State dictionary from start or an earlier search.
+        :param depth_limit: Limit how many transaction depth to search, -1 for no limit.
+        :param blocked: Optional boolean array over the edges from blocked_edge.
+        :param stop: Optional boolean array over the edges, outputs tainted but not followed.
+
+        :return: Yields tuple (array of nodes tainted in the level, their depth).
+        """
+
+        depth_of, searched = state['depth_of'], state['searched']
+        while state['depth'] != depth_limit and len(state['frontier']) > 0:
+            frontier, label, depth = state['frontier'], state['label'], state['depth']
+            edge = self.edge(frontier)
+            if blocked is not None:
+                edge = edge[~blocked[edge]]
+            reached = np.unique(self.edge_node(edge))  # transactions with at least one tainted output
+            new = reached[depth_of[reached] < 0]
+            depth_of[new] = label
+            searched[reached] = True
+            if stop is not None:
+                edge = edge[~stop[edge]]
+            frontier = np.unique(self.edge_dst[edge])
+            frontier = frontier[frontier >= 0]
+            frontier = frontier[~searched[frontier]]
+            state.update({'frontier': frontier, 'label': depth, 'depth': depth + 1})
+            yield new, label
+
+    def search(self, target_tx, depth_limit=-1, blocked=None, state=None, checkpoint=None, stop=None):
+        """
+        Forward taint search as a frontier breadth first search with a visited bitmap.
+        A transaction is searched once, all its outputs (except blocked ones) taint their spending transactions in the next level.
+        The depth numbers follow TaintedTX.tx_taint_search: targets have depth 0 and the first two levels after them depth 1.
+
+        :param target_tx: List of tx index to start from.
+        :param depth_limit: Limit how many transaction depth to search, -1 for no limit.
+        :param blocked: Optional boolean array over the edges from blocked_edge, blocked outputs are not tainted and do not spread taint.
+        :param state: Optional dictionary from an earlier search to continue ('depth_of', 'searched', 'frontier', 'label', 'depth').
+        :param checkpoint: Optional function called with the state dictionary after every level.
+        :param stop: Optional boolean array over the edges, outputs tainted but not followed (e.g., payments to a hub of utility.hub_summary).
+
+        :return: State dictionary, 'depth_of' is the depth of each node (-1 for untainted nodes).
+        """
+
+        if state is None:
+            state = self.start(target_tx, stop)
+        for _ in self.search_level(state, depth_limit, blocked, stop):
+            if checkpoint is not None:
+                checkpoint(state)
+        return state
+
+    def batch_search(self, target_list, depth_limit=-1, blocked=None):
+        """
+        Forward taint search of many separate cases in one traversal, each case (source) is one bit of a uint64 label word
+        (64 cases per word) propagated with the frontier, so transactions shared by cases are searched once per level.
+        Each case gets the same tainted transactions and depth as search run for that case alone,
+        the depth of a case at a transaction is the level where its bit first arrives.
+
+        :param target_list: List of target tx index lists, one per case.
+        :param depth_limit: Limit how many transaction depth to search, -1 for no limit.
+        :param blocked: Optional boolean array over the edges from blocked_edge.
+
+        :return: Tuple (node, source, depth) of arrays, one item per tainted transaction of each case.
+        """
+
+        word_count = max((len(target_list) + bit_word - 1) // bit_word, 1)
+        tainted = np.zeros((len(self.node_tx), word_count), dtype='uint64')
+        searched = np.zeros((len(self.node_tx), word_count), dtype='uint64')
+        target_node, target_source = [], []
+        for source, target_tx in enumerate(target_list):
+            target = self.node(target_tx)
+            target = np.unique(target[target >= 0])
+            target_node.append(target)
+            target_source.append(np.full(len(target), source, dtype='int64'))
+        target_node, target_source = np.concatenate(target_node), np.concatenate(target_source)
+        np.bitwise_or.at(tainted, (target_node, target_source // bit_word), np.left_shift(np.uint64(1), (target_source % bit_word).astype('uint64')))
+        record_list = [(target_node, target_source, np.zeros(len(target_node), dtype='int64'))]
+
+        start = np.unique(target_node)
+        start_edge = self.edge(start)
+        start_bit = tainted[start][np.repeat(np.arange(len(start)), np.diff(np.asarray(self.indptr))[start])]
+        frontier, frontier_bit = self.spread(self.edge_dst[start_edge], start_bit, searched)
+        label, depth = 1, 1
+        while depth != depth_limit and len(frontier) > 0:
+            edge = self.edge(frontier)
+            edge_source = np.repeat(np.arange(len(frontier)), np.diff(np.asarray(self.indptr))[frontier])
+            if blocked is not None:
+                kept = ~blocked[edge]
+                edge, edge_source = edge[kept], edge_source[kept]
+            reached = np.unique(edge_source)  # frontier transactions with at least one tainted output
+            reached_node, reached_bit = frontier[reached], frontier_bit[reached]
+            record_list.append(bit_record(reached_node, reached_bit & ~tainted[reached_node], label))
+            tainted[reached_node] |= reached_bit
+            searched[reached_node] |= reached_bit
+            frontier, frontier_bit = self.spread(self.edge_dst[edge], frontier_bit[edge_source], searched)
+            label = depth
+            depth += 1
+
+        node = np.concatenate([record[0] for record in record_list])
+        source = np.concatenate([record[1] for record in record_list])
+        depth = np.concatenate([record[2] for record in record_list])
+        return node, source, depth
+
+    def spread(self, node, bit, searched):
+        """
+        Next frontier of the batch search: OR of the label words reaching each transaction, without the bits already searched there.
+
+        :param node: Spending transaction node of each tainted output (-1 for none).
+        :param bit: Label word of each tainted output.
+        :param searched: Searched label words of every node.
+
+        :return: Tuple (nodes, label words) of the next frontier.
+        """
+
+        found = node >= 0
+        node, bit = node[found], bit[found]
+        if len(node) == 0:
+            return np.array([], dtype='int64'), np.zeros((0, searched.shape[1]), dtype='uint64')
+        order = np.argsort(node, kind='stable')
+        node, bit = node[order], bit[order]
+        first = np.flatnonzero(np.concatenate([[True], node[1:] != node[:-1]]))
+        node, bit = node[first], np.bitwise_or.reduceat(bit, first, axis=0)
+        bit &= ~searched[node]
+        keep = bit.any(axis=1)
+        return node[keep], bit[keep]
+
+
+def bit_record(node, bit, depth):
+    """
+    Expand label words into (node, source, depth) items, one per set bit.
+
+    :param node: Array of nodes.
+    :param bit: Label words of the nodes, shape (len(node), word count).
+    :param depth: Depth of the items.
+
+    :return: Tuple (node, source, depth) of arrays.
+    """
+
+    node_list, source_list = [], []
+    for word in range(bit.shape[1]):
+        found = np.flatnonzero(bit[:, word])
+        if len(found) == 0:
+            continue
+        flag = np.unpackbits(np.ascontiguousarray(bit[found, word], dtype='<u8').view('uint8').reshape(len(found), 8), axis=1, bitorder='little')
+        position, source = np.nonzero(flag)
+        node_list.append(node[found[position]])
+        source_list.append(source.astype('int64') + word * bit_word)
+    if len(node_list) == 0:
+        return np.array([], dtype='int64'), np.array([], dtype='int64'), np.array([], dtype='int64')
+    node, source = np.concatenate(node_list), np.concatenate(source_list)
+    return node, source, np.full(len(node), depth, dtype='int64')
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import logging
+import os.path
+import time
+
+import numpy as np
+import pandas as pd
+
+logging.getLogger().setLevel(logging.INFO)
+pd.options.mode.chained_assignment = None  # default='warn'
+
+cache_folder = 'taintresults/cache/'
+cache_index_filename = 'cache_index.json'
+default_max_size = 1 << 30  # bytes of saved searches kept, least recently used are removed first
+
+
+def digest(value):
+    """md5 hex digest of a JSON serializable value"""
+    return hashlib.md5(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def index_digest(df):
+    """md5 hex digest of the sorted unique index of a taint_limit dataframe, None for None"""
+    if df is None:
+        return None
+    return hashlib.md5(np.unique(np.asarray(df.index, dtype='int64')).tobytes()).hexdigest()
+
+
+def dataset_version(manifest=None, graph=None):
+    """
+    Content hash of the data a search runs on, from the dataset manifest (utility.manifest) when there is one,
+    otherwise from the arrays of the spend graph.
+
+    :param manifest: Manifest dictionary of the dataset or None.
+    :param graph: SpendGraph searched, used without manifest.
+
+    :return: String hash.
+    """
+
+    if manifest is not None:
+        return digest(manifest)
+    md5 = hashlib.md5()
+    for array in (graph.node_tx, graph.indptr, graph.edge_dst, graph.edge_adr):
+        md5.update(np.ascontiguousarray(array).tobytes())
+    return md5.hexdigest()
+
+
+def max_label(depth_limit):
+    """Largest depth kept by tx_taint_search with depth_limit (the first two levels both have depth 1), None when it can not be told apart"""
+    if depth_limit == 1:
+        return 0
+    if depth_limit >= 3:
+        return depth_limit - 2
+    return None
+
+
+class TaintCache(object):
+    def __init__(self, path=cache_folder, max_size=default_max_size):
+        """
+        Persistent cache of tx taint searches (utility.spend_graph.SpendGraph.search states) in a folder, with least recently used removal.
+        The search state is saved instead of the result dataframe: a cached search gives the same rows through TaintedTX.tainted_rows,
+        a deeper search continues from the saved frontier and a shallower one keeps the transactions of the depth asked.
+
+        :param path: Folder of the cache.
+        :param max_size: Bytes of saved searches kept.
+        """
+
+        self.path = path
+        self.max_size = max_size
+        self.index = {}
+        if os.path.isfile(os.path.join(path, cache_index_filename)):
+            with open(os.path.join(path, cache_index_filename)) as f:
+                self.index = json.load(f)
+
+    def key(self, version, graph, target_tx, limit_option=None, backward=False, taint_limit=None):
+        """
+        Cache key of a search without its depth_limit.
+        Only 'taint' taint_limit frames change the search, 'after' limits are applied to the result and share the key of no limit.
+
+        :param version: dataset_version of the data.
+        :param graph: SpendGraph searched (its tx range and size are part of the key).
+        :param target_tx: List of target tx index.
+        :param limit_option: limit_option of prepare_data.
+        :param backward: Backward search.
+        :param taint_limit: taint_limit of tx_taint_search.
+
+        :return: String key.
+        """
+
+        limit = None
+        if taint_limit is not None and taint_limit[0] == 'taint':
+            limit = [index_digest(taint_limit[1]), index_digest(taint_limit[2])]
+        return digest({'version': version, 'tx_range': graph.tx_range(), 'node_count': len(graph), 'target': np.unique(np.asarray(target_tx, dtype='int64')).tolist(),
+                       'limit_option': str(limit_option), 'backward': backward, 'taint_limit': limit})
+
+    def save_index(self):
+        """Write the cache index file"""
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        temp_file = os.path.join(self.path, 'temp_' + cache_index_filename)
+        with open(temp_file, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(temp_file, os.path.join(self.path, cache_index_filename))
+
+    def get(self, key, depth_limit, node_count):
+        """
+        Search state for a search of key with depth_limit from the cache.
+
+        :param key: Key from key.
+        :param depth_limit: depth_limit of the search.
+        :param node_count: Number of nodes of the graph searched.
+
+        :return: Tuple (state dictionary for SpendGraph.search, 'exact', 'filter' or 'resume'), (None, None) when nothing cached can be used.
+        'filter' states have no frontier left and must not be saved again.
+        """
+
+        entry_list = [(file_name, entry) for file_name, entry in self.index.items() if entry['key'] == key]
+        label = None if depth_limit == -1 else max_label(depth_limit)
+        chosen, kind = None, None
+        for file_name, entry in entry_list:
+            if entry['depth_limit'] == depth_limit or (entry['complete'] and depth_limit == -1):
+                chosen, kind = file_name, 'exact'
+                break
+        if chosen is None and label is not None:  # a deeper or finished search cut at the depth asked
+            deeper = [(entry['depth_limit'] if not entry['complete'] else np.inf, file_name) for file_name, entry in entry_list
+                      if entry['complete'] or entry['depth_limit'] == -1 or entry['depth_limit'] > depth_limit]
+            if len(deeper) > 0:
+                chosen, kind = min(deeper)[1], 'filter'
+        if chosen is None:  # continue the deepest shallower search
+            shallower = [(entry['depth_limit'], file_name) for file_name, entry in entry_list
+                         if not entry['complete'] and (depth_limit == -1 or entry['depth_limit'] < depth_limit)]
+            if len(shallower) > 0:
+                chosen, kind = max(shallower)[1], 'resume'
+        if chosen is None or not os.path.isfile(os.path.join(self.path, chosen)):
+            return None, None
+
+        with np.load(os.path.join(self.path, chosen)) as data:
+            if int(data['node_count']) != node_count:
+                return None, None
+            depth_of = np.full(node_count, -1, dtype='int64')
+            depth_of[data['node']] = data['node_depth']
+            state = {'depth_of': depth_of, 'searched': np.unpackbits(data['searched'])[:node_count].astype(bool), 'frontier': data['frontier'],
+                     'label': int(data['label']), 'depth': int(data['depth'])}
+        if kind == 'filter':
+            state['depth_of'][state['depth_of'] > label] = -1
+            state['frontier'] = state['frontier'][:0]
+        self.index[chosen]['last_used'] = time.time()
+        self.save_index()
+        logging.info('Taint cache ' + kind + ' ' + chosen)
+        return state, kind
+
+    def put(self, key, depth_limit, state):
+        """
+        Save the state of a finished search, shallower searches of the same key are replaced and the least recently used are removed over max_size.
+
+        :param key: Key from key.
+        :param depth_limit: depth_limit of the search.
+        :param state: State dictionary from SpendGraph.search.
+        """
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        complete = len(state['frontier']) == 0
+        file_name = key + '_' + ('all' if depth_limit == -1 else str(depth_limit)) + '.npz'
+        node = np.flatnonzero(state['depth_of'] >= 0)
+        np.savez(os.path.join(self.path, file_name), node_count=np.array(len(state['depth_of'])), node=node, node_depth=state['depth_of'][node],
+                 searched=np.packbits(state['searched']), frontier=np.asarray(state['frontier']), label=np.array(state['label']),
+                 depth=np.array(state['depth']))
+        for other, entry in list(self.index.items()):
+            if entry['key'] == key and other != file_name and (complete or (depth_limit != -1 and 0 <= entry['depth_limit'] < depth_limit)):
+                self.remove(other)
+        self.index[file_name] = {'key': key, 'depth_limit': depth_limit, 'complete': complete, 'last_used': time.time(),
+                                 'size': os.path.getsize(os.path.join(self.path, file_name))}
+        for other in sorted(self.index, key=lambda name: self.index[name]['last_used']):
+            if sum([entry['size'] for entry in self.index.values()]) <= self.max_size or other == file_name:
+                break
+            self.remove(other)
+        self.save_index()
+
+    def remove(self, file_name):
+        """Remove one saved search"""
+        self.index.pop(file_name, None)
+        if os.path.isfile(os.path.join(self.path, file_name)):
+            os.remove(os.path.join(self.path, file_name))
+
+    def clear(self):
+        """Remove every saved search"""
+        for file_name in list(self.index):
+            self.remove(file_name)
+        self.save_index()
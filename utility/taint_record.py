@@ -0,0 +1,225 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from utility import spend_graph
+
+logging.getLogger().setLevel(logging.INFO)
+pd.options.mode.chained_assignment = None  # default='warn'
+
+csr_edge = spend_graph.csr_edge
+lookup_node = spend_graph.lookup_node
+
+record_column = ['output_index', 'tx_index', 'adr_index', 'portion_value', 'spent_index', 'total_amount', 'taint']
+record_dtype = {'output_index': 'int64', 'tx_index': 'int64', 'adr_index': 'int64', 'portion_value': 'int64', 'spent_index': 'float64',
+                'total_amount': 'int64', 'taint': 'bool'}
+
+
+def key_index(key):
+    """
+    Index of the rows by a key column: the rows in key order and the row pointer of each unique key, rows with NaN keys are left out.
+
+    :param key: Array of the key of each row.
+
+    :return: Tuple (sorted unique keys, row pointer array, row positions in key order).
+    """
+
+    key = np.asarray(key, dtype='float64')
+    order = np.flatnonzero(~np.isnan(key))
+    order = order[np.argsort(key[order], kind='stable')]
+    key_value, count = np.unique(key[order].astype('int64'), return_counts=True)
+    indptr = np.zeros(len(key_value) + 1, dtype='int64')
+    np.cumsum(count, out=indptr[1:])
+    return key_value, indptr, order
+
+
+def from_frame(df):
+    """
+    TaintRecord of a record DataFrame (self.record of TaintedTX, the portion column can be 'portion_value' or 'input_value').
+
+    :param df: Record DataFrame with output_index, tx_index, adr_index, portion_value, spent_index, total_amount and taint ('t' or 'c').
+
+    :return: TaintRecord object.
+    """
+
+    df = df.rename(columns={'input_value': 'portion_value'})
+    record = TaintRecord()
+    if len(df) > 0:
+        chunk = {column: df[column].values for column in record_column if column != 'taint'}
+        chunk['taint'] = df['taint'].values == 't'
+        record.append(chunk)
+    return record
+
+
+def load_taint_record(file_name):
+    """
+    Load a record saved with TaintRecord.save.
+
+    :param file_name: String of the npz file.
+
+    :return: TaintRecord object.
+    """
+
+    record = TaintRecord()
+    with np.load(file_name) as data:
+        if len(data['output_index']) > 0:
+            record.append({column: data[column] for column in record_column})
+    return record
+
+
+class TaintRecord(object):
+    def __init__(self):
+        """
+        Record of the portions of an In-Out policy distribution (one row for each part of an output taken from one input run) in typed
+        column arrays. Rows are added in chunks without copying the earlier rows (append), the chunks are joined once when the columns are read,
+        and the indexes by output_index and spent_index are built on the first query, so provenance queries look up rows instead of scanning the record.
+        """
+
+        self.chunk_list = []
+        self.row_count = 0
+        self.output_key = None  # key_index of output_index
+        self.spent_key = None  # key_index of spent_index
+
+    def __len__(self):
+        return self.row_count
+
+    def append(self, chunk):
+        """
+        Add rows at the end of the record.
+
+        :param chunk: Dictionary of record_column to arrays of the same length (taint is boolean, True for taint portions).
+        """
+
+        chunk = {column: np.asarray(chunk[column]).astype(record_dtype[column]) for column in record_column}
+        if len(chunk['output_index']) == 0:
+            return
+        self.chunk_list.append(chunk)
+        self.row_count += len(chunk['output_index'])
+        self.output_key, self.spent_key = None, None
+
+    def column(self, name):
+        """Array of one column, the chunks are joined into one the first time"""
+        if len(self.chunk_list) == 0:
+            return np.zeros(0, dtype=record_dtype[name])
+        if len(self.chunk_list) > 1:
+            self.chunk_list = [{column: np.concatenate([chunk[column] for chunk in self.chunk_list]) for column in record_column}]
+        return self.chunk_list[0][name]
+
+    def take(self, row):
+        """New TaintRecord of the rows (positions or boolean mask)"""
+        record = TaintRecord()
+        record.append({column: self.column(column)[row] for column in record_column})
+        return record
+
+    def frame(self, row=None):
+        """
+        Record rows as a DataFrame (the self.record of TaintedTX, taint is 't' or 'c').
+
+        :param row: Optional positions of the rows, all rows in record order by default.
+
+        :return: DataFrame with record_column.
+        """
+
+        if row is None:
+            row = np.arange(self.row_count)
+        df = pd.DataFrame({column: self.column(column)[row] for column in record_column})
+        df['taint'] = np.where(df['taint'].values, 't', 'c').astype(object)
+        return df
+
+    def save(self, file_name):
+        """Save the columns into one npz file, see load_taint_record"""
+        np.savez(file_name, **{column: self.column(column) for column in record_column})
+
+    def key_row(self, key_name, key):
+        """Record positions of the rows with any of the keys in the column key_name ('output_index' or 'spent_index'), in key order"""
+        if key_name == 'output_index':
+            if self.output_key is None:
+                self.output_key = key_index(self.column('output_index'))
+            key_value, indptr, order = self.output_key
+        else:
+            if self.spent_key is None:
+                self.spent_key = key_index(self.column('spent_index'))
+            key_value, indptr, order = self.spent_key
+        node = lookup_node(key_value, np.unique(np.asarray(key, dtype='int64')))
+        return order[csr_edge(indptr, node[node >= 0])]
+
+    def portion(self, output_index):
+        """
+        Portions of outputs, where their taint and clean value came from.
+
+        :param output_index: List of output index.
+
+        :return: DataFrame of record rows.
+        """
+
+        return self.frame(self.key_row('output_index', output_index))
+
+    def spent_by(self, tx_index):
+        """
+        Portions of the outputs spent by transactions, the inputs the transactions distributed.
+
+        :param tx_index: List of tx index.
+
+        :return: DataFrame of record rows.
+        """
+
+        return self.frame(self.key_row('spent_index', tx_index))
+
+    def feed_row(self, output_index):
+        """Record positions of the taint portions of the inputs of the transactions creating the outputs with taint portions"""
+        row = self.key_row('output_index', output_index)
+        tx_index = self.column('tx_index')[row[self.column('taint')[row]]]
+        row = self.key_row('spent_index', tx_index)
+        return row[self.column('taint')[row]]
+
+    def feed(self, output_index):
+        """
+        Which inputs fed the taint of outputs: the taint portions of the inputs of the transactions creating the outputs.
+
+        :param output_index: List of output index.
+
+        :return: DataFrame of record rows.
+        """
+
+        return self.frame(self.feed_row(output_index))
+
+    def trace(self, output_index):
+        """
+        Trace the taint of outputs back to the source: feed of the outputs, feed of those inputs and so on until the target outputs
+        the distribution started from, which have no feed.
+
+        :param output_index: List of output index.
+
+        :return: DataFrame of record rows with 'trace_depth' (1 for the feed of the outputs).
+        """
+
+        seen = set(np.asarray(output_index, dtype='int64').tolist())
+        row_list, depth_list = [], []
+        output_index, depth = np.unique(np.asarray(output_index, dtype='int64')), 1
+        while len(output_index) > 0:
+            row = self.feed_row(output_index)
+            row_list.append(row)
+            depth_list.append(np.full(len(row), depth, dtype='int64'))
+            output_index = np.unique(self.column('output_index')[row])
+            output_index = output_index[[value not in seen for value in output_index.tolist()]] if len(output_index) > 0 else output_index
+            seen.update(output_index.tolist())
+            depth += 1
+        row = np.concatenate(row_list) if len(row_list) > 0 else np.zeros(0, dtype='int64')
+        df = self.frame(row)
+        df['trace_depth'] = np.concatenate(depth_list) if len(depth_list) > 0 else np.zeros(0, dtype='int64')
+        return df
+
+    def source(self, output_index):
+        """
+        Source of the taint of outputs: the traced outputs (trace) without feed of their own, usually the tainted target outputs.
+
+        :param output_index: List of output index.
+
+        :return: DataFrame of record rows of the source outputs.
+        """
+
+        traced = self.trace(output_index)
+        traced = traced[traced['taint'] == 't']
+        fed_tx = np.unique(self.column('spent_index')[self.column('taint')])  # transactions with taint portions in their inputs
+        return traced[~np.isin(traced['tx_index'].values, fed_tx)].drop(columns='trace_depth').drop_duplicates()
@@ -0,0 +1,244 @@
+import json
+import logging
+import os.path
+
+import numpy as np
+import pandas as pd
+
+from utility import utility_function
+from utility import partition
+
+logging.getLogger().setLevel(logging.INFO)
+pd.options.mode.chained_assignment = None  # default='warn'
+
+read_option = utility_function.read_option
+find_file = utility_function.find_file
+index_folder = utility_function.index_folder
+
+time_index_column = ['block_index', 'block_time', 'block_first_tx', 'block_last_tx']  # saved as index/<column>.npy
+time_source_filename = 'time_index_source.json'  # size and modified time of the files the index was built from
+
+
+def time_index_source(path):
+    """
+    Size and modified time of the files the block time index is built from: the block file and the tx_height file of every partition, with their part files.
+
+    :param path: String of folder path of the dataset e.g., 'sampledata/'.
+
+    :return: Dictionary of file path (relative to the dataset folder) to [size, modified time in ns].
+    """
+
+    file_name = find_file('block.csv', path)
+    file_list = [file_name] + utility_function.part_file_list(file_name, path)
+    for this_partition in partition.find_partition(path):
+        folder = os.path.join(path, this_partition)
+        file_name = find_file('tx_height.csv', folder)
+        file_list += [this_partition + this_file for this_file in [file_name] + utility_function.part_file_list(file_name, folder)]
+    source = {}
+    for file_name in file_list:
+        file_path = os.path.join(path, file_name)
+        if os.path.isfile(file_path):
+            stat = os.stat(file_path)
+            source[file_name] = [int(stat.st_size), int(stat.st_mtime_ns)]
+    return source
+
+
+def save_time_index(path, array_dict):
+    """
+    Save the block time index arrays and the state of their source files into the index folder of the dataset.
+
+    :param path: String of folder path of the dataset e.g., 'sampledata/'.
+    :param array_dict: Dictionary of time_index_column name to array.
+
+    :return: True if saved, False if the dataset folder can not be written (the index is only kept in memory).
+    """
+
+    save_path = os.path.join(path, index_folder)
+    try:
+        if not os.path.isdir(save_path):
+            os.makedirs(save_path)
+        for column in time_index_column:
+            np.save(os.path.join(save_path, column + '.npy'), array_dict[column])
+        with open(os.path.join(save_path, time_source_filename), 'w') as f:  # written last, an index without it is rebuilt
+            json.dump(time_index_source(path), f)
+    except OSError as error:
+        logging.warning('Block time index not saved (' + str(error) + '), it is kept in memory only')
+        return False
+    return True
+
+
+def build_time_index(path, save=True):
+    """
+    Build the sorted block time to tx index lookup from the block file and the tx_height file of every partition.
+
+    :param path: String of folder path of the dataset e.g., 'sampledata/'.
+    :param save: Save the index into the index folder of the dataset so it is built only once, a dataset folder that can not be written keeps it in memory.
+
+    :return: TimeIndex object.
+    """
+
+    block = read_option(find_file('block.csv', path), path, columns=['time'])
+    block['time'] = pd.to_datetime(block['time'])
+    height_list = []
+    for this_partition in partition.find_partition(path):
+        folder = os.path.join(path, this_partition)
+        file_name = find_file('tx_height.csv', folder)
+        if os.path.isfile(os.path.join(folder, file_name)):
+            height_list.append(read_option(file_name, folder, columns=['block_index']))
+    tx_height = pd.concat(height_list).reset_index()
+    tx_height = tx_height.groupby('block_index')['tx_index'].agg(['min', 'max'])
+    tx_height = tx_height[tx_height.index.isin(block.index)].sort_index()  # blocks without tx data can not be searched
+
+    array_dict = {'block_index': tx_height.index.values.astype('int64'),
+                  'block_time': block.loc[tx_height.index, 'time'].values.astype('datetime64[ns]').astype('int64'),
+                  'block_first_tx': tx_height['min'].values.astype('int64'),
+                  'block_last_tx': tx_height['max'].values.astype('int64')}
+    if save:
+        save_time_index(path, array_dict)
+    return TimeIndex(array_dict)
+
+
+def append_time_index(path, tx_height, block):
+    """
+    Add new blocks to the saved block time index of the dataset.
+
+    :param path: String of folder path of the dataset e.g., 'sampledata/'.
+    :param tx_height: tx_height dataframe of the new transactions.
+    :param block: Block dataframe with the time of the new blocks.
+
+    :return: TimeIndex object.
+    """
+
+    array_dict = {column: np.load(os.path.join(path, index_folder, column + '.npy')) for column in time_index_column}
+    tx_height = tx_height.reset_index().groupby('block_index')['tx_index'].agg(['min', 'max'])
+    tx_height = tx_height[tx_height.index.isin(block.index) & (tx_height.index > array_dict['block_index'][-1])].sort_index()
+    new_dict = {'block_index': tx_height.index.values.astype('int64'),
+                'block_time': pd.to_datetime(block.loc[tx_height.index, 'time']).values.astype('datetime64[ns]').astype('int64'),
+                'block_first_tx': tx_height['min'].values.astype('int64'),
+                'block_last_tx': tx_height['max'].values.astype('int64')}
+    for column in time_index_column:
+        array_dict[column] = np.concatenate([array_dict[column], new_dict[column]])
+    save_time_index(path, array_dict)
+    return TimeIndex(array_dict)
+
+
+def has_time_index(path):
+    """Check if the dataset in path has the block time index"""
+    return os.path.isfile(os.path.join(path, index_folder, time_index_column[-1] + '.npy'))
+
+
+def check_time_index(path):
+    """
+    Check if the saved block time index still matches the block file and the tx_height files (size and modified time),
+    an index saved without the state of its source files does not match.
+
+    :param path: String of folder path of the dataset e.g., 'sampledata/'.
+
+    :return: True if the saved index is up to date.
+    """
+
+    source_file = os.path.join(path, index_folder, time_source_filename)
+    if not has_time_index(path) or not os.path.isfile(source_file):
+        return False
+    with open(source_file) as f:
+        return json.load(f) == time_index_source(path)
+
+
+def load_time_index(path):
+    """
+    Open the block time index saved in the dataset folder.
+
+    :param path: String of folder path of the dataset e.g., 'sampledata/'.
+
+    :return: TimeIndex object.
+    """
+
+    return TimeIndex({column: np.load(os.path.join(path, index_folder, column + '.npy'), mmap_mode='r') for column in time_index_column})
+
+
+class TimeIndex(object):
+    def __init__(self, array_dict):
+        """
+        Block time lookup turning time window queries into binary searches.
+        Block time is not strictly increasing in the blockchain, searches use the running maximum of the block time so every window is a continuous block range.
+
+        :param array_dict: Dictionary of time_index_column name to array, one item per block ordered by block_index.
+        """
+
+        self.block_index = array_dict['block_index']
+        self.block_time = array_dict['block_time']
+        self.first_tx = array_dict['block_first_tx']
+        self.last_tx = array_dict['block_last_tx']
+        self.search_time = np.maximum.accumulate(self.block_time) if len(self.block_time) > 0 else self.block_time
+
+    def tx_time(self, tx_list):
+        """
+        Find block time of transactions.
+
+        :param tx_list: List of tx index.
+
+        :return: Array of datetime64 block time (NaT for transaction outside the index).
+        """
+
+        tx_list = np.asarray(tx_list, dtype='int64')
+        position = np.searchsorted(self.first_tx, tx_list, side='right') - 1
+        found = (position >= 0) & (tx_list <= np.asarray(self.last_tx)[position.clip(0)])
+        time_list = np.asarray(self.block_time)[position.clip(0)].astype('datetime64[ns]')
+        time_list[~found] = np.datetime64('NaT')
+        return time_list
+
+    def block_last_tx(self, tx_list):
+        """
+        Find the last transaction of the blocks of transactions.
+
+        :param tx_list: List of tx index.
+
+        :return: Array of the last tx index of each block (-1 for transaction outside the index).
+        """
+
+        tx_list = np.asarray(tx_list, dtype='int64')
+        position = np.searchsorted(self.first_tx, tx_list, side='right') - 1
+        last_tx = np.asarray(self.last_tx)[position.clip(0)].astype('int64')
+        last_tx[(position < 0) | (tx_list > last_tx)] = -1
+        return last_tx
+
+    def time_range_tx(self, start_time, end_time, whole_day=False):
+        """
+        Find the transactions of the blocks with start_time <= block time <= end_time.
+
+        :param start_time: Window start, anything pd.Timestamp accepts.
+        :param end_time: Window end, anything pd.Timestamp accepts.
+        :param whole_day: Extend the window to the start of the start_time date and the end of the end_time date.
+
+        :return: List [first tx index, last tx index], None if no block is in the window.
+        """
+
+        start_time = pd.Timestamp(start_time)
+        end_time = pd.Timestamp(end_time)
+        if whole_day:
+            start_time = start_time.normalize()
+            end_time = end_time.normalize() + pd.Timedelta(days=1) - pd.Timedelta(1, 'ns')
+        start = np.searchsorted(self.search_time, start_time.value, side='left')
+        end = np.searchsorted(self.search_time, end_time.value, side='right') - 1
+        if end < start:
+            return None
+        return [int(self.first_tx[start]), int(self.last_tx[end])]
+
+    def day_range_tx(self, day):
+        """
+        Find the transactions of the blocks in the same date as day.
+
+        :param day: Any time in the day, anything pd.Timestamp accepts.
+
+        :return: List [first tx index, last tx index], None if no block is in the day.
+        """
+
+        return self.time_range_tx(day, day, whole_day=True)
+
+    def first_time(self):
+        """Earliest block time in the index"""
+        return np.datetime64(int(self.search_time[0]), 'ns')
+
+    def last_time(self):
+        """Latest block time in the index"""
+        return np.datetime64(int(self.search_time[-1]), 'ns')
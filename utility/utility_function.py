@@ -1,36 +1,268 @@
 import logging
 import os.path
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
 
 logging.getLogger().setLevel(logging.INFO)
 pd.options.mode.chained_assignment = None  # default='warn'
 
+index_folder = 'index/'  # dataset folder for prebuilt lookup files
+csv_chunk_size = 1000000  # rows per chunk for csv reads limited to a tx range
+part_tag = '.part_'  # rows appended to a columnar file go to part files next to it e.g., tx_output.part_1.parquet
+spent_patch_prefix = 'spent_patch_'  # index/spent_patch_<partition>.npz, spent_index of outputs spent after their partition was written
+
 
-def read_option(file_name, path='', csv_index=None):
+def read_option(file_name, path='', csv_index=None, columns=None, tx_range=None):
     """
-    Read dataframe file depending on the file extension
+    Read dataframe file depending on the file extension, with the rows of its part files (part_file_list) and the spent_index patch of tx_output.
     :param file_name: Filename with file extension e.g., df.csv.
     :param path: Path string to file's folder.
     :param csv_index: Optional assigned index column for csv read.
+    :param columns: Optional list of columns to read (the index is always read), only columnar formats skip the other columns on disk.
+    :param tx_range: Optional list [first tx index, last tx index] to keep only the rows within (by the tx_index column or index), parquet files skip the row groups outside the range and csv files stop reading after the range.
 
     :return: Dataframe read from the file.
     """
 
+    part_list = part_file_list(file_name, path)
+    if len(part_list) > 0:
+        df = pd.concat([read_file(this_file, path, csv_index, columns, tx_range) for this_file in [file_name] + part_list])
+    else:
+        df = read_file(file_name, path, csv_index, columns, tx_range)
+    if os.path.basename(file_name).startswith('tx_output'):
+        df = apply_spent_patch(df, path)
+    return df
+
+
+def read_file(file_name, path='', csv_index=None, columns=None, tx_range=None):
+    """Read one dataframe file depending on the file extension, see read_option for the parameters"""
+
     df = pd.DataFrame()
     if file_name[-3:] == '.h5':
         df = pd.read_hdf(os.path.join(path, file_name))
     elif file_name[-4:] == '.pkl':
         df = pd.read_pickle(os.path.join(path, file_name))
+    elif file_name[-8:] == '.parquet':
+        tx_filter = None
+        if tx_range is not None:
+            tx_filter = [('tx_index', '>=', tx_range[0]), ('tx_index', '<=', tx_range[1])]
+        df = pd.read_parquet(os.path.join(path, file_name), columns=columns, filters=tx_filter)
+    elif file_name[-8:] == '.feather':
+        import pyarrow
+
+        with pyarrow.memory_map(os.path.join(path, file_name)) as source:
+            index_name = pyarrow.ipc.open_file(source).schema.names[0]  # index is stored as the first column
+        if columns is not None:
+            columns = [index_name] + [column for column in columns if column != index_name]
+        df = pd.read_feather(os.path.join(path, file_name), columns=columns).set_index(index_name)
     elif file_name[-4:] == '.csv':
-        if csv_index is not None:
-            df = pd.read_csv(os.path.join(path, file_name), index_col=csv_index)
+        if csv_index is None:
+            csv_index = 0
+        if tx_range is not None:  # files are in tx index order, read by chunk until the range is passed
+            df_list = []
+            for chunk in pd.read_csv(os.path.join(path, file_name), index_col=csv_index, chunksize=csv_chunk_size):
+                chunk_tx = chunk['tx_index'] if 'tx_index' in chunk.columns else chunk.index.to_series()
+                if chunk_tx.min() > tx_range[1]:
+                    break
+                df_list.append(chunk[((chunk_tx >= tx_range[0]) & (chunk_tx <= tx_range[1])).values])
+            if len(df_list) > 0:
+                df = pd.concat(df_list)
         else:
-            df = pd.read_csv(os.path.join(path, file_name), index_col=0)
+            df = pd.read_csv(os.path.join(path, file_name), index_col=csv_index)
         if 'time' in df.columns:
             df['time'] = pd.to_datetime(df['time'])
+    if tx_range is not None and len(df) > 0:
+        tx_index = df['tx_index'] if 'tx_index' in df.columns else df.index.to_series()
+        df = df[((tx_index >= tx_range[0]) & (tx_index <= tx_range[1])).values]
+    if columns is not None:
+        df = df[[column for column in columns if column in df.columns]]
+    return df
+
+
+def write_option(df, file_name, path=''):
+    """
+    Write dataframe file depending on the file extension, the index is always kept.
+    :param df: Dataframe to write.
+    :param file_name: Filename with file extension e.g., df.parquet.
+    :param path: Path string to file's folder.
+    """
+
+    if file_name[-3:] == '.h5':
+        df.to_hdf(os.path.join(path, file_name), key='df')
+    elif file_name[-4:] == '.pkl':
+        df.to_pickle(os.path.join(path, file_name))
+    elif file_name[-8:] == '.parquet':
+        df.to_parquet(os.path.join(path, file_name), index=True)
+    elif file_name[-8:] == '.feather':
+        df.reset_index().to_feather(os.path.join(path, file_name))
+    elif file_name[-4:] == '.csv':
+        df.to_csv(os.path.join(path, file_name))
+
+
+def find_file(file_name, path='', extension_list=('.parquet', '.feather')):
+    """
+    Find the stored version of a data file, converted columnar files take priority over the original file.
+    :param file_name: Filename with the original file extension e.g., tx_output.csv.
+    :param path: Path string to file's folder.
+    :param extension_list: File extensions to look for before falling back to file_name.
+
+    :return: Filename with the extension of the file found.
+    """
+
+    stem = os.path.splitext(file_name)[0]
+    for extension in extension_list:
+        if os.path.isfile(os.path.join(path, stem + extension)):
+            return stem + extension
+    return file_name
+
+
+def part_file_list(file_name, path=''):
+    """
+    Find the part files of a parquet or feather data file, written by utility.ingest.append_file for rows added after the file.
+    :param file_name: Filename with file extension e.g., tx_output.parquet.
+    :param path: Path string to file's folder.
+
+    :return: List of part filenames in part order e.g., ['tx_output.part_1.parquet'], empty list for other formats.
+    """
+
+    stem, extension = os.path.splitext(file_name)
+    folder = os.path.join(path, os.path.dirname(file_name)) or '.'
+    if extension not in ('.parquet', '.feather') or not os.path.isdir(folder):
+        return []
+    part_list = []
+    for this_file in os.listdir(folder):
+        this_stem, this_extension = os.path.splitext(this_file)
+        number = this_stem[len(os.path.basename(stem) + part_tag):]
+        if this_extension == extension and this_stem.startswith(os.path.basename(stem) + part_tag) and number.isdigit():
+            part_list.append((int(number), os.path.join(os.path.dirname(file_name), this_file)))
+    return [this_file for _, this_file in sorted(part_list)]
+
+
+def spent_patch_file(path, this_partition):
+    """spent_index patch file of a partition e.g., 'sampledata/index/spent_patch_2009_01.npz' for the partition '2009/01/' of 'sampledata/'"""
+    return os.path.join(path, index_folder, spent_patch_prefix + this_partition.strip('/').replace('/', '_') + '.npz')
+
+
+def find_spent_patch(path):
+    """
+    Find the spent_index patch of the partition folder in path, the patch is in the index folder of the dataset (one level up for a year folder, two for a month folder).
+    :param path: Path string to the partition folder e.g., 'sampledata/2009/'.
+
+    :return: Path of the patch file, None if the partition has none.
+    """
+
+    folder = os.path.normpath(path)
+    this_partition = os.path.basename(folder)
+    for _ in range(2):
+        folder = os.path.dirname(folder)
+        file_path = spent_patch_file(folder, this_partition)
+        if os.path.isfile(file_path):
+            return file_path
+        this_partition = os.path.basename(folder) + '/' + this_partition
+    return None
+
+
+def load_spent_patch(path):
+    """
+    Read the spent_index patch of a partition, written by utility.ingest.append_blocks for outputs spent by later blocks.
+    :param path: Path string to the partition folder e.g., 'sampledata/2009/'.
+
+    :return: Series of spending tx_index with output_index as index, None if the partition has no patch.
+    """
+
+    file_path = find_spent_patch(path)
+    if file_path is None:
+        return None
+    with np.load(file_path) as data:
+        return pd.Series(data['spent_index'], index=pd.Index(data['output_index'], name='output_index'), name='spent_index')
+
+
+def apply_spent_patch(df, path):
+    """
+    Set spent_index of the tx_output rows found in the spent_index patch of the partition, the data file itself is never rewritten.
+    :param df: Dataframe of tx_output read from the partition.
+    :param path: Path string to the partition folder.
+
+    :return: Dataframe with the patched spent_index.
+    """
+
+    if 'spent_index' not in df.columns or len(df) == 0:
+        return df
+    spent = load_spent_patch(path)
+    if spent is None:
+        return df
+    found = df.index.isin(spent.index)
+    if found.any():
+        df.loc[found, 'spent_index'] = spent.reindex(df.index[found]).values
     return df
 
 
+def read_job(job):
+    """
+    Read one data file of read_many, job is a dictionary of read_option parameters (file_name, path, columns, tx_range)
+    with optional 'isin' (column name, values) to keep only the rows where the column (or the index of that name) is in values
+    and optional 'schema' (table name, schema name) to cast the dataframe with utility.columnar.apply_schema.
+    """
+
+    isin = job.pop('isin', None)
+    schema = job.pop('schema', None)
+    df = read_option(**job)
+    if isin is not None and len(df) > 0:
+        values = df[isin[0]] if isin[0] in df.columns else df.index.to_series()
+        df = df[values.isin(isin[1]).values]
+    if schema is not None and len(df.columns) > 0:
+        from utility import columnar
+
+        df = columnar.apply_schema(df, schema[0], schema[1])
+    return df
+
+
+def read_many(job_list, workers=1, pool_type='thread'):
+    """
+    Read several data files (e.g., the partitions of a dataset) concurrently and concatenate them once in job order.
+    The result is the same as reading the files one after another.
+
+    :param job_list: List of dictionaries of read_job parameters.
+    :param workers: Number of files read at the same time, 1 to read sequentially.
+    :param pool_type: 'thread' (parquet and feather reads release the GIL) or 'process' (csv parsing on several cores).
+
+    :return: Concatenated dataframe, empty dataframe for an empty job list.
+    """
+
+    job_list = [dict(job) for job in job_list]
+    if workers <= 1 or len(job_list) <= 1:
+        df_list = [read_job(job) for job in job_list]
+    else:
+        if pool_type == 'thread':
+            executor = ThreadPoolExecutor
+        elif pool_type == 'process':
+            executor = ProcessPoolExecutor
+        else:
+            raise Exception('Unknown pool_type: use "thread" or "process"')
+        with executor(max_workers=min(workers, len(job_list))) as pool:
+            df_list = list(pool.map(read_job, job_list))  # map keeps the job order
+    df_list = [df for df in df_list if len(df.columns) > 0]
+    if len(df_list) == 0:
+        return pd.DataFrame()
+    return pd.concat(df_list)
+
+
+def adr_type(df):
+    """
+    Address type of each row of tx_input or tx_output, the adr_type column of the compact schema or the last digit of adr_index.
+
+    :param df: Dataframe with adr_index column.
+
+    :return: Series of address type.
+    """
+
+    if 'adr_type' in df.columns:
+        return df['adr_type']
+    return df['adr_index'] % 10
+
+
 def get_inout(tx_df, search_df, search_with):
     """Search input or output from database using the addresses or tx_index
 